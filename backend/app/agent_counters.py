@@ -0,0 +1,241 @@
+﻿import os
+import sys
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import Agent, AgentCounter
+
+# ---- Agent counters ---------------------------------------------------------------------
+# agent_counters holds the totals behind metrics.stats and admin.summary, so neither scans
+# agents: agents_total, agents_published and owners (distinct owner_id). They move in the
+# same transaction as the change, like bot_reviews.review_counts: on_created() from
+# builder.create_bot and adopt, on_publish() from publish_toggle. Agents that are written
+# another way (imports, seed scripts, manual SQL) are picked up by reconcile(). The
+# reconciler runs it every COUNTERS_RECONCILE_S (and at boot when the table is empty), and
+# you can run it by hand with: python -m app.agent_counters reconcile
+# Writers lock the counter rows they touch in name order (SELECT ... FOR UPDATE; SQLite already
+# serialises writers), which orders reconcile against concurrent bumps and makes an owner's
+# "first agent" check safe when two of their agents are created at once.
+# Reads go through a per-process cache that expires after COUNTERS_TTL_S and is dropped
+# after any commit that bumped a counter, so many dashboard tabs cost one 3-row read per TTL.
+
+COUNTERS = ("agents_total", "agents_published", "owners")
+COUNTERS_TTL_S = float(os.getenv("COUNTERS_TTL_S", "2"))
+COUNTERS_RECONCILE_S = float(os.getenv("COUNTERS_RECONCILE_S", "600"))   # 0 = never in-process
+
+log = logging.getLogger("app.counters")
+
+
+def bump(db: Session, name: str, delta: int) -> None:
+    if not delta:
+        return
+    now = int(time.time())
+    res = db.execute(update(AgentCounter).where(AgentCounter.name == name)
+                     .values(n=AgentCounter.n + delta, updated_at=now))
+    if res.rowcount == 0:
+        db.add(AgentCounter(name=name, n=delta, updated_at=now))
+        db.flush()
+    db.info["agent_counters_dirty"] = True
+
+
+def _lock(db: Session, names) -> Dict[str, int]:
+    """Row-lock counters in name order (the same order everywhere, so writers can't deadlock)."""
+    q = select(AgentCounter.name, AgentCounter.n).order_by(AgentCounter.name).with_for_update()
+    if names is not None:
+        q = q.where(AgentCounter.name.in_(sorted(names)))
+    return {name: int(n) for name, n in db.execute(q)}
+
+
+def on_created(db: Session, agent: Agent) -> None:
+    """Count a new (flushed) agent; the caller commits."""
+    deltas = {"agents_total": 1}
+    if agent.published:
+        deltas["agents_published"] = 1
+    if agent.owner_id is not None:
+        # Check under the owners row lock: a concurrent first agent of the same owner commits
+        # before we look, so only one of the two counts the owner
+        _lock(db, [*deltas, "owners"])
+        # owner_id is indexed; an owner's first agent adds an owner (agents aren't deleted or re-owned)
+        other = db.execute(select(Agent.id).where(Agent.owner_id == agent.owner_id, Agent.id != agent.id)
+                           .limit(1)).first()
+        if other is None:
+            deltas["owners"] = 1
+    for name in sorted(deltas):
+        bump(db, name, deltas[name])
+
+
+def on_publish(db: Session, was: bool, now: bool) -> None:
+    if bool(was) != bool(now):
+        bump(db, "agents_published", 1 if now else -1)
+
+
+def read(db: Session) -> Dict[str, int]:
+    out = {c: 0 for c in COUNTERS}
+    out["updated_at"] = 0
+    for name, n, ts in db.execute(select(AgentCounter.name, AgentCounter.n, AgentCounter.updated_at)):
+        if name in out:
+            out[name] = int(n)
+            out["updated_at"] = max(out["updated_at"], int(ts or 0))
+    return out
+
+
+def reconcile(db: Session) -> Dict[str, int]:
+    """Recompute every counter from agents; returns {name: drift corrected}. The caller commits."""
+    # Lock first: bumps in flight commit before the COUNT, later ones wait for this transaction
+    stored = _lock(db, None)
+    total, published, owners = db.execute(select(
+        func.count(Agent.id), func.count(Agent.id).filter(Agent.published == True),
+        func.count(func.distinct(Agent.owner_id)))).one()
+    actual = {"agents_total": int(total or 0), "agents_published": int(published or 0), "owners": int(owners or 0)}
+    now = int(time.time())
+    drift = {}
+    changed = False
+    for name, n in actual.items():
+        if name not in stored:
+            db.add(AgentCounter(name=name, n=n, updated_at=now))
+        elif stored[name] != n:
+            db.execute(update(AgentCounter).where(AgentCounter.name == name)
+                       .values(n=AgentCounter.n + (n - stored[name]), updated_at=now))
+        else:
+            continue
+        changed = True
+        if n != stored.get(name, 0):
+            drift[name] = n - stored.get(name, 0)
+    db.flush()
+    if changed:
+        db.info["agent_counters_dirty"] = True
+    return drift
+
+
+class CounterCache:
+    def __init__(self, ttl_s: float = COUNTERS_TTL_S):
+        self.ttl_s = ttl_s
+        self._value: Optional[Dict[str, int]] = None
+        self._expires = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self) -> Optional[Dict[str, int]]:
+        value = self._value
+        if value is not None and time.monotonic() < self._expires:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def _store(self, value: Dict[str, int]) -> Dict[str, int]:
+        self._value, self._expires = value, time.monotonic() + self.ttl_s
+        return value
+
+    def get(self, db: Session) -> Dict[str, int]:
+        return self._fresh() or self._store(read(db))
+
+    async def aget(self, db) -> Dict[str, int]:
+        # AsyncSession: no connection is checked out on a hit
+        return self._fresh() or self._store(await db.run_sync(read))
+
+    def invalidate(self) -> None:
+        self._value = None
+
+    def stats(self) -> Dict:
+        return {"ttl_s": self.ttl_s, "hits": self.hits, "misses": self.misses, "cached": self._value}
+
+
+counter_cache = CounterCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    if session.info.pop("agent_counters_dirty", False):
+        counter_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop("agent_counters_dirty", None)
+
+
+def reconcile_now() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        drift = reconcile(db)
+        db.commit()
+        return drift
+    finally:
+        db.close()
+
+
+class CounterReconciler:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.last_run_at: Optional[float] = None
+        self.last_drift: Dict[str, int] = {}
+        self.last_error: Optional[str] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="agent-counters-reconcile")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        # Fill the table straight away on a fresh DB; after that only every COUNTERS_RECONCILE_S
+        if await asyncio.to_thread(self._missing):
+            await self.run_once()
+        if COUNTERS_RECONCILE_S <= 0:
+            return
+        while True:
+            await asyncio.sleep(COUNTERS_RECONCILE_S)
+            await self.run_once()
+
+    def _missing(self) -> bool:
+        db = SessionLocal()
+        try:
+            return db.execute(select(func.count()).select_from(AgentCounter)).scalar() < len(COUNTERS)
+        except Exception as e:
+            log.warning("agent_counters not readable: %s", e)
+            return False
+        finally:
+            db.close()
+
+    async def run_once(self) -> None:
+        try:
+            drift = await asyncio.to_thread(reconcile_now)
+        except Exception as e:
+            log.exception("agent counter reconcile failed")
+            self.last_error = str(e)
+            return
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_drift = drift
+        if drift:
+            log.warning("agent counters corrected: %s", drift)
+
+    def stats(self) -> Dict:
+        return {"interval_s": COUNTERS_RECONCILE_S, "runs": self.runs, "last_run_at": self.last_run_at,
+                "last_drift": self.last_drift, "last_error": self.last_error}
+
+
+reconciler = CounterReconciler()
+
+
+if __name__ == "__main__":
+    # python -m app.agent_counters reconcile   recompute from agents, print the drift corrected
+    if (sys.argv[1] if len(sys.argv) > 1 else "") == "reconcile":
+        print(reconcile_now())
+    else:
+        print("usage: python -m app.agent_counters reconcile")
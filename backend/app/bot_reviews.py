@@ -0,0 +1,189 @@
+﻿import os
+import sys
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session
+
+from .models import Agent, BotReview, ReviewCount
+
+# ---- Builder review metadata -------------------------------------------------------
+# One bot_reviews row per agent replaces /data/bots/<id>/meta.json + safety.txt.
+# Callers keep working with the old meta dict shape; load_many() reads any number of
+# bots in one query. Import existing files: python -m app.bot_reviews [DATA_DIR]
+# review_counts holds per-status totals for admin.summary; every status change goes
+# through _set_status()/decide() so the counters move in the same transaction.
+
+REVIEW_STATUSES = ("draft", "submitted", "approved", "rejected")
+
+META_FIELDS = ("review_status", "admin_name", "auto_name_admin", "submitted_at", "reviewed_at",
+               "review_notes", "safety_score", "safety_rating")
+
+DEFAULT_META: Dict[str, Any] = {f: None for f in META_FIELDS}
+DEFAULT_META["review_status"] = "draft"
+
+
+def to_meta(r: Optional[BotReview]) -> Dict[str, Any]:
+    if r is None:
+        return dict(DEFAULT_META)
+    return {f: getattr(r, f) for f in META_FIELDS}
+
+
+def load_meta(db: Session, bot_id: int) -> Dict[str, Any]:
+    return to_meta(db.get(BotReview, bot_id))
+
+
+_META_COLUMNS = [getattr(BotReview, f) for f in META_FIELDS]
+
+def load_many(db: Session, bot_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """{bot_id: meta} for every id in one query (columns only; safety_text isn't loaded)."""
+    ids = list(set(bot_ids))
+    found: Dict[int, Dict[str, Any]] = {}
+    if ids:
+        for r in db.execute(select(BotReview.agent_id, *_META_COLUMNS).where(BotReview.agent_id.in_(ids))):
+            found[r[0]] = dict(zip(META_FIELDS, r[1:]))
+    return {i: found.get(i) or dict(DEFAULT_META) for i in ids}
+
+
+def owner_bots(db: Session, owner_id: int) -> List[Tuple[Any, Dict[str, Any]]]:
+    """[(agent row: id/name/published/tone_profile, meta)] for an owner: one outer-joined query."""
+    q = (select(Agent.id, Agent.name, Agent.published, Agent.tone_profile, *_META_COLUMNS)
+         .outerjoin(BotReview, BotReview.agent_id == Agent.id)
+         .where(Agent.owner_id == owner_id))
+    out = []
+    for r in db.execute(q):
+        meta = dict(zip(META_FIELDS, r[4:]))
+        meta["review_status"] = meta["review_status"] or "draft"
+        out.append((r, meta))
+    return out
+
+
+def _row(db: Session, bot_id: int) -> BotReview:
+    r = db.get(BotReview, bot_id)
+    if r is None:
+        r = BotReview(agent_id=bot_id, review_status="draft", safety_text="")
+        db.add(r)
+        db.flush([r])   # pending rows aren't visible to db.get(); the next write must find this one
+        bump_count(db, "draft", 1)
+    return r
+
+
+def save_meta(db: Session, bot_id: int, meta: Dict[str, Any]) -> None:
+    """Stage the meta fields (unknown keys ignored); the caller commits."""
+    r = _row(db, bot_id)
+    for f in META_FIELDS:
+        if f not in meta:
+            continue
+        if f == "review_status":
+            _set_status(db, r, meta[f] or "draft")
+        else:
+            setattr(r, f, meta[f])
+
+
+def read_safety(db: Session, bot_id: int) -> str:
+    r = db.get(BotReview, bot_id)
+    return (r.safety_text or "") if r is not None else ""
+
+
+def write_safety(db: Session, bot_id: int, text: str) -> None:
+    _row(db, bot_id).safety_text = text or ""
+
+
+# ---- Status counters + moderation ---------------------------------------------------
+def bump_count(db: Session, status: str, delta: int) -> None:
+    if not delta:
+        return
+    res = db.execute(update(ReviewCount).where(ReviewCount.status == status).values(n=ReviewCount.n + delta))
+    if res.rowcount == 0:
+        db.add(ReviewCount(status=status, n=delta))
+        db.flush()
+
+
+def _set_status(db: Session, r: BotReview, status: str) -> None:
+    if r.review_status != status:
+        bump_count(db, r.review_status, -1)
+        bump_count(db, status, 1)
+        r.review_status = status
+
+
+def review_counts(db: Session) -> Dict[str, int]:
+    counts = {s: 0 for s in REVIEW_STATUSES}
+    counts.update({s: int(n) for s, n in db.execute(select(ReviewCount.status, ReviewCount.n))})
+    return counts
+
+
+def reconcile_counts(db: Session) -> Dict[str, int]:
+    """Recompute review_counts from bot_reviews (after imports or manual edits); the caller commits."""
+    db.execute(delete(ReviewCount))
+    rows = db.execute(select(BotReview.review_status, func.count()).group_by(BotReview.review_status)).all()
+    db.add_all([ReviewCount(status=s, n=int(n)) for s, n in rows])
+    db.flush()
+    return review_counts(db)
+
+
+def decide(db: Session, bot_ids: Iterable[int], status: str, notes: Optional[str], now: int) -> List[int]:
+    """Move submitted bots to approved/rejected (others are left alone); returns the ids changed."""
+    ids = list(set(bot_ids))
+    if not ids:
+        return []
+    rows = db.execute(select(BotReview)
+                      .where(BotReview.agent_id.in_(ids), BotReview.review_status == "submitted")
+                      .with_for_update()).scalars().all()
+    for r in rows:
+        r.review_status = status
+        r.reviewed_at = now
+        if notes is not None:
+            r.review_notes = notes
+    bump_count(db, "submitted", -len(rows))
+    bump_count(db, status, len(rows))
+    return [r.agent_id for r in rows]
+
+
+# ---- One-off import of the old per-bot files --------------------------------------
+def import_files(db: Session, data_dir: str) -> Dict[str, int]:
+    """Load <data_dir>/bots/<id>/{meta.json,safety.txt} into bot_reviews (existing rows are overwritten)."""
+    root = os.path.join(data_dir, "bots")
+    stats = {"imported": 0, "skipped_no_agent": 0, "bad_meta": 0}
+    if not os.path.isdir(root):
+        return stats
+    ids = sorted(int(d) for d in os.listdir(root) if d.isdigit())
+    known = set(db.execute(select(Agent.id).where(Agent.id.in_(ids))).scalars().all()) if ids else set()
+    for bot_id in ids:
+        if bot_id not in known:
+            stats["skipped_no_agent"] += 1
+            continue
+        meta: Dict[str, Any] = {}
+        try:
+            with open(os.path.join(root, str(bot_id), "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            stats["bad_meta"] += 1
+        text = ""
+        try:
+            with open(os.path.join(root, str(bot_id), "safety.txt"), "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            pass
+        meta = meta if isinstance(meta, dict) else {}
+        if meta.get("review_status") not in (None, "draft") and not meta.get("submitted_at"):
+            meta["submitted_at"] = 0   # keep the (review_status, submitted_at) queue key non-NULL
+        save_meta(db, bot_id, meta)
+        write_safety(db, bot_id, text)
+        stats["imported"] += 1
+        if stats["imported"] % 1000 == 0:
+            db.commit()
+    reconcile_counts(db)
+    db.commit()
+    return stats
+
+
+if __name__ == "__main__":
+    from .db import SessionLocal
+    _db = SessionLocal()
+    try:
+        print(import_files(_db, sys.argv[1] if len(sys.argv) > 1 else os.environ.get("APP_DATA_DIR", "/data")))
+    finally:
+        _db.close()
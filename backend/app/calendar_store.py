@@ -0,0 +1,165 @@
+﻿import logging
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple, TypeVar
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .models import Calendar, CalendarBooking
+
+# ---- Calendar engine -------------------------------------------------------------------
+# Bookings live in calendar_bookings (epoch minutes, UTC). Each worker keeps a per-calendar
+# IntervalIndex: parallel sorted start/end lists (bookings never overlap, so both stay sorted)
+# synced incrementally from the DB by id (see SYNC_ID_LAG) before every read, so workers see each
+# other's bookings. Conflict checks are O(log n) via bisect; a day's free slots are one walk
+# over the slot grid with a pointer into the bookings.
+
+MAX_AVAILABILITY_DAYS = 62
+# Concurrent inserts can commit out of id order; each sync re-reads this many ids below the
+# high-water mark (skipping ones already indexed) so a late commit isn't missed.
+SYNC_ID_LAG = 64
+
+T = TypeVar("T")
+
+log = logging.getLogger("app.calendar_store")
+
+
+def get_tz(tz_name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(tz_name)
+    except ZoneInfoNotFoundError:
+        # Fallback for containers without IANA db
+        return ZoneInfo("UTC")
+
+
+def to_minutes(ts: datetime) -> int:
+    return int(ts.timestamp()) // 60
+
+
+def from_minutes(m: int, tz: ZoneInfo) -> datetime:
+    return datetime.fromtimestamp(m * 60, tz=timezone.utc).astimezone(tz)
+
+
+class IntervalIndex:
+    __slots__ = ("starts", "ends", "last_id", "seen", "lock")
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.last_id = 0
+        self.seen: Set[int] = set()
+        self.lock = threading.Lock()
+
+    def add(self, start: int, end: int) -> None:
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+    def conflicts(self, start: int, end: int) -> bool:
+        # First booking ending after `start` is the only one that can overlap [start, end)
+        i = bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] < end
+
+    def free_slots(self, first: int, last: int, step: int) -> List[int]:
+        """Slot starts s in [first, last - step] (every `step` minutes) with [s, s+step) free."""
+        out = []
+        i = bisect_right(self.ends, first)
+        n = len(self.starts)
+        s = first
+        while s + step <= last:
+            while i < n and self.ends[i] <= s:
+                i += 1
+            if i < n and self.starts[i] < s + step:
+                # jump to the first grid point at/after this booking's end
+                s += max(1, -(-(self.ends[i] - s) // step)) * step
+                continue
+            out.append(s)
+            s += step
+        return out
+
+
+class CalendarStore:
+    def __init__(self):
+        self._indexes: Dict[str, IntervalIndex] = {}
+        self._lock = threading.Lock()
+
+    def _index(self, cal_id: str) -> IntervalIndex:
+        with self._lock:
+            idx = self._indexes.get(cal_id)
+            if idx is None:
+                idx = self._indexes[cal_id] = IntervalIndex()
+            return idx
+
+    def read(self, db: Session, cal_id: str, fn: Callable[[IntervalIndex], T]) -> T:
+        """fn(index) under the calendar's lock, after pulling bookings other workers added since the last sync."""
+        idx = self._index(cal_id)
+        with idx.lock:
+            rows = db.execute(
+                select(CalendarBooking.id, CalendarBooking.start_min, CalendarBooking.end_min)
+                .where(CalendarBooking.calendar_id == cal_id, CalendarBooking.id > idx.last_id - SYNC_ID_LAG)
+            ).all()
+            for bid, s, e in rows:
+                if bid not in idx.seen:
+                    idx.seen.add(bid)
+                    idx.add(s, e)
+                    idx.last_id = max(idx.last_id, bid)
+            return fn(idx)
+
+    def forget(self, cal_id: str) -> None:
+        with self._lock:
+            self._indexes.pop(cal_id, None)
+
+
+calendar_store = CalendarStore()
+
+
+# ---- Double-booking guard --------------------------------------------------------
+# The index check in routes.calendar.book is only a fast path; the database has the final
+# word. Postgres: uq_calendar_bookings_slot + the overlap exclusion constraint from
+# step32_booking_guard.sql. SQLite (single writer at a time): the unique index + this trigger.
+_SQLITE_GUARD_DDL = """CREATE TRIGGER IF NOT EXISTS calendar_bookings_no_overlap
+    BEFORE INSERT ON calendar_bookings
+    WHEN EXISTS (SELECT 1 FROM calendar_bookings
+                  WHERE calendar_id = NEW.calendar_id AND start_min < NEW.end_min AND end_min > NEW.start_min)
+    BEGIN SELECT RAISE(ABORT, 'calendar booking overlaps an existing booking'); END"""
+
+
+def ensure_sqlite_booking_guard(engine: Engine) -> bool:
+    if engine.dialect.name != "sqlite":
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(_SQLITE_GUARD_DDL))
+        return True
+    except Exception as e:
+        log.warning("calendar overlap trigger not installed (unique slot index still applies): %s", e)
+        return False
+
+
+# ---- Slot grid --------------------------------------------------------------------
+def work_window(cal: Calendar, d: date) -> Tuple[int, int]:
+    tz = get_tz(cal.timezone)
+    start = datetime(d.year, d.month, d.day, cal.work_start_hour, 0, tzinfo=tz)
+    end = datetime(d.year, d.month, d.day, cal.work_end_hour, 0, tzinfo=tz)
+    return to_minutes(start), to_minutes(end)
+
+
+def day_slots(idx: IntervalIndex, cal: Calendar, d: date, tz: Optional[ZoneInfo] = None) -> List[dict]:
+    tz = tz or get_tz(cal.timezone)
+    first, last = work_window(cal, d)
+    step = cal.slot_minutes
+    return [{"start": from_minutes(s, tz).isoformat(), "end": from_minutes(s + step, tz).isoformat()}
+            for s in idx.free_slots(first, last, step)]
+
+
+def availability(idx: IntervalIndex, cal: Calendar, start: date, days: int) -> List[dict]:
+    tz = get_tz(cal.timezone)
+    out = []
+    for k in range(days):
+        d = start + timedelta(days=k)
+        out.append({"date": d.isoformat(), "slots": day_slots(idx, cal, d, tz)})
+    return out
@@ -0,0 +1,126 @@
+﻿import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .models import Agent
+
+# ---- AgentCard projections ------------------------------------------------------------
+# Store/owner listings select only the card columns (never the spec JSON), turn each row
+# into the AgentCard shape (schemas.AgentCard) and keep the serialized bytes per agent.
+# Whole anonymous store pages are kept too, tagged with the catalogue version; any card
+# change (builder.save_bot, publish.publish_toggle, safety.run_check) calls invalidate(),
+# which bumps the version and drops that agent's bytes. The TTL bounds staleness across
+# worker processes, which don't share the version counter.
+
+CARD_CACHE_MAX_ENTRIES = int(os.getenv("CARD_CACHE_MAX_ENTRIES", "50000"))
+CARD_PAGE_CACHE_MAX = int(os.getenv("CARD_PAGE_CACHE_MAX", "2048"))
+CARD_PAGE_CACHE_TTL = float(os.getenv("CARD_PAGE_CACHE_TTL", "30"))
+
+# AgentCard fields + created_at (keyset sort key) and updated_at (card bytes stamp); neither is serialized
+CARD_COLUMNS = (
+    Agent.id, Agent.name, Agent.description, Agent.category, Agent.published,
+    Agent.tone_profile, Agent.safety_rating, Agent.safety_score, Agent.lineage_display,
+    Agent.last_safety_check, Agent.usage_cost, Agent.created_at, Agent.updated_at,
+)
+
+
+def card_dict(r: Any) -> Dict[str, Any]:
+    return {
+        "id": r.id,
+        "name": r.name or "",
+        "description": r.description or "",
+        "category": r.category or "",
+        "published": bool(r.published),
+        "tone_profile": r.tone_profile or "",
+        "safety_rating": r.safety_rating or "",
+        "safety_score": float(r.safety_score) if r.safety_score is not None else None,
+        "lineage_display": r.lineage_display or "",
+        "last_safety_check": r.last_safety_check.isoformat() if r.last_safety_check else None,
+        "usage_cost": float(r.usage_cost) if r.usage_cost is not None else None,
+    }
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class CardCache:
+    def __init__(self):
+        self.version = 1
+        self._cards: "OrderedDict[int, Tuple[Any, bytes]]" = OrderedDict()
+        self._pages: "OrderedDict[tuple, Tuple[int, float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.card_hits = 0
+        self.card_misses = 0
+        self.page_hits = 0
+        self.page_misses = 0
+        self.invalidations = 0
+
+    # -- per-card bytes (keyed by id, validated by updated_at) --
+    def card_bytes(self, r: Any) -> bytes:
+        stamp = getattr(r, "updated_at", None)
+        with self._lock:
+            hit = self._cards.get(r.id)
+            if hit is not None and hit[0] == stamp:
+                self._cards.move_to_end(r.id)
+                self.card_hits += 1
+                return hit[1]
+        data = _dumps(card_dict(r))
+        with self._lock:
+            self.card_misses += 1
+            self._cards[r.id] = (stamp, data)
+            while len(self._cards) > CARD_CACHE_MAX_ENTRIES:
+                self._cards.popitem(last=False)
+        return data
+
+    def render(self, rows: Iterable[Any], **meta: Any) -> bytes:
+        """{"items": [...cards], **meta} assembled from cached card bytes."""
+        items = b"[" + b",".join(self.card_bytes(r) for r in rows) + b"]"
+        tail = _dumps(meta)
+        return b'{"items":' + items + (b"," + tail[1:] if meta else b"}")
+
+    # -- whole pages (keyed by request, valid for the current version) --
+    def get_page(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            hit = self._pages.get(key)
+            if hit is not None and hit[0] == self.version and hit[1] > time.monotonic():
+                self._pages.move_to_end(key)
+                self.page_hits += 1
+                return hit[2]
+            if hit is not None:
+                del self._pages[key]
+            self.page_misses += 1
+            return None
+
+    def put_page(self, key: tuple, body: bytes, version: int) -> None:
+        # `version` is read before the query so a concurrent invalidate() makes the page stale
+        with self._lock:
+            self._pages[key] = (version, time.monotonic() + CARD_PAGE_CACHE_TTL, body)
+            while len(self._pages) > CARD_PAGE_CACHE_MAX:
+                self._pages.popitem(last=False)
+
+    def invalidate(self, agent_id: Optional[int] = None) -> None:
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            if agent_id is not None:
+                self._cards.pop(agent_id, None)
+            self._pages.clear()
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "cards": len(self._cards),
+            "pages": len(self._pages),
+            "card_hits": self.card_hits,
+            "card_misses": self.card_misses,
+            "page_hits": self.page_hits,
+            "page_misses": self.page_misses,
+            "invalidations": self.invalidations,
+        }
+
+
+card_cache = CardCache()
@@ -1,14 +1,52 @@
 ﻿import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
 # DATABASE_URL example: postgresql+psycopg://ai_factory:ai_factory@db:5432/ai_factory
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg://ai_factory:ai_factory@db:5432/ai_factory")
+# Async engine URL; derived from DATABASE_URL when unset (psycopg 3 is async-capable, SQLite uses aiosqlite)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "").strip()
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+# Pool tuning (ignored for SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))     # seconds
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))     # seconds to wait for a checkout
+
+def _engine_kwargs(url: str) -> dict:
+    kw = {"pool_pre_ping": True}
+    if make_url(url).get_backend_name() != "sqlite":
+        kw.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                  pool_recycle=DB_POOL_RECYCLE, pool_timeout=DB_POOL_TIMEOUT)
+    return kw
+
+def async_url_for(url: str) -> str:
+    u = make_url(url)
+    backend = u.get_backend_name()
+    if backend == "sqlite":
+        return str(u.set(drivername="sqlite+aiosqlite"))
+    if backend == "postgresql" and u.get_driver_name() != "asyncpg":
+        return str(u.set(drivername="postgresql+psycopg"))
+    return url
+
+engine = create_engine(DATABASE_URL, future=True, **_engine_kwargs(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, class_=Session)
 Base = declarative_base()
 
+def pool_status(eng=None) -> dict:
+    """Pool class and size/checkedout/overflow/checkedin where the pool has them (NullPool/StaticPool don't)."""
+    pool = (eng or engine).pool
+    out = {"class": type(pool).__name__}
+    for name in ("size", "checkedout", "overflow", "checkedin"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            try:
+                out[name] = fn()
+            except Exception:
+                pass
+    return out
+
 # FastAPI dependency
 def get_db():
     db = SessionLocal()
@@ -17,6 +55,36 @@ def get_db():
     finally:
         db.close()
 
+# --- Async engine (created lazily so the sync app still imports without an async driver) ---
+_async_engine = None
+_AsyncSessionLocal = None
+
+def get_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+        url = ASYNC_DATABASE_URL or async_url_for(DATABASE_URL)
+        _async_engine = create_async_engine(url, **_engine_kwargs(url))
+        _AsyncSessionLocal = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False,
+                                                class_=AsyncSession)
+    return _async_engine
+
+def AsyncSessionLocal():
+    get_async_engine()
+    return _AsyncSessionLocal()
+
+# FastAPI dependency (async routes)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _AsyncSessionLocal = None
+
 # --- Minimal auth helpers for dependencies used by routes ---
 from fastapi import Header, HTTPException  # added by fix script
 
@@ -0,0 +1,84 @@
+﻿import os
+import time
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from . import db as app_db
+
+# ---- DB health --------------------------------------------------------------------------
+# /monitor/db pings through the application engine (no engine or pool per request). It keeps
+# round-trip latency percentiles over the last HEALTH_WINDOW pings and reports pool
+# occupancy. A result is served for HEALTH_CACHE_S, and the lock makes concurrent callers
+# wait for a single ping, so load balancers polling from many hosts cost the database at
+# most one SELECT 1 per worker per HEALTH_CACHE_S.
+
+HEALTH_CACHE_S = float(os.getenv("HEALTH_CACHE_S", "1"))
+HEALTH_WINDOW = int(os.getenv("HEALTH_WINDOW", "120"))        # pings kept for percentiles
+
+
+def _pct(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+class DBHealth:
+    def __init__(self, cache_s: float = HEALTH_CACHE_S, window: int = HEALTH_WINDOW):
+        self.cache_s = cache_s
+        self._latency: deque = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+        self._result: Optional[Dict[str, Any]] = None
+        self._expires = 0.0
+        self.pings = 0
+        self.errors = 0
+        self.cache_hits = 0
+
+    def _cached(self) -> Optional[Dict[str, Any]]:
+        r = self._result
+        if r is not None and time.monotonic() < self._expires:
+            self.cache_hits += 1
+            return r
+        return None
+
+    def check(self) -> Dict[str, Any]:
+        r = self._cached()
+        if r is not None:
+            return r
+        with self._lock:
+            r = self._cached()   # refreshed by the caller we waited on
+            if r is not None:
+                return r
+            r = self._ping()
+            self._result, self._expires = r, time.monotonic() + self.cache_s
+            return r
+
+    def _ping(self) -> Dict[str, Any]:
+        self.pings += 1
+        error = None
+        t0 = time.perf_counter()
+        try:
+            with app_db.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception as e:
+            self.errors += 1
+            error = f"{type(e).__name__}: {str(e)[:200]}"
+        ms = 1000 * (time.perf_counter() - t0)
+        if error is None:
+            self._latency.append(ms)
+        return {"db": "ok" if error is None else "error", "dialect": app_db.engine.dialect.name,
+                "latency_ms": round(ms, 3), "window": self.window(), "pool": app_db.pool_status(),
+                "checked_at": round(time.time(), 3), "error": error}
+
+    def window(self) -> Dict[str, Any]:
+        xs = sorted(self._latency)
+        if not xs:
+            return {"n": 0}
+        return {"n": len(xs), "p50_ms": round(_pct(xs, 50), 3), "p90_ms": round(_pct(xs, 90), 3),
+                "p99_ms": round(_pct(xs, 99), 3), "max_ms": round(xs[-1], 3)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cache_s": self.cache_s, "pings": self.pings, "errors": self.errors, "cache_hits": self.cache_hits}
+
+
+db_health = DBHealth()
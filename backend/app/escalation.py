@@ -0,0 +1,211 @@
+﻿import os
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any
+
+from . import brain, checker
+from .llm_adapter import complete
+from .histogram import LogHistogram
+
+# ---- Runtime for the brain.py routing ladder ----------------------------------
+# spec["routing"]["primary"] is tried first, then spec["routing"]["escalation"] in order
+# (capped by spec["limits"]["max_escalations"]). Each reply is scored with
+# checker.quick_escalation_signal; the first one that doesn't need escalation wins.
+# Optional hedging: if a tier hasn't answered within hedge_after_ms, the next tier is
+# fired in parallel and the first acceptable reply is taken (the other call is cancelled).
+
+ROUTING_HEDGE_AFTER_MS = float(os.getenv("ROUTING_HEDGE_AFTER_MS", "0"))   # 0 = no hedging
+
+# Rough $ per 1K tokens (input, output) for cost estimates; unknown models use the tierB price.
+MODEL_PRICES_PER_1K = {
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-5": (0.00125, 0.01),
+}
+_DEFAULT_PRICE = MODEL_PRICES_PER_1K["gpt-4o"]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+def estimate_cost(model: str, messages: List[Dict], reply: str) -> float:
+    pin, pout = MODEL_PRICES_PER_1K.get(model, _DEFAULT_PRICE)
+    tin = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+    return tin / 1000.0 * pin + estimate_tokens(reply) / 1000.0 * pout
+
+
+def ladder_from_spec(spec: Optional[dict]) -> List[str]:
+    spec = spec or {}
+    routing = spec.get("routing") or {}
+    primary = routing.get("primary") or spec.get("primary_model") or brain.DEFAULT_MODELS["tierA"]
+    max_esc = (spec.get("limits") or {}).get("max_escalations", 1)
+    ladder = [primary]
+    for m in routing.get("escalation") or []:
+        if m and m not in ladder and len(ladder) <= max_esc:
+            ladder.append(m)
+    return ladder
+
+def hedge_after_ms(spec: Optional[dict]) -> float:
+    v = ((spec or {}).get("routing") or {}).get("hedge_after_ms")
+    return float(v) if v is not None else ROUTING_HEDGE_AFTER_MS
+
+
+# ---- Per-tier stats -------------------------------------------------------------
+class _TierStats:
+    def __init__(self):
+        self.latency_ms = LogHistogram(min_value=1.0, max_value=600_000.0)
+        self.cost_micro_usd = LogHistogram(min_value=1.0, max_value=10_000_000.0)
+        self.calls = 0
+        self.accepted = 0
+        self.escalated = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.hedges = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls, "accepted": self.accepted, "escalated": self.escalated,
+            "errors": self.errors, "cancelled": self.cancelled, "hedges_fired": self.hedges,
+            "latency_ms": self.latency_ms.snapshot(),
+            "cost_micro_usd": self.cost_micro_usd.snapshot(),
+        }
+
+_stats: Dict[str, _TierStats] = {}
+
+def _tier(model: str) -> _TierStats:
+    st = _stats.get(model)
+    if st is None:
+        st = _stats[model] = _TierStats()
+    return st
+
+def routing_stats() -> dict:
+    return {"hedge_after_ms_default": ROUTING_HEDGE_AFTER_MS, "tiers": {m: s.snapshot() for m, s in _stats.items()}}
+
+
+# ---- Engine -------------------------------------------------------------------------
+@dataclass
+class Attempt:
+    model: str
+    latency_ms: float
+    ok: bool
+    needs_escalation: bool = False
+    confidence: float = 0.0
+    error: Optional[str] = None
+    exc: Optional[BaseException] = field(default=None, repr=False)
+
+@dataclass
+class RoutingResult:
+    answer: str
+    model: str
+    escalations: int
+    attempts: List[Attempt] = field(default_factory=list)
+    cost_usd: float = 0.0
+
+    @property
+    def accepted(self) -> bool:
+        # False when every tier asked to escalate and answer is the highest-confidence fallback
+        return any(a.ok and not a.needs_escalation for a in self.attempts)
+
+
+async def _call_tier(model: str, messages: List[Dict], task_is_hard: bool, max_tokens: int, temperature: float):
+    st = _tier(model)
+    st.calls += 1
+    t0 = time.perf_counter()
+    try:
+        reply = await complete(model=model, messages=messages, max_tokens=max_tokens, temperature=temperature)
+    except asyncio.CancelledError:
+        st.cancelled += 1
+        raise
+    except Exception as e:
+        st.errors += 1
+        ms = 1000 * (time.perf_counter() - t0)
+        st.latency_ms.record(ms)
+        return None, Attempt(model, ms, ok=False, needs_escalation=True, error=str(e), exc=e), 0.0
+    ms = 1000 * (time.perf_counter() - t0)
+    cost = estimate_cost(model, messages, reply)
+    st.latency_ms.record(ms)
+    st.cost_micro_usd.record(cost * 1e6)
+    sig = checker.quick_escalation_signal(reply, task_is_hard)
+    if sig["needs_escalation"]:
+        st.escalated += 1
+    else:
+        st.accepted += 1
+    return reply, Attempt(model, ms, ok=True, needs_escalation=sig["needs_escalation"], confidence=sig["confidence"]), cost
+
+
+async def _hedged(ladder: List[str], i: int, hedge_s: float, call):
+    """
+    Run ladder[i]; if it hasn't finished within hedge_s, also start ladder[i+1].
+    Returns (results, next_index) where results are the finished (reply, attempt, cost) tuples in
+    completion order and stops early on the first acceptable reply (cancelling the other call).
+    """
+    first = asyncio.create_task(call(ladder[i]))
+    pending = {first}
+    results = []
+    # The try covers the initial wait too: if the caller is cancelled there (client disconnect,
+    # request timeout) the upstream call is cancelled with it instead of running on orphaned
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_s)
+        if done:
+            return [first.result()], i + 1
+        _tier(ladder[i]).hedges += 1
+        second = asyncio.create_task(call(ladder[i + 1]))
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                res = t.result()
+                results.append(res)
+                if res[0] is not None and not res[1].needs_escalation:
+                    return results, i + 2
+        return results, i + 2
+    finally:
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def run_ladder(
+    spec: Optional[dict],
+    messages: List[Dict],
+    task_is_hard: bool,
+    max_tokens: int = 400,
+    temperature: float = 0.2,
+) -> RoutingResult:
+    ladder = ladder_from_spec(spec)
+    hedge_s = hedge_after_ms(spec) / 1000.0
+
+    async def call(model: str):
+        return await _call_tier(model, messages, task_is_hard, max_tokens, temperature)
+
+    attempts: List[Attempt] = []
+    cost = 0.0
+    best = None   # (confidence, reply, model) fallback when every tier asks to escalate
+    i = 0
+    while i < len(ladder):
+        if hedge_s > 0 and i + 1 < len(ladder):
+            results, i = await _hedged(ladder, i, hedge_s, call)
+        else:
+            results, i = [await call(ladder[i])], i + 1
+        for reply, att, c in results:
+            attempts.append(att)
+            cost += c
+            if reply is None:
+                continue
+            if not att.needs_escalation:
+                return RoutingResult(reply, att.model, len(attempts) - 1, attempts, cost)
+            if best is None or att.confidence > best[0]:
+                best = (att.confidence, reply, att.model)
+
+    if best is None:
+        # Every tier failed: surface the last real error (e.g. rate_limit.RateLimited) to the caller
+        if attempts and attempts[-1].exc is not None:
+            raise attempts[-1].exc
+        raise RuntimeError("; ".join(f"{a.model}: {a.error}" for a in attempts if a.error) or "no tier answered")
+    return RoutingResult(best[1], best[2], len(attempts) - 1, attempts, cost)
+
+
+def agent_task_is_hard(agent: Dict[str, Any], question: str) -> bool:
+    return brain.is_hard_task(brain.describe_task(agent) + " " + (question or ""))
@@ -0,0 +1,139 @@
+﻿import math
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import Calendar, CalendarBooking
+from .calendar_store import to_minutes, from_minutes, work_window
+from .lazy_import import has_module, lazy
+
+np = lazy("numpy")
+HAS_NUMPY = has_module("numpy")
+
+# ---- Bulk free/busy across calendars -------------------------------------------------
+# One query pulls every booking in the window for all calendars; each calendar becomes a row
+# of a (calendars x cells) boolean grid over epoch minutes, cell = gcd of every slot length,
+# the requested duration/step and 15 (so :30/:45 timezone offsets land on cell edges).
+# free = work hours (each calendar's own timezone) & ~busy; a start cell is usable for a
+# calendar when the next duration/cell cells are all free (prefix sums), then the rows are
+# AND-ed ("all": everyone free) or OR-ed ("any": at least one). Without numpy the same grid
+# is kept as one Python int bitset per calendar.
+
+MAX_FREEBUSY_CALENDARS = 200
+
+
+def window(start: date, days: int, tz: ZoneInfo) -> Tuple[int, int]:
+    """[local midnight of start, local midnight after the last day) in epoch minutes."""
+    first = datetime(start.year, start.month, start.day, tzinfo=tz)
+    end = start + timedelta(days=days)
+    return to_minutes(first), to_minutes(datetime(end.year, end.month, end.day, tzinfo=tz))
+
+
+def quantum(cals: Sequence[Calendar], duration: int, step: int) -> int:
+    return math.gcd(15, duration, step, *(c.slot_minutes for c in cals))
+
+
+def load_busy(db: Session, cal_ids: Sequence[str], ws: int, we: int) -> List[Tuple[str, int, int]]:
+    # Bookings are at most a slot long, so start_min > ws - 1 day keeps the (calendar_id, start_min) index usable
+    return db.execute(
+        select(CalendarBooking.calendar_id, CalendarBooking.start_min, CalendarBooking.end_min)
+        .where(CalendarBooking.calendar_id.in_(list(cal_ids)),
+               CalendarBooking.start_min < we, CalendarBooking.start_min > ws - 1440,
+               CalendarBooking.end_min > ws)
+    ).all()
+
+
+def _intervals(cals: Sequence[Calendar], busy, start: date, days: int, ws: int, we: int, q: int):
+    """(work, busy) as lists of (row, first_cell, end_cell); work shrinks to whole cells, busy grows."""
+    row = {c.id: i for i, c in enumerate(cals)}
+    work, taken = [], []
+    for i, cal in enumerate(cals):
+        for k in range(-1, days + 1):   # neighbouring days reach into the window across timezones
+            s, e = work_window(cal, start + timedelta(days=k))
+            s, e = max(s, ws), min(e, we)
+            if s < e:
+                a, b = -(-(s - ws) // q), (e - ws) // q
+                if a < b:
+                    work.append((i, a, b))
+    for cal_id, s, e in busy:
+        s, e = max(s, ws), min(e, we)
+        if s < e:
+            taken.append((row[cal_id], (s - ws) // q, -(-(e - ws) // q)))
+    return work, taken
+
+
+def _usable_numpy(n: int, cells: int, work, taken, k: int):
+    def mask(spans):
+        diff = np.zeros((n, cells + 1), dtype=np.int32)
+        if spans:
+            r, a, b = (np.asarray(x) for x in zip(*spans))
+            np.add.at(diff, (r, a), 1)
+            np.add.at(diff, (r, b), -1)
+        return np.cumsum(diff[:, :cells], axis=1) > 0
+
+    free = mask(work) & ~mask(taken)
+    # usable[c, i]: cells i..i+k-1 all free for calendar c
+    blocked = np.zeros((n, cells + 1), dtype=np.int32)
+    np.cumsum(~free, axis=1, out=blocked[:, 1:])
+    return (blocked[:, k:] - blocked[:, :-k]) == 0
+
+
+def _usable_bits(n: int, cells: int, work, taken, k: int) -> List[int]:
+    free = [0] * n
+    for r, a, b in work:
+        free[r] |= ((1 << (b - a)) - 1) << a
+    for r, a, b in taken:
+        free[r] &= ~(((1 << (b - a)) - 1) << a)
+    out = []
+    for m in free:
+        u = m
+        for j in range(1, k):
+            u &= m >> j
+        out.append(u & ((1 << (cells - k + 1)) - 1))
+    return out
+
+
+def search(db: Session, cals: Sequence[Calendar], start: date, days: int, tz: ZoneInfo,
+           duration: int, step: int, mode: str = "all", limit: int = 50) -> Tuple[List[dict], bool]:
+    """Slots of `duration` minutes on a `step` grid from local midnight (in `tz`) where every ("all")
+    or at least one ("any") calendar is free; returns (slots, truncated)."""
+    ws, we = window(start, days, tz)
+    q = quantum(cals, duration, step)
+    cells, k, st = (we - ws) // q, duration // q, step // q
+    if k > cells:
+        return [], False
+    work, taken = _intervals(cals, load_busy(db, [c.id for c in cals], ws, we), start, days, ws, we, q)
+    ids = [c.id for c in cals]
+
+    if HAS_NUMPY:
+        usable = _usable_numpy(len(cals), cells, work, taken, k)[:, ::st]
+        hits = usable.all(axis=0) if mode == "all" else usable.any(axis=0)
+        picked = np.flatnonzero(hits)
+        truncated = len(picked) > limit
+        rows = [(int(i) * st, [ids[c] for c in np.flatnonzero(usable[:, i])] if mode == "any" else None)
+                for i in picked[:limit]]
+    else:
+        usable = _usable_bits(len(cals), cells, work, taken, k)
+        combined = usable[0]
+        for u in usable[1:]:
+            combined = (combined & u) if mode == "all" else (combined | u)
+        rows, truncated = [], False
+        for i in range(0, cells - k + 1, st):
+            if combined >> i & 1:
+                if len(rows) == limit:
+                    truncated = True
+                    break
+                rows.append((i, [ids[c] for c, u in enumerate(usable) if u >> i & 1] if mode == "any" else None))
+
+    out = []
+    for cell, free_ids in rows:
+        s = ws + cell * q
+        slot: Dict[str, object] = {"start": from_minutes(s, tz).isoformat(),
+                                   "end": from_minutes(s + duration, tz).isoformat()}
+        if free_ids is not None:
+            slot["free"] = free_ids
+        out.append(slot)
+    return out, truncated
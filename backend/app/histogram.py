@@ -0,0 +1,91 @@
+﻿import math
+from typing import List, Optional
+
+
+class LogHistogram:
+    """
+    HDR-style histogram with log-spaced buckets (fixed relative error, O(1) record, no per-sample storage).
+    Values are unit-less; callers pick the unit (ms, micro-dollars, ...). Values below min_value land
+    in bucket 0, values above max_value in the last bucket.
+    """
+
+    __slots__ = ("min_value", "max_value", "per_decade", "counts", "count", "total", "min", "max", "_scale")
+
+    def __init__(self, min_value: float = 0.01, max_value: float = 600_000.0, per_decade: int = 20):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.per_decade = per_decade
+        n = int(math.ceil(math.log10(max_value / min_value) * per_decade)) + 1
+        self.counts: List[int] = [0] * n
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._scale = per_decade / math.log(10)
+
+    def _index(self, v: float) -> int:
+        if v <= self.min_value:
+            return 0
+        return min(len(self.counts) - 1, int(math.log(v / self.min_value) * self._scale) + 1)
+
+    def upper_bound(self, i: int) -> float:
+        return self.min_value * 10 ** (i / self.per_decade)
+
+    def record(self, v: float) -> None:
+        self.counts[self._index(v)] += 1
+        self.count += 1
+        self.total += v
+        if self.min is None or v < self.min:
+            self.min = v
+        if self.max is None or v > self.max:
+            self.max = v
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * p / 100.0)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self.upper_bound(i), self.max)
+        return self.max
+
+    def cumulative(self) -> List[tuple]:
+        """[(upper_bound, cumulative_count)] for non-empty prefix, e.g. for Prometheus buckets."""
+        out, seen = [], 0
+        last = max((i for i, c in enumerate(self.counts) if c), default=-1)
+        for i in range(last + 1):
+            seen += self.counts[i]
+            out.append((self.upper_bound(i), seen))
+        return out
+
+    def count_le(self, v: float) -> int:
+        """Samples in buckets whose upper bound is <= v (exact when v is a bucket bound, else rounds down)."""
+        last = min(len(self.counts) - 1, self._index(v * (1 + 1e-9)))
+        if self.upper_bound(last) > v * (1 + 1e-9):
+            last -= 1
+        return sum(self.counts[:last + 1]) if last >= 0 else 0
+
+    def merge(self, other: "LogHistogram") -> None:
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def snapshot(self, digits: int = 3) -> dict:
+        def r(v):
+            return round(v, digits) if v is not None else None
+        return {
+            "count": self.count,
+            "mean": r(self.total / self.count) if self.count else None,
+            "min": r(self.min),
+            "p50": r(self.percentile(50)),
+            "p90": r(self.percentile(90)),
+            "p99": r(self.percentile(99)),
+            "max": r(self.max),
+        }
@@ -0,0 +1,219 @@
+﻿import os
+import sys
+import gzip
+import hashlib
+import tempfile
+import logging
+import mimetypes
+import datetime as dt
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+try:
+    import brotli  # type: ignore
+    HAS_BROTLI = True
+except Exception:
+    HAS_BROTLI = False
+
+log = logging.getLogger("app.http_cache")
+
+# ---- Config (env) -----------------------------------------------------------
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "86400"))              # non-HTML assets
+# Precompression is a build step (python -m app.http_cache); set 1 to also run it at startup
+STATIC_PRECOMPRESS = os.getenv("STATIC_PRECOMPRESS", "0").lower() in ("1", "true", "yes")
+API_CACHE_CONTROL = "private, no-cache"                                  # always revalidate
+
+
+# ---- Conditional JSON responses --------------------------------------------------
+# Strong ETag = hash of the exact body bytes, so every worker agrees on it and a 304 is
+# never stale. Last-Modified (from Agent.updated_at) is only passed where the newest
+# updated_at moves whenever the body does.
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def weak(etag: str) -> str:
+    """Mark an ETag weak: the body is equivalent, not byte-identical, for the same tag."""
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2)
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in [_opaque(t) for t in if_none_match.split(",")]
+
+
+def not_modified(request: Request, etag: Optional[str], last_modified: Optional[dt.datetime] = None) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return bool(etag) and _matches(inm, etag)
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _http_date(ts: dt.datetime) -> str:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=dt.timezone.utc)   # SQLite hands back naive UTC
+    return format_datetime(ts.astimezone(dt.timezone.utc), usegmt=True)
+
+
+def cached_json(request: Request, body: bytes, etag: Optional[str] = None,
+                last_modified: Optional[dt.datetime] = None) -> Response:
+    """200 with validators, or an empty 304 when the client's copy is current."""
+    etag = etag or etag_for(body)
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=dt.timezone.utc)
+    headers = {"ETag": etag, "Cache-Control": API_CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# ---- Static files -------------------------------------------------------------------
+_ENCODINGS = ((".br", "br"), (".gz", "gzip"))
+_COMPRESSIBLE = (".html", ".js", ".css", ".json", ".svg", ".txt", ".map")
+
+
+def accepted_codings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}; a coding listed with q=0 is refused, not accepted."""
+    out: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k.strip().lower() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        out[coding] = q
+    return out
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles (already ETag/Last-Modified/304) + precompressed siblings (x.js.br / x.js.gz)
+    chosen by Accept-Encoding, and Cache-Control: HTML always revalidates (not fingerprinted),
+    other assets get STATIC_MAX_AGE, or a year + immutable when requested with ?v=<hash>.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        path = str(full_path)
+        media_type = mimetypes.guess_type(path)[0] or "text/plain"
+        accept = accepted_codings(request_headers.get("accept-encoding", ""))
+        headers = {"Cache-Control": self._cache_control(path, scope)}
+
+        serve_path, serve_stat = path, stat_result
+        if path.endswith(_COMPRESSIBLE):
+            headers["Vary"] = "Accept-Encoding"
+            for suffix, coding in _ENCODINGS:
+                if accept.get(coding, accept.get("*", 0.0)) <= 0:
+                    continue
+                try:
+                    st = os.stat(path + suffix)
+                except OSError:
+                    continue
+                if st.st_mtime >= stat_result.st_mtime:   # ignore siblings older than the source
+                    serve_path, serve_stat = path + suffix, st
+                    headers["Content-Encoding"] = coding
+                    break
+
+        response = FileResponse(serve_path, status_code=status_code, stat_result=serve_stat,
+                                media_type=media_type, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    @staticmethod
+    def _cache_control(path: str, scope) -> str:
+        if path.endswith(".html"):
+            return "public, no-cache"
+        if b"v=" in (scope.get("query_string") or b""):
+            return "public, max-age=31536000, immutable"
+        return f"public, max-age={STATIC_MAX_AGE}"
+
+
+def _write_atomic(dst: str, data: bytes) -> None:
+    # Other workers may be serving dst: write a temp file beside it and rename it into place
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), prefix=".precompress-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def precompress_static(directory: str) -> int:
+    """Write .gz (and .br when brotli is installed) next to each compressible file that's stale."""
+    written = 0
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(_COMPRESSIBLE):
+                continue
+            src = os.path.join(root, name)
+            with open(src, "rb") as f:
+                data = None
+                for suffix, _coding in _ENCODINGS:
+                    if suffix == ".br" and not HAS_BROTLI:
+                        continue
+                    dst = src + suffix
+                    if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+                        continue
+                    if data is None:
+                        data = f.read()
+                    packed = brotli.compress(data, quality=11) if suffix == ".br" else gzip.compress(data, 9, mtime=0)
+                    if len(packed) >= len(data):
+                        # Not worth serving: drop an old sibling rather than leave it stale
+                        if os.path.exists(dst):
+                            os.unlink(dst)
+                        continue
+                    _write_atomic(dst, packed)
+                    written += 1
+    return written
+
+
+def try_precompress_static(directory: str) -> None:
+    # Optional startup hook (STATIC_PRECOMPRESS=1); a read-only image is fine
+    if not STATIC_PRECOMPRESS:
+        return
+    try:
+        n = precompress_static(directory)
+        if n:
+            log.info("precompressed %d static files in %s", n, directory)
+    except OSError as e:
+        log.warning("static precompression skipped: %s", e)
+
+
+if __name__ == "__main__":
+    # Build step: python -m app.http_cache app/static
+    print(precompress_static(sys.argv[1] if len(sys.argv) > 1 else "app/static"))
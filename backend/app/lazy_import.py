@@ -0,0 +1,54 @@
+﻿import time
+import importlib
+import importlib.util
+import threading
+from types import ModuleType
+from typing import Dict, Optional
+
+# ---- Deferred imports -----------------------------------------------------------------
+# Heavy optional dependencies (numpy, psutil, sentence_transformers) load on first attribute
+# access instead of while app.main imports, so a worker that never serves those paths never
+# pays for them. has_module() asks the import finders whether a package is installed without
+# executing it; code that used `try: import x; HAS_X = True` keeps the same flag.
+
+_loaded_ms: Dict[str, float] = {}
+
+
+def has_module(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule:
+    __slots__ = ("_name", "_mod", "_lock")
+
+    def __init__(self, name: str):
+        self._name = name
+        self._mod: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        if self._mod is None:
+            with self._lock:
+                if self._mod is None:
+                    t0 = time.perf_counter()
+                    self._mod = importlib.import_module(self._name)
+                    _loaded_ms[self._name] = 1000 * (time.perf_counter() - t0)
+        return self._mod
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r} ({'loaded' if self._mod is not None else 'not loaded'})>"
+
+
+def lazy(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def lazy_import_timings() -> Dict[str, float]:
+    """{module: import ms} for deferred modules loaded so far in this process."""
+    return dict(_loaded_ms)
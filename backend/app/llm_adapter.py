@@ -1,87 +1,246 @@
-﻿from typing import Optional, List, Dict
+﻿from typing import Optional, List, Dict, AsyncIterator, Iterable, Callable, Awaitable, Tuple, Any
 import os
-import httpx
+import json
+import time
+import asyncio
+import hashlib
+
+from .llm_transport import transport
+from .rate_limit import (
+    RateLimited, limiter_for, limiter_stats, backoff_delay, parse_retry_after, estimate_payload_tokens,
+    LLM_QUEUE_DEADLINE_S, LLM_MAX_RETRIES, RETRY_STATUSES,
+)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 # If your key is project-scoped, set OPENAI_PROJECT in .env to your project id (not the key).
 OPENAI_PROJECT = os.getenv("OPENAI_PROJECT", "").strip()
 
+DEFAULT_SYSTEM_PROMPT = "You are a helpful, safe assistant."
+
 class OpenAIError(Exception):
     pass
 
-async def _invoke_openai_legacy(prompt: str, model: str = "gpt-4o-mini", max_tokens: int = 400):
+def _headers() -> Dict[str, str]:
     if not OPENAI_API_KEY:
         raise OpenAIError("Missing OPENAI_API_KEY")
-
-    url = f"{OPENAI_BASE_URL}/chat/completions"
     headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
     if OPENAI_PROJECT:
         headers["OpenAI-Project"] = OPENAI_PROJECT
+    return headers
 
+def _to_messages(messages: Optional[List[Dict]], prompt: Optional[str]) -> List[Dict]:
+    if messages:
+        return list(messages)
+    return [
+        {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt or ""},
+    ]
+
+def _payload(model: str, messages: List[Dict], max_tokens: int, temperature: float, stream: bool = False) -> dict:
     payload = {
         "model": model,
-        "messages": [
-            {"role": "system", "content": "You are a helpful, safe assistant."},
-            {"role": "user", "content": prompt}
-        ],
+        "messages": messages,
         "max_tokens": max_tokens,
-        "temperature": 0.2
+        "temperature": temperature,
     }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+# ---- Rate-limited upstream calls + single-flight coalescing ---------------------
+# Every upstream call goes through rate_limit.limiter_for(model): RPM/TPM buckets, adaptive
+# concurrency and a shared Retry-After cooldown. 429/5xx are retried with backoff until the
+# queue deadline, so load spikes turn into latency before they turn into errors.
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+_inflight: Dict[str, _Flight] = {}
+_counters = {"upstream_calls": 0, "coalesced": 0, "retries": 0}
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        if r.status_code >= 400:
-            raise OpenAIError(f"{r.status_code} {r.reason_phrase}: {r.text}")
-        data = r.json()
-        return data["choices"][0]["message"]["content"]
+def _flight_key(payload: dict) -> str:
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-# --- Compatibility shim: accept messages=[...] OR prompt=str ---
-def invoke_openai(
+async def _retry_wait(lim, r, attempt: int, deadline: float) -> None:
+    retry_after = parse_retry_after(r.headers.get("retry-after"))
+    delay = backoff_delay(attempt, retry_after)
+    if r.status_code == 429:
+        lim.cooldown(delay)
+    if time.monotonic() + delay > deadline:
+        raise RateLimited(f"{lim.model}: upstream {r.status_code}, retry budget exhausted", retry_after=max(1.0, delay))
+    _counters["retries"] += 1
+    await asyncio.sleep(delay)
+
+async def _post_completion(payload: dict) -> str:
+    lim = limiter_for(payload["model"])
+    est = estimate_payload_tokens(payload)
+    deadline = time.monotonic() + LLM_QUEUE_DEADLINE_S
+    attempt = 0
+    while True:
+        async with lim.slot(est, deadline):
+            _counters["upstream_calls"] += 1
+            t0 = time.monotonic()
+            r = await transport.post(f"{OPENAI_BASE_URL}/chat/completions", headers=_headers(), json=payload, timeout=60)
+            lim.feedback(r.status_code, 1000 * (time.monotonic() - t0))
+        if r.status_code in RETRY_STATUSES and attempt < LLM_MAX_RETRIES:
+            await _retry_wait(lim, r, attempt, deadline)
+            attempt += 1
+            continue
+        break
+    if r.status_code == 429:
+        raise RateLimited(f"{lim.model}: 429 {r.text}", retry_after=parse_retry_after(r.headers.get("retry-after")) or 1.0)
+    if r.status_code >= 400:
+        raise OpenAIError(f"{r.status_code} {r.reason_phrase}: {r.text}")
+    data = r.json()
+    used = (data.get("usage") or {}).get("total_tokens")
+    if used:
+        lim.tpm.adjust(float(used) - est)
+    return data["choices"][0]["message"]["content"]
+
+async def complete(
     model: str,
     messages: Optional[List[Dict]] = None,
     prompt: Optional[str] = None,
-    max_tokens: int = 200,
-    temperature: float = 0.7,
-):
-    # If a legacy implementation exists, call it; otherwise raise.
+    max_tokens: int = 400,
+    temperature: float = 0.2,
+) -> str:
+    """
+    Single chat completion; returns the assistant text.
+    Identical requests already in flight share one upstream call (single-flight); the shared
+    call is only cancelled when every caller waiting on it has been cancelled.
+    """
+    payload = _payload(model, _to_messages(messages, prompt), max_tokens, temperature)
+    key = _flight_key(payload)
+    fl = _inflight.get(key)
+    if fl is None:
+        fl = _inflight[key] = _Flight(asyncio.ensure_future(_post_completion(payload)))
+        fl.task.add_done_callback(lambda _t, k=key, f=fl: _inflight.pop(k, None) if _inflight.get(k) is f else None)
+    else:
+        _counters["coalesced"] += 1
+    fl.waiters += 1
     try:
-        legacy = _invoke_openai_legacy  # type: ignore[name-defined]
-    except NameError as _e:
-        # No legacy symbol; maybe the current impl already accepts 'prompt' only.
-        # Try to call a same-name function without messages kw.
+        return await asyncio.shield(fl.task)
+    except asyncio.CancelledError:
+        if fl.waiters == 1 and not fl.task.done():
+            fl.task.cancel()
+        raise
+    finally:
+        fl.waiters -= 1
+
+async def fan_out(
+    jobs: Iterable[Callable[[], Awaitable[Any]]],
+    concurrency: int = 8,
+) -> AsyncIterator[Tuple[int, Any, Optional[BaseException]]]:
+    """Run job factories with at most `concurrency` in flight; yield (index, result, error) as each finishes."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(i: int, job):
+        async with sem:
+            try:
+                return i, await job(), None
+            except Exception as e:
+                return i, None, e
+
+    tasks = [asyncio.ensure_future(run(i, job)) for i, job in enumerate(jobs)]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for t in tasks:
+            t.cancel()
+
+async def complete_many(
+    requests: List[Dict],
+    concurrency: int = 8,
+) -> AsyncIterator[Tuple[int, Optional[str], Optional[BaseException]]]:
+    """
+    Bulk completions. Each request is a dict of complete() kwargs (model, messages|prompt,
+    max_tokens, temperature); results are yielded as (index, text, error) in completion order.
+    """
+    jobs = [(lambda kw=kw: complete(**kw)) for kw in requests]
+    async for item in fan_out(jobs, concurrency):
+        yield item
+
+def adapter_stats() -> dict:
+    return {
+        **_counters,
+        "in_flight_unique": len(_inflight),
+        "models": limiter_stats(),
+    }
+
+async def _sse_deltas(r) -> AsyncIterator[str]:
+    async for line in r.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
         try:
-            # fall through to a local name 'invoke_openai_raw' if user has one
-            legacy = invoke_openai_raw  # type: ignore[name-defined]
-        except NameError:
-            raise RuntimeError("No legacy OpenAI adapter found. Please keep _invoke_openai_legacy or invoke_openai_raw defined.") from _e
-
-    # Build a text prompt from messages if provided
-    if messages and not prompt:
-        # Join simple role:content pairs into a compact prompt
-        parts = []
-        for m in messages:
-            role = m.get("role","user")
-            content = m.get("content","")
-            # content may be list/dict in OpenAI schema; coerce simply
-            if isinstance(content, list):
-                content = " ".join(
-                    c.get("text","") if isinstance(c, dict) else str(c)
-                    for c in content
-                )
-            elif isinstance(content, dict):
-                content = content.get("text", str(content))
-            parts.append(f"{role.upper()}: {content}")
-        prompt = "\n".join(parts)
-
-    if not prompt:
-        prompt = ""
-
-    # Call legacy with a 'prompt=' signature
-    return legacy(
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        choices = chunk.get("choices") or []
+        if not choices:
+            continue
+        delta = (choices[0].get("delta") or {}).get("content")
+        if delta:
+            yield delta
+
+async def stream(
+    model: str,
+    messages: Optional[List[Dict]] = None,
+    prompt: Optional[str] = None,
+    max_tokens: int = 400,
+    temperature: float = 0.2,
+) -> AsyncIterator[str]:
+    """Streaming chat completion; yields content deltas as the provider's SSE events arrive."""
+    url = f"{OPENAI_BASE_URL}/chat/completions"
+    payload = _payload(model, _to_messages(messages, prompt), max_tokens, temperature, stream=True)
+    lim = limiter_for(model)
+    est = estimate_payload_tokens(payload)
+    deadline = time.monotonic() + LLM_QUEUE_DEADLINE_S
+    attempt = 0
+    while True:
+        # Retries are only possible before the first byte has been relayed.
+        async with lim.slot(est, deadline):
+            _counters["upstream_calls"] += 1
+            t0 = time.monotonic()
+            async with transport.stream("POST", url, headers=_headers(), json=payload, timeout=60) as r:
+                lim.feedback(r.status_code, 1000 * (time.monotonic() - t0))
+                if r.status_code >= 400:
+                    body = (await r.aread()).decode("utf-8", "replace")
+                    if not (r.status_code in RETRY_STATUSES and attempt < LLM_MAX_RETRIES):
+                        if r.status_code == 429:
+                            raise RateLimited(f"{model}: 429 {body}", retry_after=parse_retry_after(r.headers.get("retry-after")) or 1.0)
+                        raise OpenAIError(f"{r.status_code} {r.reason_phrase}: {body}")
+                else:
+                    async for delta in _sse_deltas(r):
+                        yield delta
+                    return
+        await _retry_wait(lim, r, attempt, deadline)
+        attempt += 1
+
+async def _invoke_openai_legacy(prompt: str, model: str = "gpt-4o-mini", max_tokens: int = 400):
+    return await complete(model=model, prompt=prompt, max_tokens=max_tokens, temperature=0.2)
+
+# --- Compatibility entry point: accept messages=[...] OR prompt=str ---
+async def invoke_openai(
+    model: str,
+    messages: Optional[List[Dict]] = None,
+    prompt: Optional[str] = None,
+    max_tokens: int = 200,
+    temperature: float = 0.7,
+) -> str:
+    return await complete(
         model=model,
+        messages=messages,
         prompt=prompt,
         max_tokens=max_tokens,
-
+        temperature=temperature,
     )
-
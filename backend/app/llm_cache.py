@@ -0,0 +1,273 @@
+﻿import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict, Tuple
+
+# ---- Config (env) -----------------------------------------------------------
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))                    # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Optional on-disk tier shared by workers on the same host, e.g. /data/llm_cache.sqlite
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", "").strip()
+# Disk tier budget, enforced every LLM_CACHE_DISK_PRUNE_EVERY sets (expired rows first, then the
+# entries closest to expiry)
+LLM_CACHE_DISK_MAX_ROWS = int(os.getenv("LLM_CACHE_DISK_MAX_ROWS", "100000"))
+LLM_CACHE_DISK_MAX_BYTES = int(os.getenv("LLM_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_DISK_PRUNE_EVERY = int(os.getenv("LLM_CACHE_DISK_PRUNE_EVERY", "256"))
+
+_WS = re.compile(r"\s+")
+
+
+# ---- Keys -------------------------------------------------------------------
+def _content_text(content) -> str:
+    if isinstance(content, list):
+        return " ".join(c.get("text", "") if isinstance(c, dict) else str(c) for c in content)
+    if isinstance(content, dict):
+        return content.get("text", str(content))
+    return str(content or "")
+
+def normalize_text(text: str) -> str:
+    return _WS.sub(" ", text).strip().casefold()
+
+def normalize_messages(messages: List[Dict]) -> List[Tuple[str, str]]:
+    return [(m.get("role", "user"), normalize_text(_content_text(m.get("content", "")))) for m in messages]
+
+def spec_hash(spec: Optional[dict]) -> str:
+    raw = json.dumps(spec or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+def cache_key(agent_id: int, spec: Optional[dict], model: str, messages: List[Dict],
+              temperature: float, max_tokens: int) -> str:
+    raw = json.dumps(
+        [agent_id, spec_hash(spec), model, normalize_messages(messages), round(float(temperature), 3), int(max_tokens)],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def cache_enabled_for(spec: Optional[dict]) -> bool:
+    """Per-agent opt-out: spec {"cache": false} or {"cache": {"enabled": false}}."""
+    if not LLM_CACHE_ENABLED:
+        return False
+    c = (spec or {}).get("cache", True)
+    if isinstance(c, dict):
+        return bool(c.get("enabled", True))
+    return bool(c)
+
+
+# ---- Tiers --------------------------------------------------------------------
+class MemoryLRU:
+    """In-process LRU bounded by entry count and total value bytes, with per-entry TTL."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self._data: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + ttl, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                old, _ = next(iter(self._data.items()))
+                self._drop(old)
+                self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "bytes": self._bytes, "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes, "evictions": self.evictions, "expirations": self.expirations}
+
+
+class SQLiteTier:
+    """On-disk tier (stdlib sqlite3, WAL) so entries survive restarts and are shared by local workers."""
+
+    def __init__(self, path: str, max_rows: int = LLM_CACHE_DISK_MAX_ROWS, max_bytes: int = LLM_CACHE_DISK_MAX_BYTES,
+                 prune_every: int = LLM_CACHE_DISK_PRUNE_EVERY):
+        self.path = path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.prune_every = max(1, prune_every)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sets = 0
+        self.evicted = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (k TEXT PRIMARY KEY, v TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn().execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at)")
+        self.prune()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        row = self._conn().execute("SELECT v, expires_at FROM llm_cache WHERE k=?", (key,)).fetchone()
+        if not row:
+            return None
+        if row[1] < time.time():
+            self._conn().execute("DELETE FROM llm_cache WHERE k=?", (key,))
+            return None
+        return row[0], row[1] - time.time()
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO llm_cache (k, v, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+        with self._lock:
+            self._sets += 1
+            due = self._sets % self.prune_every == 0
+        if due:
+            self.prune()
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def prune(self) -> int:
+        """Drop expired rows, then the soonest-to-expire ones past max_rows / max_bytes; returns rows deleted."""
+        conn = self._conn()
+        n = self.purge_expired()
+        n += conn.execute(
+            "DELETE FROM llm_cache WHERE k IN (SELECT k FROM llm_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        ).rowcount
+        n += conn.execute(
+            "DELETE FROM llm_cache WHERE k IN (SELECT k FROM (SELECT k, SUM(length(CAST(v AS BLOB)))"
+            " OVER (ORDER BY expires_at DESC) AS kept FROM llm_cache) WHERE kept > ?)",
+            (self.max_bytes,),
+        ).rowcount
+        self.evicted += n
+        return n
+
+    def stats(self) -> dict:
+        rows, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(length(CAST(v AS BLOB))), 0) FROM llm_cache").fetchone()
+        return {"path": self.path, "rows": rows, "bytes": size, "max_rows": self.max_rows,
+                "max_bytes": self.max_bytes, "evicted": self.evicted}
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM llm_cache")
+
+
+# ---- Facade -------------------------------------------------------------------
+class CompletionCache:
+    def __init__(self, memory: MemoryLRU, disk: Optional[SQLiteTier] = None, ttl: float = LLM_CACHE_TTL):
+        self.memory = memory
+        self.disk = disk
+        self.ttl = ttl
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.sets = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[str]:
+        v = self.memory.get(key)
+        if v is not None:
+            self.hits_memory += 1
+            return v
+        if self.disk is not None:
+            try:
+                hit = self.disk.get(key)
+            except sqlite3.Error:
+                hit = None
+                self.errors += 1
+            if hit is not None:
+                self.hits_disk += 1
+                self.memory.set(key, hit[0], hit[1])
+                return hit[0]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        if not value:
+            return
+        self.sets += 1
+        self.memory.set(key, value, self.ttl)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, self.ttl)
+            except sqlite3.Error:
+                self.errors += 1
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        hits = self.hits_memory + self.hits_disk
+        lookups = hits + self.misses
+        return {
+            "enabled": LLM_CACHE_ENABLED,
+            "ttl_s": self.ttl,
+            "hits": hits,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "sets": self.sets,
+            "errors": self.errors,
+            "memory": self.memory.stats(),
+            "disk": self._disk_stats(),
+        }
+
+    def _disk_stats(self) -> Optional[dict]:
+        if self.disk is None:
+            return None
+        try:
+            return self.disk.stats()
+        except sqlite3.Error as e:
+            return {"path": self.disk.path, "error": str(e)}
+
+
+def _build_default() -> CompletionCache:
+    disk = None
+    if LLM_CACHE_SQLITE_PATH:
+        try:
+            disk = SQLiteTier(LLM_CACHE_SQLITE_PATH)
+        except sqlite3.Error:
+            disk = None
+    return CompletionCache(MemoryLRU(), disk)
+
+completion_cache = _build_default()
@@ -0,0 +1,196 @@
+﻿import os
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .request_metrics import add_llm_time
+
+# HTTP/2 needs the optional 'h2' package (httpx[http2]); fall back to HTTP/1.1 keep-alive without it.
+try:
+    import h2  # noqa: F401
+    HAS_H2 = True
+except Exception:
+    HAS_H2 = False
+
+# ---- Pool configuration (env) ---------------------------------------------
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_PER_HOST_LIMIT = int(os.getenv("LLM_PER_HOST_LIMIT", "32"))
+# Hosts tracked (semaphore + stats); vision fetches arbitrary image URLs, so the least recently
+# used idle host is evicted past this
+LLM_MAX_HOSTS = int(os.getenv("LLM_MAX_HOSTS", "64"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1").lower() not in ("0", "false", "no") and HAS_H2
+
+
+class _HostStats:
+    __slots__ = ("in_flight", "waiting", "peak_in_flight", "requests", "errors", "wait_s")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.wait_s = 0.0
+
+
+class LLMTransport:
+    """
+    Process-wide pooled HTTP client for upstream model calls.
+    One httpx.AsyncClient (keep-alive + HTTP/2 when available) shared by llm_adapter and vision,
+    with a per-host concurrency cap so one provider can't take the whole pool.
+    """
+
+    def __init__(self, per_host_limit: int = LLM_PER_HOST_LIMIT, max_hosts: int = LLM_MAX_HOSTS):
+        self.per_host_limit = max(1, per_host_limit)
+        self.max_hosts = max(1, max_hosts)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sems: "OrderedDict[str, asyncio.Semaphore]" = OrderedDict()
+        self._hosts: Dict[str, _HostStats] = {}
+        self.evicted_hosts = 0
+        self._started_at: Optional[float] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=LLM_HTTP2)
+
+    async def start(self) -> None:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            self._started_at = time.time()
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Lazily created so scripts and workers outside the app lifespan still share one pool.
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            self._started_at = time.time()
+        return self._client
+
+    @asynccontextmanager
+    async def host_slot(self, url: str):
+        host = urlsplit(url).netloc or "default"
+        sem = self._sems.get(host)
+        if sem is None:
+            self._evict_idle()
+            sem = self._sems[host] = asyncio.Semaphore(self.per_host_limit)
+            self._hosts[host] = _HostStats()
+        else:
+            self._sems.move_to_end(host)
+        st = self._hosts[host]
+        st.waiting += 1
+        t0 = time.perf_counter()
+        # Per-request LLM time (wait for the slot included) for the latency middleware
+        try:
+            await sem.acquire()
+        finally:
+            st.waiting -= 1
+        st.wait_s += time.perf_counter() - t0
+        st.in_flight += 1
+        st.requests += 1
+        st.peak_in_flight = max(st.peak_in_flight, st.in_flight)
+        try:
+            yield
+        except Exception:
+            st.errors += 1
+            raise
+        finally:
+            st.in_flight -= 1
+            sem.release()
+            add_llm_time(1000 * (time.perf_counter() - t0))
+
+    def _evict_idle(self) -> None:
+        # Drop least recently used hosts with nothing in flight or queued until there's room
+        # (busy hosts are kept, so the map can briefly exceed max_hosts under load)
+        for host in list(self._sems):
+            if len(self._sems) < self.max_hosts:
+                return
+            st = self._hosts[host]
+            if st.in_flight == 0 and st.waiting == 0:
+                del self._sems[host], self._hosts[host]
+                self.evicted_hosts += 1
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self.host_slot(url):
+            return await self.client.request(method, url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        # Holds the host slot for the whole body so long streams count against the cap.
+        async with self.host_slot(url):
+            async with self.client.stream(method, url, **kwargs) as r:
+                yield r
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    def _pool_stats(self) -> dict:
+        # httpcore doesn't expose counters publicly; read what's there defensively.
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        conns = list(getattr(pool, "connections", []) or [])
+        out = {"open": len(conns), "idle": 0, "available": 0, "http2": 0, "queued_requests": None}
+        for c in conns:
+            try:
+                out["idle"] += 1 if c.is_idle() else 0
+                out["available"] += 1 if c.is_available() else 0
+                out["http2"] += 1 if "HTTP/2" in c.info() else 0
+            except Exception:
+                pass
+        reqs = getattr(pool, "_requests", None)
+        if reqs is not None:
+            out["queued_requests"] = sum(1 for r in reqs if getattr(r, "connection", None) is None)
+        return out
+
+    def stats(self) -> dict:
+        active = self._client is not None and not self._client.is_closed
+        return {
+            "active": active,
+            "started_at": self._started_at,
+            "http2": LLM_HTTP2,
+            "limits": {
+                "max_connections": LLM_MAX_CONNECTIONS,
+                "max_keepalive": LLM_MAX_KEEPALIVE,
+                "keepalive_expiry_s": LLM_KEEPALIVE_EXPIRY,
+                "per_host": self.per_host_limit,
+                "max_hosts": self.max_hosts,
+            },
+            "evicted_hosts": self.evicted_hosts,
+            "pool": self._pool_stats() if active else None,
+            "hosts": {
+                h: {
+                    "in_flight": s.in_flight,
+                    "waiting": s.waiting,
+                    "peak_in_flight": s.peak_in_flight,
+                    "saturation": round(s.in_flight / self.per_host_limit, 3),
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "avg_wait_ms": round(1000 * s.wait_s / s.requests, 3) if s.requests else 0.0,
+                }
+                for h, s in self._hosts.items()
+            },
+        }
+
+
+# Shared instance; started/closed by the app lifespan in main.py
+transport = LLMTransport()
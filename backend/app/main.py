@@ -1,166 +1,159 @@
-﻿import os
-os.environ.setdefault('ADMIN_EMAIL','devinisabella1@gmail.com')
-import logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-
-# Core routers (always available)
-from .routes import store, owner, safety, publish, adopt, publisher, auth, admin, metrics, feedback
-
-# Optional admin router (import only if present)
-try:
-    from .routes import admin
-    _HAVE_ADMIN = True
-except Exception:
-    _HAVE_ADMIN = False
-from .routes import monitor
+﻿import os
+os.environ.setdefault('ADMIN_EMAIL','devinisabella1@gmail.com')
+# First: with STARTUP_PROFILE=1 every import below is timed (served at /debug/startup)
+from . import startup_profile
+startup_profile.install()
+import sys
+import time
+import logging
+import importlib
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+from contextlib import asynccontextmanager
+from typing import Dict, List
 
-app = FastAPI(
-# --- ROUTER_HARDLINK_V1 ---
-try:
-    from .routes import builder as _b
-    app.include_router(_b.router)
-except Exception:
-    pass
-try:
-    from .routes import admin as _a
-    app.include_router(_a.router)
-except Exception:
-    pass
-try:
-    from .routes import monitor as _m
-    app.include_router(_m.router)
-except Exception:
-    pass
-# --- END ROUTER_HARDLINK_V1 ---
-
-# --- ROUTER RESCUE ---
-import os, sys, importlib, importlib.util, json
-from fastapi import APIRouter
+from fastapi import APIRouter, FastAPI, Query, Request
+from fastapi.responses import JSONResponse
 
-# /debug/routes
-try:
-    _dbg_router = APIRouter(prefix="/debug", tags=["debug"])
-    @_dbg_router.get("/routes")
-    def _debug_routes():
-        try:
-            return {"routes":[{"path":getattr(r,'path',None),"name":getattr(r,'name',None)} for r in app.routes]}
-        except Exception as e:
-            return {"error": str(e)}
-    app.include_router(_dbg_router)
-except Exception:
-    pass
+from .llm_transport import transport as llm_transport
+from .db import engine, dispose_async_engine
+from .search import ensure_sqlite_fts
+from .calendar_store import ensure_sqlite_booking_guard
+from .notifier import outbox_worker
+from .agent_counters import reconciler as counter_reconciler
+from .system_sampler import sampler as system_sampler
+from .http_cache import CachedStaticFiles, try_precompress_static
+from .lazy_import import lazy_import_timings
+from .request_metrics import RequestMetricsMiddleware
+
+log = logging.getLogger("app")
+
+# ---- Router registry ------------------------------------------------------------------
+# Every router is listed here once and is imported and included exactly once, in this order
+# (first match wins, so the order is the old effective order). required=False: an import
+# failure is logged and the app boots without that router. Heavy optional dependencies
+# (numpy, psutil, sentence_transformers) are deferred in their modules via lazy_import.
+ROUTERS = (
+    # (module under app.routes, required)
+    ("builder", True),
+    ("admin", False),
+    ("monitor", True),
+    ("store", True),
+    ("owner", True),
+    ("safety", True),
+    ("publish", True),
+    ("adopt", True),
+    ("publisher", True),
+    ("auth", True),
+    ("metrics", True),
+    ("feedback", True),
+    ("support", True),
+    ("calendar", True),
+)
 
-# /debug/env
-try:
-    _dbg2 = APIRouter(prefix="/debug", tags=["debug"])
-    @_dbg2.get("/env")
-    def _debug_env():
+# Filled by include_routers(): one entry per registry line (import/include ms, route count or error)
+router_timings: List[Dict] = []
+
+
+def include_routers(app: FastAPI) -> None:
+    for name, required in ROUTERS:
+        t0 = time.perf_counter()
         try:
-            here = os.path.dirname(__file__)
-            routes_dir = os.path.join(here, "routes")
-            return {
-                "__name__": __name__,
-                "__file__": __file__,
-                "here": here,
-                "routes_dir": routes_dir,
-                "exists": os.path.isdir(routes_dir),
-                "routes_list": sorted(os.listdir(routes_dir)) if os.path.isdir(routes_dir) else None,
-                "sys_path": sys.path,
-            }
+            mod = importlib.import_module(f".routes.{name}", __package__)
         except Exception as e:
-            return {"error": str(e)}
-    app.include_router(_dbg2)
-except Exception:
-    pass
+            if required:
+                raise
+            log.warning("optional router %s not loaded: %s", name, e)
+            router_timings.append({"router": name, "loaded": False, "error": str(e)})
+            continue
+        t1 = time.perf_counter()
+        app.include_router(mod.router)
+        t2 = time.perf_counter()
+        router_timings.append({"router": name, "loaded": True, "routes": len(mod.router.routes),
+                               "import_ms": round(1000 * (t1 - t0), 2), "include_ms": round(1000 * (t2 - t1), 2)})
 
-# Hard file-loader fallback (builder/admin/monitor)
-def _load_by_file(pyfile):
-    try:
-        if not os.path.isfile(pyfile): return None
-        name = "dyn_" + os.path.basename(pyfile).replace(".py","")
-        spec = importlib.util.spec_from_file_location(name, pyfile)
-        if not spec or not spec.loader: return None
-        mod = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(mod)
-        return mod
-    except Exception:
-        return None
 
-try:
-    _here = os.path.dirname(__file__)
-    _routes = os.path.join(_here, "routes")
-    for _name in ("builder","admin","monitor"):
-        try:
-            _py = os.path.join(_routes, f"{_name}.py")
-            _mod = _load_by_file(_py)
-            if _mod and hasattr(_mod, "router"):
-                app.include_router(getattr(_mod, "router"))
-        except Exception:
-            pass
-except Exception:
-    pass
-# --- END ROUTER RESCUE ---
-title="AI Factory", version="0.1.0")
-
-
-
-app.include_router(builder.router)
-# --- BOT_BRAIN_V2: builder wiring (idempotent) ---
-try:
-    from .routes import builder as _builder_routes
-except Exception:
-    try:
-        from app.routes import builder as _builder_routes
-    except Exception:
-        _builder_routes = None
-if _builder_routes:
+@asynccontextmanager
+async def lifespan(_app):
+    # Shared upstream LLM connection pool (llm_adapter + vision)
+    await llm_transport.start()
+    # email_outbox delivery (pooled SMTP session, retries); NOTIFIER_WORKER=0 to leave it to other processes
+    await outbox_worker.start()
+    # agent_counters: fill on a fresh DB, then recompute every COUNTERS_RECONCILE_S
+    await counter_reconciler.start()
+    # CPU/memory/loop lag/GC/threadpool/DB pool every SAMPLER_INTERVAL_S into a ring buffer (/monitor/stats, /monitor/series)
+    await system_sampler.start()
+    # SQLite dev DBs: FTS5 index for /store/search (Postgres uses step26_store_search.sql)
+    ensure_sqlite_fts(engine)
+    # ...and the calendar overlap trigger (Postgres uses step32_booking_guard.sql)
+    ensure_sqlite_booking_guard(engine)
+    # .gz/.br siblings for CachedStaticFiles when STATIC_PRECOMPRESS=1 (normally a build step)
+    try_precompress_static("app/static")
+    startup_profile.finish(router_timings, lazy_import_timings())
     try:
-        app.include_router(_builder_routes.router)
-    except Exception:
-        pass
-# --- END BOT_BRAIN_V2 builder wiring ---
-# --- BOT_BRAIN_V2: monitor wiring (robust, idempotent) ---
-try:
-    from .routes import monitor as _monitor_routes
-except Exception:
+        yield
+    finally:
+        await llm_transport.aclose()
+        await outbox_worker.stop()
+        await counter_reconciler.stop()
+        await system_sampler.stop()
+        await dispose_async_engine()
+
+app = FastAPI(title="AI Factory", version="0.1.0", lifespan=lifespan)
+
+startup_profile.mark("app_created")
+include_routers(app)
+startup_profile.mark("routers_included")
+log.info("routers: %d registered, %d routes", sum(t["loaded"] for t in router_timings), len(app.routes))
+
+# ---- Debug ----------------------------------------------------------------------------
+_debug = APIRouter(prefix="/debug", tags=["debug"])
+
+@_debug.get("/routes")
+def debug_routes():
     try:
-        from app.routes import monitor as _monitor_routes  # absolute import fallback
-    except Exception as _e:
-        _monitor_routes = None
-if _monitor_routes:
+        return {"routes":[{"path":getattr(r,'path',None),"name":getattr(r,'name',None)} for r in app.routes]}
+    except Exception as e:
+        return {"error": str(e)}
+
+@_debug.get("/env")
+def debug_env():
     try:
-        app.include_router(_monitor_routes.router)
-    except Exception:
-        pass
-# --- END BOT_BRAIN_V2 monitor wiring ---
-app.include_router(monitor.router)
-# Mount static files
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-
-# Include routers
-app.include_router(store.router)
-app.include_router(owner.router)
-app.include_router(safety.router)
-app.include_router(publish.router)
-app.include_router(adopt.router)
-app.include_router(publisher.router)
-if _HAVE_ADMIN:
-    app.include_router(admin.router)
-app.include_router(auth.router)
-app.include_router(metrics.router)
-app.include_router(feedback.router)
-
-# Simple health endpoint (kept stable for scripts)
-@app.get("/health")
-def health():
-    return {"status": "ok"}
-
-
-
-from fastapi import Request
-from fastapi.responses import JSONResponse
+        here = os.path.dirname(__file__)
+        routes_dir = os.path.join(here, "routes")
+        return {
+            "__name__": __name__,
+            "__file__": __file__,
+            "here": here,
+            "routes_dir": routes_dir,
+            "exists": os.path.isdir(routes_dir),
+            "routes_list": sorted(os.listdir(routes_dir)) if os.path.isdir(routes_dir) else None,
+            "sys_path": sys.path,
+            "routers": router_timings,
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+@_debug.get("/startup")
+def debug_startup(top: int = Query(30, ge=1, le=1000), sort: str = Query("cumulative", pattern="^(cumulative|self)$"),
+                  prefix: str = ""):
+    # Import/cold-start profile of this worker: marks (ms since main started importing), per-router
+    # import/include times, deferred imports so far, and per-module times when STARTUP_PROFILE=1
+    out = startup_profile.report(top, sort, prefix)
+    out["routers"] = router_timings
+    out["lazy_ms"] = lazy_import_timings()
+    return out
+
+app.include_router(_debug)
+
+# Mount static files
+app.mount("/static", CachedStaticFiles(directory="app/static"), name="static")
+
+# Simple health endpoint (kept stable for scripts)
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
 @app.middleware('http')
 async def error_logger(request: Request, call_next):
     try:
@@ -168,135 +161,9 @@ async def error_logger(request: Request, call_next):
         return resp
     except Exception as e:
         logging.getLogger('app').exception(f'unhandled: {e}')
-        return JSONResponse({'error':'unhandled'}, status_code=500)
-
-
-
-
-
-# --- FORCED ROUTER APPEND ---
-try:
-    import os
-    os.environ.setdefault('ADMIN_EMAIL','devinisabella1@gmail.com')
-except Exception:
-    pass
-
-def _try_import(modname):
-    try:
-        return __import__(f".routes.{modname}", fromlist=['*'], level=1)
-    except Exception:
-        try:
-            return __import__(f"app.routes.{modname}", fromlist=['*'])
-        except Exception:
-            return None
-
-for _m in ('builder','admin','monitor'):
-    try:
-        _mod = _try_import(_m)
-        if _mod and hasattr(_mod, 'router'):
-            app.include_router(getattr(_mod, 'router'))
-    except Exception:
-        pass
-# --- END FORCED ROUTER APPEND ---
-
-# --- DEBUG ROUTES LIST ---
-try:
-    from fastapi import APIRouter
-    _dbg_router = APIRouter(prefix="/debug", tags=["debug"])
-    @_dbg_router.get("/routes")
-    def debug_routes():
-        try:
-            return {"routes":[{"path":getattr(r,'path',None),"name":getattr(r,'name',None)} for r in app.routes]}
-        except Exception as e:
-            return {"error": str(e)}
-    app.include_router(_dbg_router)
-except Exception:
-    pass
-# --- END DEBUG ROUTES LIST ---
-
-# --- HARD INCLUDE ROUTERS (builder/admin/monitor) ---
-import importlib
-def _safe_import(mods):
-    for mn in mods:
-        try:
-            return importlib.import_module(mn)
-        except Exception:
-            pass
-    return None
-try:
-    _mods = {
-        "builder": _safe_import((".routes.builder","app.routes.builder","backend.app.routes.builder")),
-        "admin":   _safe_import((".routes.admin","app.routes.admin","backend.app.routes.admin")),
-        "monitor": _safe_import((".routes.monitor","app.routes.monitor","backend.app.routes.monitor")),
-    }
-    for _k,_m in _mods.items():
-        try:
-            if _m and hasattr(_m,"router"):
-                app.include_router(getattr(_m,"router"))
-        except Exception:
-            pass
-except Exception:
-    pass
-# --- END HARD INCLUDE ROUTERS ---
-
-# --- DEBUG ENV & FILE LOADER ---
-try:
-    import os, sys, json, importlib, importlib.util
-    from fastapi import APIRouter
+        return JSONResponse({'error':'unhandled'}, status_code=500)
 
-    # 1) /debug/env shows paths and route-file presence
-    _dbg2 = APIRouter(prefix="/debug", tags=["debug"])
-    @_dbg2.get("/env")
-    def debug_env():
-        info = {}
-        try:
-            here = os.path.dirname(__file__)
-            routes_dir = os.path.join(here, "routes")
-            info["__name__"] = __name__
-            info["__file__"] = __file__
-            info["sys_path"] = sys.path
-            info["here"] = here
-            info["routes_dir"] = routes_dir
-            info["routes_dir_exists"] = os.path.isdir(routes_dir)
-            if os.path.isdir(routes_dir):
-                info["routes_list"] = sorted(os.listdir(routes_dir))
-            else:
-                info["routes_list"] = None
-        except Exception as e:
-            info["error"] = str(e)
-        return info
-    app.include_router(_dbg2)
-except Exception:
-    pass
+# Outermost: per-route latency/DB/LLM histograms (/metrics/requests, /metrics/prometheus)
+app.add_middleware(RequestMetricsMiddleware)
 
-# 2) Hard file-loader fallback for routes by explicit file path
-def _load_by_file(pyfile):
-    try:
-        if not os.path.isfile(pyfile):
-            return None
-        name = "dyn_" + os.path.basename(pyfile).replace(".py","")
-        spec = importlib.util.spec_from_file_location(name, pyfile)
-        if not spec or not spec.loader:
-            return None
-        mod = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(mod)
-        return mod
-    except Exception:
-        return None
-
-try:
-    _here = os.path.dirname(__file__)
-    _routes = os.path.join(_here, "routes")
-    for _name in ("builder","admin","monitor"):
-        _py = os.path.join(_routes, f"{_name}.py")
-        _mod = _load_by_file(_py)
-        try:
-            if _mod and hasattr(_mod, "router"):
-                app.include_router(getattr(_mod, "router"))
-        except Exception:
-            pass
-except Exception:
-    pass
-# --- END DEBUG ENV & FILE LOADER ---
-
-
+startup_profile.mark("main_imported")
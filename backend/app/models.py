@@ -1,5 +1,5 @@
 ﻿import datetime as dt
-from sqlalchemy import Integer, String, Float, Boolean, JSON, DateTime, ForeignKey, Numeric
+from sqlalchemy import Integer, String, Float, Boolean, JSON, DateTime, ForeignKey, Numeric, Text, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 
@@ -26,6 +26,8 @@ class Agent(Base):
     owner_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=True, index=True)
     parent_id: Mapped[int] = mapped_column(Integer, ForeignKey('agents.id'), nullable=True, index=True)
     published: Mapped[bool] = mapped_column(Boolean, default=False, index=True)
+    # Materialized count of children with parent_id == id (maintained by /adopt, backfilled by step25 migration)
+    adoption_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
     # Misc spec (MVP)
     spec: Mapped[dict] = mapped_column(JSON, default=dict)
@@ -76,3 +78,96 @@ class Client(Base):
     name: Mapped[str] = mapped_column(String(120), default="")
     role: Mapped[str] = mapped_column(String(32), default="owner")
     created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+# --------------- BotReview (builder review metadata; was /data/bots/<id>/meta.json + safety.txt) ---------------
+class BotReview(Base):
+    __tablename__ = "bot_reviews"
+    # Admin review queue: WHERE review_status = ? ORDER BY submitted_at, agent_id
+    __table_args__ = (Index("idx_bot_reviews_queue", "review_status", "submitted_at", "agent_id"),)
+
+    agent_id: Mapped[int] = mapped_column(Integer, ForeignKey('agents.id', ondelete="CASCADE"), primary_key=True)
+    review_status: Mapped[str] = mapped_column(String(16), default="draft", server_default="draft", nullable=False)
+    admin_name: Mapped[str] = mapped_column(String(120), nullable=True)
+    auto_name_admin: Mapped[str] = mapped_column(String(120), nullable=True)
+    submitted_at: Mapped[int] = mapped_column(Integer, nullable=True)   # epoch seconds, as in meta.json
+    reviewed_at: Mapped[int] = mapped_column(Integer, nullable=True)
+    review_notes: Mapped[str] = mapped_column(Text, nullable=True)
+    safety_score: Mapped[int] = mapped_column(Integer, nullable=True)
+    safety_rating: Mapped[str] = mapped_column(String(16), nullable=True)
+    safety_text: Mapped[str] = mapped_column(Text, default="", server_default="", nullable=False)
+    updated_at: Mapped[dt.datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
+
+# --------------- ReviewCount (admin.summary counters, kept in step with bot_reviews.review_status) ---------------
+class ReviewCount(Base):
+    __tablename__ = "review_counts"
+
+    status: Mapped[str] = mapped_column(String(16), primary_key=True)
+    n: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+
+# --------------- AgentCounter (metrics.stats / admin.summary totals, kept in step with agents) ---------------
+class AgentCounter(Base):
+    __tablename__ = "agent_counters"
+
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    n: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    updated_at: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)   # epoch s
+
+# --------------- Calendar / CalendarBooking (was the in-memory routes.calendar._calendars) ---------------
+class Calendar(Base):
+    __tablename__ = "calendars"
+
+    id: Mapped[str] = mapped_column(String(16), primary_key=True)
+    owner_name: Mapped[str] = mapped_column(String(120))
+    owner_email: Mapped[str] = mapped_column(String(320))
+    timezone: Mapped[str] = mapped_column(String(64), default="America/Los_Angeles")
+    slot_minutes: Mapped[int] = mapped_column(Integer, default=30)
+    work_start_hour: Mapped[int] = mapped_column(Integer, default=9)
+    work_end_hour: Mapped[int] = mapped_column(Integer, default=17)
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class CalendarBooking(Base):
+    __tablename__ = "calendar_bookings"
+    # Range scans per calendar (availability) and incremental index sync (id > last seen).
+    # Unique slot start: with fixed-length grid-aligned bookings this is the cross-worker
+    # double-booking guard (Postgres also gets an overlap exclusion constraint, SQLite a
+    # trigger; see step32_booking_guard.sql / calendar_store.ensure_sqlite_booking_guard).
+    __table_args__ = (
+        Index("uq_calendar_bookings_slot", "calendar_id", "start_min", unique=True),
+        Index("idx_calendar_bookings_cal_id", "calendar_id", "id"),
+        Index("uq_calendar_bookings_idem", "calendar_id", "idempotency_key", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    calendar_id: Mapped[str] = mapped_column(String(16), ForeignKey('calendars.id', ondelete="CASCADE"), nullable=False)
+    name: Mapped[str] = mapped_column(String(120))
+    email: Mapped[str] = mapped_column(String(320))
+    # Minutes since the Unix epoch (UTC); bookings sit on the slot grid, rendered in the calendar's timezone
+    start_min: Mapped[int] = mapped_column(Integer, nullable=False)
+    end_min: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Client-supplied Idempotency-Key header; retries with the same key replay the original booking
+    idempotency_key: Mapped[str] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+# --------------- EmailOutbox (notifier.py: queued mail, delivered by the background worker) ---------------
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    # Worker claim scan: WHERE status = 'pending' AND next_attempt_at <= now ORDER BY id
+    __table_args__ = (
+        Index("idx_email_outbox_due", "status", "next_attempt_at", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    to_email: Mapped[str] = mapped_column(String(320), nullable=False)
+    subject: Mapped[str] = mapped_column(String(300), nullable=False)
+    body: Mapped[str] = mapped_column(Text, nullable=False)
+    # pending -> sending (claimed, lease until locked_until) -> sent | pending (retry) | failed
+    status: Mapped[str] = mapped_column(String(16), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[int] = mapped_column(Integer, nullable=False)   # unix seconds
+    locked_until: Mapped[int] = mapped_column(Integer, nullable=True)
+    claimed_by: Mapped[str] = mapped_column(String(40), nullable=True)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    sent_at: Mapped[int] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -1,29 +1,417 @@
-﻿import os, smtplib
+﻿import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import logging
+import smtplib
 from email.message import EmailMessage
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, and_, or_, func, event
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import EmailOutbox
+
+log = logging.getLogger("app.notifier")
 
 SMTP_HOST = os.getenv("SMTP_HOST", "")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASS = os.getenv("SMTP_PASS", "")
 FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USER or "no-reply@local.test")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1").lower() in ("1", "true", "yes")   # 0 for the debug server
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "20"))
+SMTP_IDLE_S = float(os.getenv("SMTP_IDLE_S", "60"))                  # drop the pooled session after this idle time
+SMTP_MAX_PER_SESSION = int(os.getenv("SMTP_MAX_PER_SESSION", "200"))  # reconnect after N messages (server limits)
+
+# ---- Outbox worker (env) ---------------------------------------------------------------
+NOTIFIER_WORKER = os.getenv("NOTIFIER_WORKER", "1").lower() in ("1", "true", "yes")   # deliver from this process
+NOTIFIER_BATCH = int(os.getenv("NOTIFIER_BATCH", "50"))
+NOTIFIER_POLL_S = float(os.getenv("NOTIFIER_POLL_S", "5"))
+NOTIFIER_MAX_ATTEMPTS = int(os.getenv("NOTIFIER_MAX_ATTEMPTS", "8"))
+NOTIFIER_BACKOFF_S = float(os.getenv("NOTIFIER_BACKOFF_S", "30"))
+NOTIFIER_BACKOFF_MAX_S = float(os.getenv("NOTIFIER_BACKOFF_MAX_S", "3600"))
+NOTIFIER_LEASE_S = int(os.getenv("NOTIFIER_LEASE_S", "300"))         # a crashed worker's claim expires after this
+
+# ---- Delivery model ------------------------------------------------------------------------
+# Requests never talk SMTP. enqueue() stages an email_outbox row in the caller's transaction
+# (so a booking and its confirmation commit together); after that commit the worker is woken.
+# The worker (one asyncio task per process, started in main.lifespan) claims due rows in
+# batches (FOR UPDATE SKIP LOCKED on Postgres, a claim token elsewhere), sends them over one
+# long-lived authenticated SMTP session in a thread, and records sent / retry with
+# exponential backoff + jitter / failed. 5xx replies fail the message immediately.
+# Connection-level errors defer the rest of the batch. Each outcome is committed right after
+# its send, together with a lease renewal for the rows still claimed, so a crash repeats at
+# most the message in flight and a slow batch isn't reclaimed by another worker mid-way.
+# Local stand-in: python -m app.notifier debug-smtp 1025  (then SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_STARTTLS=0)
+
+
+def enqueue(db: Session, to_email: str, subject: str, body: str) -> Optional[EmailOutbox]:
+    """Stage a message in the caller's transaction; it is delivered only if that transaction commits."""
+    if not to_email:
+        return None
+    row = EmailOutbox(to_email=to_email, subject=subject[:300], body=body or "", status="pending",
+                      attempts=0, next_attempt_at=int(time.time()))
+    db.add(row)
+    db.info["notifier_wake"] = True
+    return row
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop("notifier_wake", False):
+        outbox_worker.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop("notifier_wake", None)
+
 
 def send_email(to_email: str, subject: str, body: str) -> bool:
-    if not SMTP_HOST or not FROM_EMAIL or not to_email:
-        print(f"[NOTIFIER] (no SMTP configured) To: {to_email} | Subject: {subject}\n{body}")
-        return True
+    """Queue one message in its own transaction (kept for callers outside a request session)."""
+    db = SessionLocal()
     try:
-        msg = EmailMessage()
-        msg["From"] = FROM_EMAIL
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.set_content(body)
-
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-            s.starttls()
-            if SMTP_USER and SMTP_PASS:
-                s.login(SMTP_USER, SMTP_PASS)
-            s.send_message(msg)
+        enqueue(db, to_email, subject, body)
+        db.commit()
         return True
     except Exception as e:
-        print("[NOTIFIER] error:", e)
+        log.warning("could not queue email to %s: %s", to_email, e)
+        db.rollback()
         return False
+    finally:
+        db.close()
+
+
+def build_message(to_email: str, subject: str, body: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = FROM_EMAIL
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content(body)
+    return msg
+
+
+# ---- Pooled SMTP session ------------------------------------------------------------------
+class SMTPSession:
+    """One connected + STARTTLS + logged-in smtplib.SMTP reused across messages (not thread-safe)."""
+
+    def __init__(self):
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._used = 0
+        self._last = 0.0
+        self.connects = 0
+        self.sent = 0
+
+    def _open(self) -> smtplib.SMTP:
+        s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            if SMTP_STARTTLS:
+                s.starttls()
+            if SMTP_USER and SMTP_PASS:
+                s.login(SMTP_USER, SMTP_PASS)
+        except Exception:
+            s.close()
+            raise
+        self._smtp, self._used = s, 0
+        self.connects += 1
+        return s
+
+    def idle(self) -> bool:
+        return self._smtp is not None and time.monotonic() - self._last > SMTP_IDLE_S
+
+    def send(self, msg: EmailMessage) -> None:
+        if self._smtp is not None and (self._used >= SMTP_MAX_PER_SESSION or self.idle()):
+            self.close()
+        fresh = self._smtp is None
+        s = self._smtp or self._open()
+        try:
+            s.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # the server dropped a reused connection; one retry on a new one
+            self.close()
+            if fresh:
+                raise
+            self._open().send_message(msg)
+        self._used += 1
+        self._last = time.monotonic()
+        self.sent += 1
+
+    def close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+        self._smtp = None
+        self._used = 0
+
+
+# ---- Outbox worker -------------------------------------------------------------------------
+def backoff_s(attempts: int) -> float:
+    return min(NOTIFIER_BACKOFF_MAX_S, NOTIFIER_BACKOFF_S * 2 ** max(0, attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+def _permanent(e: Exception) -> bool:
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        return False   # a config problem: keep the mail until credentials are fixed
+    return isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500
+
+
+def _connection_error(e: Exception) -> bool:
+    return isinstance(e, (OSError, smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                          smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError, smtplib.SMTPNotSupportedError))
+
+
+def _lease_s() -> int:
+    # Must outlast one message: connect, STARTTLS, login and a resend after a dropped session
+    return max(NOTIFIER_LEASE_S, int(5 * SMTP_TIMEOUT))
+
+
+def _finish(db: Session, token: str) -> None:
+    """Commit the outcomes so far and extend the lease on the batch's unsent rows."""
+    db.flush()
+    db.execute(update(EmailOutbox).where(EmailOutbox.claimed_by == token, EmailOutbox.status == "sending")
+               .values(locked_until=int(time.time()) + _lease_s()).execution_options(synchronize_session=False))
+    db.commit()
+
+
+def claim(db: Session, token: str, limit: int, now: int) -> List[EmailOutbox]:
+    """Mark up to `limit` due rows as sending under `token` (committed) and return them."""
+    due = or_(and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+              and_(EmailOutbox.status == "sending", EmailOutbox.locked_until < now))
+    ids = select(EmailOutbox.id).where(due).order_by(EmailOutbox.id).limit(limit)
+    if db.get_bind().dialect.name == "postgresql":
+        ids = ids.with_for_update(skip_locked=True)
+    db.execute(update(EmailOutbox).where(EmailOutbox.id.in_(ids), due)
+               .values(status="sending", claimed_by=token, locked_until=now + _lease_s())
+               .execution_options(synchronize_session=False))
+    db.commit()
+    return db.execute(select(EmailOutbox).where(EmailOutbox.claimed_by == token, EmailOutbox.status == "sending")
+                      .order_by(EmailOutbox.id)).scalars().all()
+
+
+class OutboxWorker:
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.smtp = SMTPSession()
+        self._batches = 0
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.counts: Dict[str, int] = {"sent": 0, "retried": 0, "failed": 0, "deferred": 0}
+        self.last_error: Optional[str] = None
+
+    async def start(self) -> None:
+        if not NOTIFIER_WORKER or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="notifier-outbox")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._loop = None
+        await asyncio.to_thread(self.smtp.close)
+
+    def wake(self) -> None:
+        # called from request threads after a commit that queued mail
+        loop, ev = self._loop, self._wake
+        if loop is not None and ev is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(ev.set)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                n = await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                log.exception("outbox batch failed")
+                self.last_error, n = str(e), 0
+            if n >= NOTIFIER_BATCH:
+                continue   # more may be due right away
+            if self.smtp.idle():
+                await asyncio.to_thread(self.smtp.close)
+            try:
+                await asyncio.wait_for(self._wake.wait(), NOTIFIER_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def run_once(self, limit: int = NOTIFIER_BATCH) -> int:
+        """Claim and deliver one batch (blocking); returns how many rows were claimed."""
+        self._batches += 1
+        now = int(time.time())
+        # Rows stay loaded across the per-message commits
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            token = f"{self.worker_id}:{self._batches}"
+            rows = claim(db, token, limit, now)
+            self._deliver(db, token, rows, now)
+            return len(rows)
+        finally:
+            db.close()
+
+    def _deliver(self, db: Session, token: str, rows: List[EmailOutbox], now: int) -> None:
+        for i, r in enumerate(rows):
+            try:
+                if SMTP_HOST:
+                    self.smtp.send(build_message(r.to_email, r.subject, r.body))
+                else:
+                    log.info("(no SMTP configured) To: %s | Subject: %s\n%s", r.to_email, r.subject, r.body)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                r.attempts += 1
+                r.last_error = self.last_error[:2000]
+                r.claimed_by = r.locked_until = None
+                if _permanent(e) or r.attempts >= NOTIFIER_MAX_ATTEMPTS:
+                    r.status = "failed"
+                    self.counts["failed"] += 1
+                    log.warning("email %s to %s failed permanently: %s", r.id, r.to_email, self.last_error)
+                else:
+                    r.status, r.next_attempt_at = "pending", now + int(backoff_s(r.attempts))
+                    self.counts["retried"] += 1
+                if _connection_error(e):
+                    # the server is unreachable for everyone; put the rest back without spending attempts
+                    self.smtp.close()
+                    for rest in rows[i + 1:]:
+                        rest.status, rest.next_attempt_at = "pending", r.next_attempt_at or now
+                        rest.claimed_by = rest.locked_until = None
+                    _finish(db, token)
+                    self.counts["deferred"] += len(rows) - i - 1
+                    return
+                _finish(db, token)
+                continue
+            r.status, r.sent_at, r.last_error = "sent", int(time.time()), None
+            r.claimed_by = r.locked_until = None
+            _finish(db, token)
+            self.counts["sent"] += 1
+
+    def stats(self, db: Session) -> dict:
+        queue = {s: int(n) for s, n in db.execute(select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status))}
+        due = db.execute(select(func.count()).where(EmailOutbox.status == "pending",
+                                                    EmailOutbox.next_attempt_at <= int(time.time()))).scalar()
+        return {
+            "worker": self.worker_id if self._task is not None else None,
+            "queue": queue,
+            "due_now": int(due or 0),
+            "smtp_connects": self.smtp.connects,
+            "smtp_sent": self.smtp.sent,
+            **self.counts,
+            "last_error": self.last_error,
+        }
+
+
+outbox_worker = OutboxWorker()
+
+
+# ---- Local SMTP stand-in ----------------------------------------------------------------------
+class DebugSMTPServer:
+    """
+    Minimal SMTP sink for dev/tests (no TLS, no AUTH): keeps every message in .messages and
+    optionally prints it. latency_s delays each reply to mimic a remote server.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025, echo: bool = True, latency_s: float = 0.0):
+        self.host, self.port, self.echo, self.latency_s = host, port, echo, latency_s
+        self.messages: List[Tuple[str, List[str], bytes]] = []
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> "DebugSMTPServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self) -> None:
+        await (self._server or (await self.start())._server).serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+
+        async def reply(*lines: str) -> None:
+            if self.latency_s:
+                await asyncio.sleep(self.latency_s)
+            writer.write(b"".join(line.encode() + b"\r\n" for line in lines))
+            await writer.drain()
+
+        mail_from, rcpts = "", []
+        await reply("220 debug-smtp ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                cmd = line.decode("utf-8", "replace").strip()
+                verb = cmd[:4].upper()
+                arg = cmd.partition(":")[2].strip().split(" ")[0].strip("<>")
+                if verb == "EHLO":
+                    await reply("250-debug-smtp", "250-8BITMIME", "250 SIZE 10485760")
+                elif verb == "HELO":
+                    await reply("250 debug-smtp")
+                elif verb == "MAIL":
+                    mail_from, rcpts = arg, []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    rcpts.append(arg)
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk.rstrip(b"\r\n") == b".":
+                            break
+                        data.append(chunk[1:] if chunk.startswith(b".") else chunk)
+                    self.messages.append((mail_from, rcpts, b"".join(data)))
+                    if self.echo:
+                        print(f"---- debug-smtp: {mail_from} -> {', '.join(rcpts)}\n{b''.join(data).decode('utf-8', 'replace')}")
+                    mail_from, rcpts = "", []
+                    await reply("250 OK queued")
+                elif verb in ("RSET", "NOOP"):
+                    if verb == "RSET":
+                        mail_from, rcpts = "", []
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+
+if __name__ == "__main__":
+    # python -m app.notifier debug-smtp [PORT]   local SMTP sink
+    # python -m app.notifier drain               deliver everything due now, then exit
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "debug-smtp":
+        srv = DebugSMTPServer(port=int(sys.argv[2]) if len(sys.argv) > 2 else 1025)
+        print(f"debug SMTP on {srv.host}:{srv.port}")
+        asyncio.run(srv.serve_forever())
+    elif cmd == "drain":
+        total = 0
+        while True:
+            n = outbox_worker.run_once()
+            total += n
+            if n < NOTIFIER_BATCH:
+                break
+        outbox_worker.smtp.close()
+        print({"claimed": total, **outbox_worker.counts})
+    else:
+        print("usage: python -m app.notifier debug-smtp [PORT] | drain")
@@ -0,0 +1,133 @@
+﻿import json
+import base64
+import datetime as dt
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Agent
+
+# ---- Keyset (cursor) pagination for Agent listings ----------------------------------
+# Each sort mode is (sort column, direction); Agent.id breaks ties so the key is unique.
+# The cursor is an opaque base64 JSON {"s": sort, "k": [key, id]} for the last row served;
+# the next page is WHERE (key, id) </> (:key, :id) instead of OFFSET, so deep pages cost the
+# same as the first one. Indexes backing each order: step27_keyset_indexes.sql.
+# Sorts that aren't a column (store relevance) fall back to an offset cursor {"s", "o"}.
+
+SORTS = {
+    "created_desc": (Agent.created_at, "desc"),
+    "created_asc": (Agent.created_at, "asc"),
+    "name_asc": (Agent.name, "asc"),
+    "name_desc": (Agent.name, "desc"),
+    "id_desc": (Agent.id, "desc"),
+}
+
+TOTAL_MODES = ("exact", "estimate", "none")
+
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if not isinstance(data, dict) or data.get("s") != sort:
+        raise HTTPException(status_code=400, detail="cursor does not match sort")
+    return data
+
+
+def _seek_key(col, v: Any, dialect: str):
+    if col is not Agent.created_at or not isinstance(v, str):
+        return col, v
+    if dialect == "sqlite":
+        # SQLite keeps timestamps as text and server_default rows lack the ".ffffff" a bound
+        # datetime gets, so equal instants would compare unequal; compare as julian days instead.
+        return func.julianday(col), func.julianday(v.replace("T", " "))
+    return col, dt.datetime.fromisoformat(v)
+
+
+def _row_key(row, col) -> list:
+    v = getattr(row, col.key)
+    return [v.isoformat() if isinstance(v, dt.datetime) else v, row.id]
+
+
+def order_and_seek(stmt, sort: str, cursor: Optional[str], dialect: str = ""):
+    """ORDER BY the keyset for `sort` and, given a cursor, seek past its row."""
+    col, direction = SORTS[sort]
+    if col is Agent.id:
+        stmt = stmt.order_by(Agent.id.desc() if direction == "desc" else Agent.id.asc())
+    elif direction == "desc":
+        stmt = stmt.order_by(col.desc(), Agent.id.desc())
+    else:
+        stmt = stmt.order_by(col.asc(), Agent.id.asc())
+    if cursor:
+        k = decode_cursor(cursor, sort).get("k")
+        if not isinstance(k, list) or len(k) != 2:
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        if col is Agent.id:
+            stmt = stmt.where(Agent.id < k[1] if direction == "desc" else Agent.id > k[1])
+        else:
+            key, value = _seek_key(col, k[0], dialect)
+            left, right = tuple_(key, Agent.id), tuple_(value, k[1])
+            stmt = stmt.where(left < right if direction == "desc" else left > right)
+    return stmt
+
+
+async def fetch_page(db: AsyncSession, stmt, sort: str, size: int, cursor: Optional[str] = None,
+                     page: int = 1, scalars: bool = True) -> Tuple[List[Any], Optional[str]]:
+    """
+    One page of rows from `stmt` (a select over Agent; ORM objects, or Row tuples with
+    scalars=False, which must include the sort column and id) plus the cursor for the next page.
+    Without a cursor, legacy page/size is honoured via OFFSET; the returned cursor lets clients
+    switch to keyset from there.
+    """
+    stmt = order_and_seek(stmt, sort, cursor, db.bind.dialect.name)
+    if not cursor and page > 1:
+        stmt = stmt.offset((page - 1) * size)
+    res = await db.execute(stmt.limit(size + 1))
+    rows = (res.scalars() if scalars else res).all()
+    more = len(rows) > size
+    rows = rows[:size]
+    nxt = encode_cursor({"s": sort, "k": _row_key(rows[-1], SORTS[sort][0])}) if more and rows else None
+    return rows, nxt
+
+
+async def fetch_offset_page(db: AsyncSession, stmt, sort: str, size: int, cursor: Optional[str] = None,
+                            page: int = 1, scalars: bool = True) -> Tuple[List[Any], Optional[str]]:
+    """Same contract as fetch_page for orders that aren't a column (stmt must already be ordered)."""
+    offset = int(decode_cursor(cursor, sort).get("o", 0)) if cursor else (page - 1) * size
+    res = await db.execute(stmt.offset(max(0, offset)).limit(size + 1))
+    rows = (res.scalars() if scalars else res).all()
+    more = len(rows) > size
+    return rows[:size], encode_cursor({"s": sort, "o": offset + size}) if more else None
+
+
+# ---- Totals -------------------------------------------------------------------------
+async def _estimate(db: AsyncSession, stmt) -> Optional[int]:
+    # Postgres planner row estimate: no scan, accurate enough for "about N results"
+    if db.bind.dialect.name != "postgresql":
+        return None
+    compiled = stmt.compile(dialect=db.bind.dialect)
+    conn = await db.connection()
+    plan = (await conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def count_total(db: AsyncSession, stmt, mode: str = "exact") -> Tuple[Optional[int], bool]:
+    """(total, exact) for `stmt` before ordering/paging. 'estimate' is exact where no planner estimate exists."""
+    if mode == "none":
+        return None, False
+    if mode == "estimate":
+        n = await _estimate(db, stmt)
+        if n is not None:
+            return n, False
+    n = (await db.execute(select(func.count()).select_from(stmt.subquery()))).scalar() or 0
+    return int(n), True
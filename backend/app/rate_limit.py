@@ -0,0 +1,205 @@
+﻿import os
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+# ---- Config (env) -----------------------------------------------------------
+def _per_model(name: str) -> Dict[str, float]:
+    # "gpt-4o=500,gpt-4o-mini=5000" -> {"gpt-4o": 500.0, ...}
+    return {
+        k.strip(): float(v)
+        for k, v in (p.split("=", 1) for p in os.getenv(name, "").split(",") if "=" in p)
+    }
+
+LLM_RPM_DEFAULT = float(os.getenv("LLM_RPM_DEFAULT", "500"))          # requests / minute
+LLM_TPM_DEFAULT = float(os.getenv("LLM_TPM_DEFAULT", "200000"))       # tokens / minute
+LLM_RPM = _per_model("LLM_RPM")
+LLM_TPM = _per_model("LLM_TPM")
+LLM_MODEL_CONCURRENCY_DEFAULT = int(os.getenv("LLM_MODEL_CONCURRENCY_DEFAULT", "16"))
+LLM_MODEL_CONCURRENCY = {k: int(v) for k, v in _per_model("LLM_MODEL_CONCURRENCY").items()}
+LLM_LATENCY_TARGET_MS = float(os.getenv("LLM_LATENCY_TARGET_MS", "8000"))
+LLM_QUEUE_DEADLINE_S = float(os.getenv("LLM_QUEUE_DEADLINE_S", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "20"))
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class RateLimited(Exception):
+    """Upstream capacity couldn't be obtained before the queue deadline."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuous-refill bucket: `rate_per_min` units/minute, holding at most one minute of burst."""
+
+    def __init__(self, rate_per_min: float):
+        self.rate = max(rate_per_min, 1e-6) / 60.0
+        self.capacity = max(rate_per_min, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        # Correct an estimate once the real usage is known (may go negative = debt).
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class ModelLimiter:
+    """
+    Per-model admission: requests/minute + tokens/minute buckets, a shared cooldown set by
+    Retry-After, and an AIMD concurrency limit (halve on 429 or slow replies, +1/limit per
+    success) bounded by LLM_MODEL_CONCURRENCY. Decreases happen at most once per congestion
+    window: a call that started before the last decrease was already in flight under the old
+    limit, so its 429 or slow reply doesn't cut the limit again.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.rpm = TokenBucket(LLM_RPM.get(model, LLM_RPM_DEFAULT))
+        self.tpm = TokenBucket(LLM_TPM.get(model, LLM_TPM_DEFAULT))
+        self.max_limit = float(LLM_MODEL_CONCURRENCY.get(model, LLM_MODEL_CONCURRENCY_DEFAULT))
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.decreased_at = 0.0
+        self._cond = asyncio.Condition()
+        self.admitted = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.wait_s = 0.0
+        self.queued = 0
+
+    def _admit_delay(self, tokens: float) -> float:
+        delay = max(0.0, self.cooldown_until - time.monotonic())
+        if self.in_flight >= max(1, int(self.limit)):
+            delay = max(delay, 0.05)
+        return max(delay, self.rpm.wait_time(1), self.tpm.wait_time(tokens))
+
+    async def acquire(self, tokens: float, deadline: float) -> None:
+        t0 = time.monotonic()
+        self.queued += 1
+        try:
+            async with self._cond:
+                while True:
+                    delay = self._admit_delay(tokens)
+                    if delay <= 0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise RateLimited(f"{self.model}: queue deadline exceeded", retry_after=max(1.0, delay))
+                    try:
+                        # Woken early on release(); otherwise re-check when the buckets should have refilled.
+                        await asyncio.wait_for(self._cond.wait(), timeout=min(delay, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+                self.rpm.take(1)
+                self.tpm.take(tokens)
+                self.in_flight += 1
+                self.admitted += 1
+        finally:
+            self.queued -= 1
+            self.wait_s += time.monotonic() - t0
+
+    async def release(self) -> None:
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    @asynccontextmanager
+    async def slot(self, tokens: float, deadline: float):
+        await self.acquire(tokens, deadline)
+        try:
+            yield
+        finally:
+            await self.release()
+
+    def _decrease(self, factor: float, latency_ms: float) -> None:
+        now = time.monotonic()
+        if now - latency_ms / 1000 < self.decreased_at:
+            return
+        self.limit = max(1.0, self.limit * factor)
+        self.decreased_at = now
+
+    def feedback(self, status: int, latency_ms: float) -> None:
+        if status == 429:
+            self.throttled += 1
+            self._decrease(0.5, latency_ms)
+        elif status < 400 and latency_ms > LLM_LATENCY_TARGET_MS:
+            self._decrease(0.9, latency_ms)
+        elif status < 400:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def cooldown(self, seconds: float) -> None:
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rpm_available": round(self.rpm.tokens, 1),
+            "tpm_available": round(self.tpm.tokens, 1),
+            "cooldown_s": round(max(0.0, self.cooldown_until - time.monotonic()), 3),
+            "admitted": self.admitted,
+            "throttled_429": self.throttled,
+            "queue_timeouts": self.timeouts,
+            "avg_wait_ms": round(1000 * self.wait_s / self.admitted, 3) if self.admitted else 0.0,
+        }
+
+
+_limiters: Dict[str, ModelLimiter] = {}
+
+def limiter_for(model: str) -> ModelLimiter:
+    lim = _limiters.get(model)
+    if lim is None:
+        lim = _limiters[model] = ModelLimiter(model)
+    return lim
+
+def limiter_stats() -> dict:
+    return {m: lim.stats() for m, lim in _limiters.items()}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Retry-After when the provider sends one (plus a little jitter), else full-jitter exponential backoff."""
+    if retry_after is not None:
+        return min(LLM_BACKOFF_MAX_S, retry_after) + random.uniform(0, LLM_BACKOFF_BASE_S)
+    return random.uniform(0, min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * (2 ** attempt)))
+
+def estimate_payload_tokens(payload: dict) -> float:
+    chars = sum(len(str(m.get("content", ""))) for m in payload.get("messages", []))
+    return chars / 4.0 + float(payload.get("max_tokens") or 0)
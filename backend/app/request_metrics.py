@@ -0,0 +1,181 @@
+﻿import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .histogram import LogHistogram
+
+# ---- Request instrumentation ------------------------------------------------------------
+# RequestMetricsMiddleware is a plain ASGI middleware (no BaseHTTPMiddleware task/stream
+# overhead). Each HTTP request gets a _Timings holder in a ContextVar. SQLAlchemy cursor
+# events add DB time to it and LLMTransport.host_slot adds LLM time (upstream wait included).
+# Sync endpoints run in the threadpool with a copy of the context, which still points at
+# the same holder. When the response finishes, total/DB/LLM ms go into LogHistograms keyed
+# by (method, route template, status), so ids in paths never create new series. The
+# snapshot is served as JSON at /metrics/requests and as Prometheus text at /metrics/prometheus.
+
+REQUEST_METRICS = os.getenv("REQUEST_METRICS", "1").lower() in ("1", "true", "yes")
+# Prometheus `le` bounds in seconds, cut from the log-spaced buckets (exact at these bounds)
+PROM_BUCKETS_S = tuple(float(b) for b in os.getenv(
+    "PROM_BUCKETS_S", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",") if b.strip())
+
+UNMATCHED = "<unmatched>"
+
+
+class _Timings:
+    __slots__ = ("db_ms", "db_queries", "llm_ms", "llm_calls")
+
+    def __init__(self):
+        self.db_ms = 0.0
+        self.db_queries = 0
+        self.llm_ms = 0.0
+        self.llm_calls = 0
+
+
+_current: ContextVar[Optional[_Timings]] = ContextVar("request_timings", default=None)
+
+
+def add_llm_time(ms: float) -> None:
+    t = _current.get()
+    if t is not None:
+        t.llm_ms += ms
+        t.llm_calls += 1
+
+
+# Every engine (the sync one and the async engine's sync_engine) reports through Engine events
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._rm_t0 = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    t0 = getattr(context, "_rm_t0", None)
+    t = _current.get()
+    if t0 is not None and t is not None:
+        t.db_ms += 1000 * (time.perf_counter() - t0)
+        t.db_queries += 1
+
+
+class _RouteStats:
+    __slots__ = ("latency", "db", "llm", "db_queries", "llm_calls")
+
+    def __init__(self):
+        self.latency = LogHistogram()       # ms
+        self.db = LogHistogram()
+        self.llm = LogHistogram()
+        self.db_queries = 0
+        self.llm_calls = 0
+
+
+class RequestMetrics:
+    """Per (method, route, status) histograms. Recorded on the event loop thread only."""
+
+    def __init__(self):
+        self.series: Dict[Tuple[str, str, str], _RouteStats] = {}
+        self.in_flight = 0
+
+    def record(self, method: str, route: str, status: int, total_ms: float, t: _Timings) -> None:
+        key = (method, route, str(status))
+        st = self.series.get(key)
+        if st is None:
+            st = self.series[key] = _RouteStats()
+        st.latency.record(total_ms)
+        st.db.record(t.db_ms)
+        st.llm.record(t.llm_ms)
+        st.db_queries += t.db_queries
+        st.llm_calls += t.llm_calls
+
+    def snapshot(self, route_prefix: str = "") -> Dict:
+        rows = []
+        for (method, route, status), st in sorted(self.series.items()):
+            if not route.startswith(route_prefix):
+                continue
+            rows.append({"method": method, "route": route, "status": int(status), "count": st.latency.count,
+                         "latency_ms": st.latency.snapshot(), "db_ms": st.db.snapshot(), "llm_ms": st.llm.snapshot(),
+                         "db_queries": st.db_queries, "llm_calls": st.llm_calls})
+        return {"in_flight": self.in_flight, "series": rows}
+
+    def prometheus(self) -> str:
+        lines: List[str] = [
+            "# HELP http_requests_in_flight Requests currently being served by this worker.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+        ]
+        items = sorted(self.series.items())
+        for name, attr, help_ in (
+                ("http_request_duration_seconds", "latency", "Request latency by route template, method and status."),
+                ("http_request_db_seconds", "db", "Time spent in DB cursor execution per request."),
+                ("http_request_llm_seconds", "llm", "Time spent in upstream LLM calls per request (summed over calls).")):
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route, status), st in items:
+                h: LogHistogram = getattr(st, attr)
+                labels = f'method="{method}",route="{_escape(route)}",status="{status}"'
+                for le in PROM_BUCKETS_S:
+                    lines.append(f'{name}_bucket{{{labels},le="{le:g}"}} {h.count_le(le * 1000)}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"{name}_sum{{{labels}}} {h.total / 1000:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {h.count}")
+        for name, attr, help_ in (
+                ("http_request_db_queries_total", "db_queries", "DB statements executed while serving requests."),
+                ("http_request_llm_calls_total", "llm_calls", "Upstream LLM calls made while serving requests.")):
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} counter")
+            for (method, route, status), st in items:
+                lines.append(f'{name}{{method="{method}",route="{_escape(route)}",status="{status}"}} {getattr(st, attr)}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        self.series.clear()
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_metrics = RequestMetrics()
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    # Mounts (static files) set endpoint and root_path but no route
+    if scope.get("endpoint") is not None and scope.get("root_path"):
+        return scope["root_path"]
+    return UNMATCHED
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REQUEST_METRICS:
+            await self.app(scope, receive, send)
+            return
+        timings = _Timings()
+        token = _current.set(timings)
+        status = 500
+        request_metrics.in_flight += 1
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            total_ms = 1000 * (time.perf_counter() - t0)
+            request_metrics.in_flight -= 1
+            _current.reset(token)
+            request_metrics.record(scope["method"], _route_template(scope), status, total_ms, timings)
@@ -1,8 +1,15 @@
-﻿from fastapi import APIRouter, Depends, HTTPException
+﻿import time
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..db import get_db, get_current_user
-from ..models import Agent
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_
+from ..db import get_db, get_async_db, get_current_user
+from ..models import Agent, AuditLog, BotReview, ReviewCount
+from ..pagination import fetch_page, encode_cursor, decode_cursor
+from .. import bot_reviews
+from ..agent_counters import counter_cache
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -14,13 +21,73 @@ def _ensure_admin(user):
 @router.get("/summary")
 def summary(db: Session = Depends(get_db), user = Depends(get_current_user)):
     _ensure_admin(user)
-    total_agents = db.query(func.count(Agent.id)).scalar() or 0
-    published    = db.query(func.count(Agent.id)).filter(Agent.published==True).scalar() or 0
-    owners       = db.query(func.count(func.distinct(Agent.owner_id))).scalar() or 0
-    return {"agents_total": int(total_agents), "agents_published": int(published), "owners": int(owners)}
+    # agent_counters (incremental, reconciled) behind a short TTL cache; no scan of agents
+    c = counter_cache.get(db)
+    return {"agents_total": c["agents_total"], "agents_published": c["agents_published"], "owners": c["owners"],
+            "review": bot_reviews.review_counts(db)}
 
 @router.get("/bots")
-def bots(db: Session = Depends(get_db), user = Depends(get_current_user)):
+async def bots(
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=200),
+    cursor: str = Query("", description="next_cursor from the previous page (replaces page)"),
+    db: AsyncSession = Depends(get_async_db),
+    user = Depends(get_current_user),
+):
     _ensure_admin(user)
-    rows = db.query(Agent.id, Agent.name, Agent.published).order_by(Agent.id.desc()).limit(50).all()
-    return {"items": [{"id": r[0], "name": r[1], "published": bool(r[2])} for r in rows]}
+    base = select(Agent.id, Agent.name, Agent.published)
+    rows, nxt = await fetch_page(db, base, "id_desc", size, cursor, page, scalars=False)
+    return {"items": [{"id": r[0], "name": r[1], "published": bool(r[2])} for r in rows],
+            "page": page, "size": size, "next_cursor": nxt}
+
+# ---- Review queue ---------------------------------------------------------------------
+# Oldest submission first, keyset on (submitted_at, agent_id) over idx_bot_reviews_queue.
+QUEUE_STATUSES = ("submitted", "approved", "rejected")
+DECISIONS = {"approve": "approved", "reject": "rejected"}
+
+@router.get("/review-queue")
+async def review_queue(
+    status: str = Query("submitted", description="submitted | approved | rejected"),
+    size: int = Query(50, ge=1, le=200),
+    cursor: str = Query("", description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+    user = Depends(get_current_user),
+):
+    _ensure_admin(user)
+    if status not in QUEUE_STATUSES:
+        raise HTTPException(status_code=400, detail="invalid status")
+    q = (select(BotReview.agent_id, BotReview.submitted_at, BotReview.auto_name_admin, BotReview.admin_name,
+                BotReview.safety_score, BotReview.safety_rating, BotReview.reviewed_at, Agent.name, Agent.owner_id)
+         .join(Agent, Agent.id == BotReview.agent_id)
+         .where(BotReview.review_status == status)
+         .order_by(BotReview.submitted_at.asc(), BotReview.agent_id.asc()))
+    if cursor:
+        k = decode_cursor(cursor, status).get("k")
+        if not isinstance(k, list) or len(k) != 2:
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        q = q.where(tuple_(BotReview.submitted_at, BotReview.agent_id) > tuple_(k[0], k[1]))
+    rows = (await db.execute(q.limit(size + 1))).all()
+    nxt = encode_cursor({"s": status, "k": [rows[size - 1].submitted_at, rows[size - 1].agent_id]}) if len(rows) > size else None
+    total = (await db.execute(select(ReviewCount.n).where(ReviewCount.status == status))).scalar() or 0
+    items = [{"bot_id": r.agent_id, "name": r.name or "", "owner_id": r.owner_id, "auto_name_admin": r.auto_name_admin,
+              "admin_name": r.admin_name, "safety_score": r.safety_score, "safety_rating": r.safety_rating,
+              "submitted_at": r.submitted_at, "reviewed_at": r.reviewed_at} for r in rows[:size]]
+    return {"items": items, "status": status, "size": size, "total": int(total), "next_cursor": nxt}
+
+class DecideBody(BaseModel):
+    bot_ids: List[int] = Field(..., min_length=1, max_length=500)
+    decision: str = Field(..., description="approve | reject")
+    notes: Optional[str] = None
+
+@router.post("/review-queue/decide")
+def review_decide(body: DecideBody, db: Session = Depends(get_db), user = Depends(get_current_user)):
+    _ensure_admin(user)
+    status = DECISIONS.get(body.decision)
+    if not status:
+        raise HTTPException(status_code=400, detail="decision must be approve or reject")
+    changed = bot_reviews.decide(db, body.bot_ids, status, body.notes, int(time.time()))
+    db.add_all([AuditLog(event_type=f"review_{status}", actor_user_id=user["id"], bot_id=i,
+                         payload={"status": status, "notes": body.notes}) for i in changed])
+    db.commit()
+    skipped = sorted(set(body.bot_ids) - set(changed))
+    return {"decision": status, "updated": sorted(changed), "skipped_not_submitted": skipped}
@@ -1,7 +1,9 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy import update
 from ..db import get_db
 from ..models import Agent, AuditLog
+from .. import agent_counters
 
 router = APIRouter(prefix="/adopt", tags=["adoption"])
 
@@ -21,6 +23,9 @@ def adopt(bot_id: int, db: Session = Depends(get_db)):
     )
     db.add(child)
     db.flush()
+    agent_counters.on_created(db, child)
+    # Atomic in-DB increment so concurrent adoptions don't lose updates
+    db.execute(update(Agent).where(Agent.id==parent.id).values(adoption_count=Agent.adoption_count + 1))
     db.add(AuditLog(event_type="adopt", bot_id=parent.id, payload={"child_id": child.id}))
     db.commit()
     return {"parent_id": parent.id, "child_id": child.id}
@@ -1,12 +1,19 @@
-﻿import os, json, re, time
+﻿import os, re, time
 from typing import Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from ..db import get_db, get_current_user_optional
+from ..cards import card_cache
 from ..models import Agent
+from .. import agent_counters, bot_reviews, notifier
 
 router = APIRouter(prefix="/builder", tags=["builder"])
 
+# Review-submission alerts; no default, so nothing is sent unless it is configured
+ADMIN_ALERT_EMAIL = os.getenv("ADMIN_ALERT_EMAIL", "").strip()
+
 TONES = [
   "concise-helpful","friendly","professional","empathetic","motivational",
   "creative","analytical","critical","casual","humorous",
@@ -14,28 +21,6 @@ TONES = [
 ]
 HIDDEN_TONE = "silent"
 
-DATA_DIR = os.environ.get("APP_DATA_DIR", "/data")
-os.makedirs(DATA_DIR, exist_ok=True)
-
-def _bot_dir(bot_id:int)->str:
-    p = os.path.join(DATA_DIR, "bots", str(bot_id)); os.makedirs(p, exist_ok=True); return p
-def _meta_path(bot_id:int)->str: return os.path.join(_bot_dir(bot_id), "meta.json")
-def _safety_path(bot_id:int)->str: return os.path.join(_bot_dir(bot_id), "safety.txt")
-
-def _load_meta(bot_id:int)->Dict[str,Any]:
-    try:
-        with open(_meta_path(bot_id),"r",encoding="utf-8") as f: return json.load(f)
-    except Exception: return {}
-def _save_meta(bot_id:int, obj:Dict[str,Any])->None:
-    mp = _meta_path(bot_id); tmp = mp + ".tmp"
-    with open(tmp,"w",encoding="utf-8") as f: json.dump(obj, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, mp)
-def _write_safety(bot_id:int, text:str)->None:
-    with open(_safety_path(bot_id),"w",encoding="utf-8") as f: f.write(text or "")
-def _read_safety(bot_id:int)->str:
-    try:
-        with open(_safety_path(bot_id),"r",encoding="utf-8") as f: return f.read()
-    except Exception: return ""
 def _now()->int: return int(time.time())
 
 def _auto_name_from_text(text:str)->str:
@@ -83,9 +68,11 @@ def create_bot(
     _ban_username(user)
     if tone not in TONES: raise HTTPException(status_code=400, detail="invalid tone")
     a = Agent(); a.name = name; a.description = description or ""; a.tone_profile = tone; a.published = False; a.owner_id = user.get("id")
-    db.add(a); db.commit(); db.refresh(a)
-    meta = {"review_status":"draft","admin_name":None,"auto_name_admin":None,"submitted_at":None,"reviewed_at":None,"review_notes":None,"safety_score":None,"safety_rating":None}
-    _save_meta(a.id, meta); _write_safety(a.id, "")
+    db.add(a); db.flush()
+    agent_counters.on_created(db, a)
+    meta = dict(bot_reviews.DEFAULT_META)
+    bot_reviews.save_meta(db, a.id, meta); bot_reviews.write_safety(db, a.id, "")
+    db.commit()
     return {"id": a.id, "status": meta["review_status"]}
 
 @router.post("/save/{bot_id}")
@@ -110,12 +97,13 @@ def save_bot(
     if tone is not None:
         if tone not in TONES: raise HTTPException(status_code=400, detail="invalid tone")
         a.tone_profile = tone
-    db.commit()
-    meta = _load_meta(bot_id)
+    meta = {}
     if safety_score is not None: meta["safety_score"] = int(safety_score)
     if safety_rating is not None: meta["safety_rating"] = safety_rating
-    _save_meta(bot_id, meta)
-    if safety_text is not None: _write_safety(bot_id, safety_text)
+    bot_reviews.save_meta(db, bot_id, meta)
+    if safety_text is not None: bot_reviews.write_safety(db, bot_id, safety_text)
+    db.commit()
+    card_cache.invalidate(bot_id)
     return {"ok": True}
 
 @router.post("/submit/{bot_id}")
@@ -129,23 +117,27 @@ def submit_bot(
     a = db.query(Agent).filter(Agent.id==bot_id).first()
     if not a: raise HTTPException(status_code=404, detail="bot not found")
     if a.owner_id != user.get("id"): raise HTTPException(status_code=403, detail="not your bot")
-    saf = _read_safety(bot_id)
+    saf = bot_reviews.read_safety(db, bot_id)
     if not saf.strip(): raise HTTPException(status_code=400, detail="safety.txt required to submit")
-    meta = _load_meta(bot_id)
+    meta = bot_reviews.load_meta(db, bot_id)
     if not meta.get("auto_name_admin"):
         base = " ".join([a.name or "", a.description or "", saf or "", a.tone_profile or ""])
         meta["auto_name_admin"] = _auto_name_from_text(base)
     meta["review_status"] = "submitted"; meta["submitted_at"] = _now()
-    _save_meta(bot_id, meta)
+    bot_reviews.save_meta(db, bot_id, meta)
+    if ADMIN_ALERT_EMAIL:
+        notifier.enqueue(db, ADMIN_ALERT_EMAIL, f"Bot submitted for review: {a.name or bot_id}",
+                         f"Bot #{bot_id} ({meta['auto_name_admin']}) was submitted for review by {user.get('email') or user.get('id')}.\n")
+    db.commit()
     return {"ok": True, "auto_name_admin": meta["auto_name_admin"]}
 
 @router.get("/mine")
 def my_bots(db: Session = Depends(get_db), user = Depends(get_current_user_optional)):
     if not user: raise HTTPException(status_code=401, detail="auth required")
-    q = db.query(Agent).filter(Agent.owner_id==user.get("id")); items=[]
-    for a in q.all():
-        m = _load_meta(a.id)
+    items=[]
+    for a, m in bot_reviews.owner_bots(db, user.get("id")):
         items.append({"id": a.id, "display_name": _display_name_author(a,m), "creator_name": a.name or "", "admin_name": m.get("admin_name"),
                       "review_status": m.get("review_status","draft"), "published": bool(a.published),
                       "tone": a.tone_profile or "", "safety_score": m.get("safety_score"), "safety_rating": m.get("safety_rating")})
-    return {"items": items}
+    # Plain dicts already: skip FastAPI's per-item jsonable_encoder walk (dominant cost at thousands of bots)
+    return JSONResponse({"items": items})
@@ -1,14 +1,19 @@
-﻿from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, EmailStr
-from typing import Dict
-from datetime import datetime, date, time, timedelta, timezone
-from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+﻿from fastapi import APIRouter, Depends, HTTPException, Query, Header, Response
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Literal, Optional
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 import uuid
 
-router = APIRouter(prefix="/calendar", tags=["calendar"])
+from ..db import get_db
+from ..models import Calendar, CalendarBooking
+from ..calendar_store import (calendar_store, get_tz, to_minutes, from_minutes, day_slots, availability,
+                              MAX_AVAILABILITY_DAYS)
+from .. import freebusy, notifier
 
-# In-memory store for MVP
-_calendars: Dict[str, dict] = {}
+router = APIRouter(prefix="/calendar", tags=["calendar"])
 
 class CalendarCreate(BaseModel):
     owner_name: str
@@ -24,18 +29,30 @@ class Booking(BaseModel):
     start: datetime
     end: datetime
 
-def get_tz(tz_name: str) -> ZoneInfo:
-    try:
-        return ZoneInfo(tz_name)
-    except ZoneInfoNotFoundError:
-        # Fallback for containers without IANA db
-        return ZoneInfo("UTC")
+class FreeBusyQuery(BaseModel):
+    calendar_ids: List[str] = Field(..., min_length=1, max_length=freebusy.MAX_FREEBUSY_CALENDARS)
+    start: date
+    days: int = Field(7, ge=1, le=MAX_AVAILABILITY_DAYS)
+    duration_minutes: int = Field(30, ge=5, le=480)
+    step_minutes: Optional[int] = Field(None, ge=5, le=480)   # defaults to duration_minutes
+    timezone: str = "UTC"                                        # grid origin + output timezone
+    mode: Literal["all", "any"] = "all"
+    limit: int = Field(50, ge=1, le=1000)
+
+def _calendar(db: Session, cal_id: str) -> Calendar:
+    cal = db.get(Calendar, cal_id)
+    if not cal:
+        raise HTTPException(status_code=404, detail="Calendar not found")
+    return cal
 
-def overlaps(a_start: datetime, a_end: datetime, b_start: datetime, b_end: datetime) -> bool:
-    return a_start < b_end and b_start < a_end
+def _parse_date(s: str) -> date:
+    try:
+        return date.fromisoformat(s)  # YYYY-MM-DD
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
 
 @router.post("", summary="Create a new calendar")
-def create_calendar(cfg: CalendarCreate):
+def create_calendar(cfg: CalendarCreate, db: Session = Depends(get_db)):
     if cfg.work_end_hour <= cfg.work_start_hour:
         raise HTTPException(status_code=400, detail="work_end_hour must be after work_start_hour")
     if cfg.slot_minutes not in (15, 20, 30, 45, 60):
@@ -43,10 +60,8 @@ def create_calendar(cfg: CalendarCreate):
         raise HTTPException(status_code=400, detail="slot_minutes must be one of 15, 20, 30, 45, 60")
 
     cal_id = uuid.uuid4().hex[:8]
-    _calendars[cal_id] = {
-        "config": cfg.dict(),
-        "bookings": []  # dicts: {name,email,start,end} (timezone-aware datetimes)
-    }
+    db.add(Calendar(id=cal_id, **cfg.dict()))
+    db.commit()
     return {
         "id": cal_id,
         "booking_url": f"/calendar/{cal_id}/book",
@@ -55,50 +70,69 @@ def create_calendar(cfg: CalendarCreate):
     }
 
 @router.get("/{cal_id}/slots", summary="List available slots for a date")
-def get_slots(cal_id: str, date_str: str):
-    cal = _calendars.get(cal_id)
-    if not cal:
-        raise HTTPException(status_code=404, detail="Calendar not found")
-
-    try:
-        d = date.fromisoformat(date_str)  # YYYY-MM-DD
-    except ValueError:
-        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
-
-    cfg = cal["config"]
-    tz = get_tz(cfg["timezone"])
-
-    start_dt = datetime(d.year, d.month, d.day, cfg["work_start_hour"], 0, tzinfo=tz)
-    end_dt   = datetime(d.year, d.month, d.day, cfg["work_end_hour"],   0, tzinfo=tz)
-    step = timedelta(minutes=cfg["slot_minutes"])
+def get_slots(cal_id: str, date_str: str, db: Session = Depends(get_db)):
+    cal = _calendar(db, cal_id)
+    d = _parse_date(date_str)
+    slots = calendar_store.read(db, cal_id, lambda idx: day_slots(idx, cal, d))
+    return {"cal_id": cal_id, "date": d.isoformat(), "slots": slots}
+
+@router.post("/freebusy", summary="Free slots across many calendars in one call")
+def search_freebusy(body: FreeBusyQuery, db: Session = Depends(get_db)):
+    ids = list(dict.fromkeys(body.calendar_ids))
+    found = {c.id: c for c in db.execute(select(Calendar).where(Calendar.id.in_(ids))).scalars()}
+    missing = [i for i in ids if i not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail={"message": "Calendar not found", "calendar_ids": missing})
+    tz = get_tz(body.timezone)
+    step = body.step_minutes or body.duration_minutes
+    slots, truncated = freebusy.search(db, [found[i] for i in ids], body.start, body.days, tz,
+                                       body.duration_minutes, step, body.mode, body.limit)
+    return {
+        "calendar_ids": ids,
+        "timezone": tz.key,
+        "duration_minutes": body.duration_minutes,
+        "mode": body.mode,
+        "slots": slots,
+        "truncated": truncated,
+    }
 
-    # Candidates
-    slots = []
-    cur = start_dt
-    while cur + step <= end_dt:
-        slots.append({"start": cur.isoformat(), "end": (cur+step).isoformat()})
-        cur += step
+@router.get("/{cal_id}/availability", summary="Available slots for a range of days")
+def get_availability(
+    cal_id: str,
+    start: str = Query(..., description="first day, YYYY-MM-DD"),
+    days: int = Query(7, ge=1, le=MAX_AVAILABILITY_DAYS),
+    db: Session = Depends(get_db),
+):
+    cal = _calendar(db, cal_id)
+    d = _parse_date(start)
+    out = calendar_store.read(db, cal_id, lambda idx: availability(idx, cal, d, days))
+    return {"cal_id": cal_id, "timezone": cal.timezone, "slot_minutes": cal.slot_minutes, "days": out}
+
+def _confirmation(cal_id: str, start: datetime, end: datetime, name: str, email: str) -> dict:
+    return {
+        "status": "confirmed",
+        "cal_id": cal_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "attendee": {"name": name, "email": email}
+    }
 
-    # Remove conflicts
-    booked = cal["bookings"]
-    available = []
-    for s in slots:
-        s_start = datetime.fromisoformat(s["start"])
-        s_end   = datetime.fromisoformat(s["end"])
-        conflict = any(overlaps(s_start, s_end, b["start"], b["end"]) for b in booked)
-        if not conflict:
-            available.append(s)
+def _by_key(db: Session, cal_id: str, key: str):
+    return db.execute(select(CalendarBooking).where(CalendarBooking.calendar_id == cal_id,
+                                                    CalendarBooking.idempotency_key == key)).scalar_one_or_none()
 
-    return {"cal_id": cal_id, "date": d.isoformat(), "slots": available}
+def _replay(b: CalendarBooking, payload: "Booking", s_min: int, e_min: int, tz, response: Response) -> dict:
+    # Same key must mean the same booking; anything else is a client bug, not a retry
+    if (b.start_min, b.end_min, b.name, b.email) != (s_min, e_min, payload.name, payload.email):
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different booking")
+    response.headers["Idempotent-Replayed"] = "true"
+    return _confirmation(b.calendar_id, from_minutes(b.start_min, tz), from_minutes(b.end_min, tz), b.name, b.email)
 
 @router.post("/{cal_id}/book", summary="Book a slot")
-def book(cal_id: str, payload: Booking):
-    cal = _calendars.get(cal_id)
-    if not cal:
-        raise HTTPException(status_code=404, detail="Calendar not found")
-
-    cfg = cal["config"]
-    tz  = get_tz(cfg["timezone"])
+def book(cal_id: str, payload: Booking, response: Response, db: Session = Depends(get_db),
+         idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=64)):
+    cal = _calendar(db, cal_id)
+    tz  = get_tz(cal.timezone)
 
     # Normalize to calendar tz; if naive, assume calendar tz
     start = payload.start
@@ -115,48 +149,61 @@ def book(cal_id: str, payload: Booking):
     if end <= start:
         raise HTTPException(status_code=400, detail="end must be after start")
 
-    slot = timedelta(minutes=cfg["slot_minutes"])
-    if (start.minute % cfg["slot_minutes"] != 0) or ((end - start) != slot):
-        raise HTTPException(status_code=400, detail=f"slot must be {cfg['slot_minutes']} minutes and aligned to the grid")
+    slot = timedelta(minutes=cal.slot_minutes)
+    if (start.minute % cal.slot_minutes != 0) or start.second or start.microsecond or ((end - start) != slot):
+        raise HTTPException(status_code=400, detail=f"slot must be {cal.slot_minutes} minutes and aligned to the grid")
 
     # Check work hours in local time
-    work_start = time(hour=cfg["work_start_hour"])
-    work_end   = time(hour=cfg["work_end_hour"])
+    work_start = time(hour=cal.work_start_hour)
+    work_end   = time(hour=cal.work_end_hour)
     if not (work_start <= start.timetz().replace(tzinfo=None) <= work_end and
             work_start <= (end - timedelta(seconds=1)).timetz().replace(tzinfo=None) <= work_end):
         raise HTTPException(status_code=400, detail="time is outside working hours")
 
-    # Conflicts
-    for b in cal["bookings"]:
-        if overlaps(start, end, b["start"], b["end"]):
-            raise HTTPException(status_code=409, detail="slot already booked")
-
-    cal["bookings"].append({
-        "name": payload.name,
-        "email": payload.email,
-        "start": start,
-        "end": end
-    })
+    s_min, e_min = to_minutes(start), to_minutes(end)
+
+    def conflict():
+        # Taken slot: a retry of this same request (possibly still in flight when we first looked)
+        # replays the original; anyone else gets 409
+        prior = _by_key(db, cal_id, idempotency_key) if idempotency_key else None
+        if prior is not None:
+            return _replay(prior, payload, s_min, e_min, tz, response)
+        raise HTTPException(status_code=409, detail="slot already booked")
+
+    # Fast path: O(log n) against the synced interval index. It can miss a booking another
+    # worker is committing right now; the unique slot index / overlap constraint catch that.
+    if calendar_store.read(db, cal_id, lambda idx: idx.conflicts(s_min, e_min)):
+        return conflict()
+
+    db.add(CalendarBooking(calendar_id=cal_id, name=payload.name, email=payload.email,
+                           start_min=s_min, end_min=e_min, idempotency_key=idempotency_key))
+    # Confirmations ride the same transaction: queued only if the booking commits, sent by the outbox worker
+    when = f"{start.strftime('%A %d %B %Y, %H:%M')}-{end.strftime('%H:%M')} ({cal.timezone})"
+    notifier.enqueue(db, payload.email, f"Booking confirmed with {cal.owner_name}",
+                     f"Hi {payload.name},\n\nYour booking with {cal.owner_name} is confirmed for {when}.\n")
+    notifier.enqueue(db, cal.owner_email, f"New booking: {payload.name}",
+                     f"{payload.name} <{payload.email}> booked {when}.\n")
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return conflict()
 
-    return {
-        "status": "confirmed",
-        "cal_id": cal_id,
-        "start": start.isoformat(),
-        "end": end.isoformat(),
-        "attendee": {"name": payload.name, "email": payload.email}
-    }
+    return _confirmation(cal_id, start, end, payload.name, payload.email)
 
 @router.get("/{cal_id}/bookings", summary="List bookings")
-def list_bookings(cal_id: str):
-    cal = _calendars.get(cal_id)
-    if not cal:
-        raise HTTPException(status_code=404, detail="Calendar not found")
+def list_bookings(cal_id: str, db: Session = Depends(get_db)):
+    cal = _calendar(db, cal_id)
+    tz = get_tz(cal.timezone)
+    rows = db.execute(select(CalendarBooking.name, CalendarBooking.email, CalendarBooking.start_min, CalendarBooking.end_min)
+                      .where(CalendarBooking.calendar_id == cal_id)
+                      .order_by(CalendarBooking.start_min)).all()
     out = []
-    for b in cal["bookings"]:
+    for b in rows:
         out.append({
-            "name": b["name"],
-            "email": b["email"],
-            "start": b["start"].isoformat(),
-            "end": b["end"].isoformat(),
+            "name": b.name,
+            "email": b.email,
+            "start": from_minutes(b.start_min, tz).isoformat(),
+            "end": from_minutes(b.end_min, tz).isoformat(),
         })
     return {"cal_id": cal_id, "bookings": out}
@@ -1,9 +1,20 @@
-﻿from fastapi import APIRouter, Depends
+﻿import json
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
-from sqlalchemy import func
-from ..db import get_db
-from ..models import Agent
+from ..db import get_async_db, get_db
+from ..llm_transport import transport
+from ..llm_adapter import adapter_stats
+from ..llm_cache import completion_cache
+from ..semantic_cache import semantic_cache
+from ..escalation import routing_stats
+from ..cards import card_cache
+from ..notifier import outbox_worker
+from ..http_cache import cached_json, etag_for, weak
+from ..request_metrics import request_metrics
+from ..agent_counters import counter_cache, reconciler
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 
@@ -17,10 +28,57 @@ def live():
 def ready():
     return {"ready": True}
 
+@router.get("/prometheus", response_class=PlainTextResponse)
+async def prometheus():
+    # Per-route latency, DB and LLM time histograms in Prometheus text format (this worker only)
+    return PlainTextResponse(request_metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+@router.get("/requests")
+async def requests(route: str = ""):
+    # Same series as JSON with percentiles; ?route= filters by route template prefix
+    return request_metrics.snapshot(route)
+
 @router.get("/stats")
-def stats(db: Session = Depends(get_db)):
+async def stats(request: Request, db: AsyncSession = Depends(get_async_db)):
     now = datetime.now(timezone.utc)
     uptime_s = (now - _started_at).total_seconds()
-    total_agents = db.query(func.count(Agent.id)).scalar() or 0
-    published = db.query(func.count(Agent.id)).filter(Agent.published==True).scalar() or 0
-    return {"uptime_s": uptime_s, "agents_total": int(total_agents), "agents_published": int(published)}
+    # agent_counters via the TTL cache; Last-Modified is when a counter last moved
+    c = await counter_cache.aget(db)
+    last_modified = datetime.fromtimestamp(c["updated_at"], timezone.utc) if c["updated_at"] else None
+    counts = {"agents_total": c["agents_total"], "agents_published": c["agents_published"]}
+    # The ETag covers the counts only, so it is weak: bodies that differ in uptime_s share it
+    # (a 304 leaves the client with the uptime_s of its last full response)
+    body = json.dumps({"uptime_s": uptime_s, **counts}).encode("utf-8")
+    return cached_json(request, body, etag=weak(etag_for(json.dumps(counts).encode("utf-8"))),
+                       last_modified=last_modified)
+
+@router.get("/counters")
+def counters():
+    # agent_counters cache hit/miss and the reconciler's last run (drift > 0 means a write path skipped the counters)
+    return {"cache": counter_cache.stats(), "reconcile": reconciler.stats()}
+
+@router.get("/llm-pool")
+def llm_pool():
+    # Shared upstream connection pool: open/idle connections, per-host in-flight vs cap,
+    # plus per-model caps and single-flight coalescing in llm_adapter
+    return {**transport.stats(), "adapter": adapter_stats()}
+
+@router.get("/llm-cache")
+def llm_cache():
+    # Completion cache hit/miss counters and memory footprint
+    return {**completion_cache.stats(), "semantic": semantic_cache.stats()}
+
+@router.get("/routing")
+def routing():
+    # Per-tier latency/cost histograms, escalation and hedge counts for the routing ladder
+    return routing_stats()
+
+@router.get("/card-cache")
+def card_cache_stats():
+    # Store/owner AgentCard bytes + anonymous page cache (catalogue version, hits, invalidations)
+    return card_cache.stats()
+
+@router.get("/notifier")
+def notifier_stats(db: Session = Depends(get_db)):
+    # email_outbox depth by status + this process's worker (SMTP connects vs messages sent, retries)
+    return outbox_worker.stats(db)
@@ -1,37 +1,25 @@
-﻿from fastapi import APIRouter, Depends
-try:
-    import psutil
-    HAS_PSUTIL=True
-except Exception:
-    HAS_PSUTIL=False
-
-# optional DB health
-try:
-    from ..db import get_db
-    from sqlalchemy.orm import Session
-    HAS_DB=True
-except Exception:
-    HAS_DB=False
-    def get_db(): 
-        yield None
-        return
+﻿from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+from ..system_sampler import sampler
+from ..db_health import db_health
 
 router = APIRouter(prefix="/monitor", tags=["monitor"])
 
 @router.get("/stats")
-def stats():
-    if not HAS_PSUTIL:
-        return {"cpu": None, "mem": None, "note": "psutil not installed"}
-    cpu = psutil.cpu_percent(interval=0.0)
-    mem = psutil.virtual_memory()._asdict()
-    return {"cpu": cpu, "mem": mem}
+async def stats():
+    # Latest background sample (CPU, memory, loop lag, GC, threadpool, DB pool); nothing is measured here
+    latest = sampler.latest()
+    if latest is None:
+        latest = sampler.sample()   # sampler not started (no lifespan): a point-in-time sample without loop lag
+    return {**latest, "sampler": sampler.stats()}
+
+@router.get("/series")
+async def series(seconds: float = Query(60, gt=0, le=3600)):
+    # The ring buffer for the last N seconds, oldest first
+    return {"samples": sampler.series(seconds), "sampler": sampler.stats()}
 
 @router.get("/db")
-def db_health(db: 'Session' = Depends(get_db)):
-    if not HAS_DB or db is None:
-        return {"db": "unknown"}
-    try:
-        db.execute("SELECT 1")
-        return {"db": "ok"}
-    except Exception:
-        return {"db": "error"}
+def db_health_check():
+    # SELECT 1 on the app engine, cached for HEALTH_CACHE_S; 503 when the database is unreachable
+    r = {**db_health.check(), "health": db_health.stats()}
+    return JSONResponse(r, status_code=200 if r["db"] == "ok" else 503)
@@ -1,34 +1,25 @@
 ﻿from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from ..db import get_db, get_current_user
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from ..db import get_async_db, get_current_user
 from ..models import Agent
-from ..schemas import AgentCard
+from ..cards import CARD_COLUMNS, card_cache
+from ..pagination import TOTAL_MODES, fetch_page, count_total
 
 router = APIRouter(prefix="/owner", tags=["owner"])
 
 @router.get("/my-bots", operation_id="owner_my_bots_cards")
-def my_bots(
+async def my_bots(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
-    db: Session = Depends(get_db),
+    cursor: str = Query("", description="next_cursor from the previous page (replaces page)"),
+    total: str = Query("exact", description="exact | estimate | none"),
+    db: AsyncSession = Depends(get_async_db),
     user = Depends(get_current_user)
 ):
-    base = db.query(Agent).filter(Agent.owner_id==user["id"])
-    total = base.count()
-    rows = base.order_by(Agent.id.desc()).offset((page-1)*size).limit(size).all()
-    items = []
-    for r in rows:
-        items.append(AgentCard(
-            id=r.id,
-            name=r.name or "",
-            description=r.description or "",
-            category=r.category or "",
-            published=bool(r.published),
-            tone_profile=r.tone_profile or "",
-            safety_rating=r.safety_rating or "",
-            safety_score=float(r.safety_score) if r.safety_score is not None else None,
-            lineage_display=r.lineage_display or "",
-            last_safety_check=r.last_safety_check.isoformat() if r.last_safety_check else None,
-            usage_cost=float(r.usage_cost) if r.usage_cost is not None else None,
-        ).dict())
-    return {"items": items, "page": page, "size": size, "total": int(total)}
+    base = select(*CARD_COLUMNS).where(Agent.owner_id==user["id"])
+    n, exact = await count_total(db, base, total if total in TOTAL_MODES else "exact")
+    rows, nxt = await fetch_page(db, base, "id_desc", size, cursor, page, scalars=False)
+    body = card_cache.render(rows, page=page, size=size, total=n, total_exact=exact, next_cursor=nxt)
+    return Response(content=body, media_type="application/json")
@@ -2,7 +2,9 @@
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from ..db import get_db
+from ..cards import card_cache
 from ..models import Agent, AuditLog
+from .. import agent_counters
 
 router = APIRouter(prefix="/owner", tags=["publish"])
 
@@ -12,10 +14,13 @@ class PublishBody(BaseModel):
 
 @router.post("/publish")
 def publish_toggle(body: PublishBody, db: Session = Depends(get_db)):
-    ag = db.query(Agent).filter(Agent.id==body.bot_id).first()
+    # Row lock: concurrent toggles of one bot must see each other's flag for the published counter
+    ag = db.query(Agent).filter(Agent.id==body.bot_id).with_for_update().first()
     if not ag:
         raise HTTPException(status_code=404, detail="bot not found")
+    agent_counters.on_publish(db, ag.published, bool(body.publish))
     ag.published = bool(body.publish)
     db.add(AuditLog(event_type=("publish" if ag.published else "unpublish"), bot_id=ag.id, payload={"published": ag.published}))
     db.commit()
+    card_cache.invalidate(ag.id)
     return {"bot_id": ag.id, "published": ag.published}
@@ -1,13 +1,34 @@
-﻿from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from ..db import get_db
+﻿import json
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from ..db import get_async_db
 from ..models import Agent
+from ..http_cache import cached_json
 
 router = APIRouter(prefix="/publisher", tags=["publisher"])
 
 @router.get("/summary")
-def summary(db: Session = Depends(get_db)):
+async def summary(
+    request: Request,
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=200),
+    exact: bool = Query(False, description="count adoptions live (grouped query) instead of the materialized counter"),
+    db: AsyncSession = Depends(get_async_db),
+):
     # MVP stub: counts adoptions by parent
-    published = db.query(Agent).filter(Agent.published==True).all()
-    items = [{"bot_id": a.id, "name": a.name, "adoptions": db.query(Agent).filter(Agent.parent_id==a.id).count(), "revenue_share_estimate": 0.0, "next_payout_on": None} for a in published]
-    return {"published_bots": items, "cycle_length_days": 14}
+    if exact:
+        counts = (select(Agent.parent_id.label("pid"), func.count(Agent.id).label("n"))
+                  .where(Agent.parent_id.is_not(None)).group_by(Agent.parent_id).subquery())
+        q = (select(Agent.id, Agent.name, func.coalesce(counts.c.n, 0))
+             .outerjoin(counts, counts.c.pid == Agent.id))
+    else:
+        q = select(Agent.id, Agent.name, Agent.adoption_count)
+    q = q.where(Agent.published==True).order_by(Agent.id).offset((page-1)*size).limit(size)
+    # Newest change anywhere in the catalogue (adoptions bump the parent's updated_at too)
+    last_modified = (await db.execute(select(func.max(Agent.updated_at)))).scalar()
+    rows = (await db.execute(q)).all()
+    items = [{"bot_id": r[0], "name": r[1], "adoptions": int(r[2] or 0), "revenue_share_estimate": 0.0, "next_payout_on": None} for r in rows]
+    body = json.dumps({"published_bots": items, "cycle_length_days": 14, "page": page, "size": size},
+                      separators=(",", ":")).encode("utf-8")
+    return cached_json(request, body, last_modified=last_modified)
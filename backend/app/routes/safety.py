@@ -1,6 +1,7 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from ..db import get_db
+from ..cards import card_cache
 from ..models import Agent, AuditLog
 import datetime as dt
 
@@ -19,4 +20,5 @@ def run_check(bot_id: int = Query(...), db: Session = Depends(get_db)):
     ag.last_safety_check = dt.datetime.now(dt.timezone.utc)
     db.add(AuditLog(event_type="safety_check", bot_id=ag.id, payload={"score": score, "rating": rating}))
     db.commit()
+    card_cache.invalidate(ag.id)
     return {"bot_id": ag.id, "safety_rating": rating, "safety_score": float(score), "last_safety_check": ag.last_safety_check.isoformat()}
@@ -1,61 +1,59 @@
-﻿from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from ..db import get_db, get_current_user_optional
+﻿from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, select, func
+from ..db import get_async_db, get_current_user_optional
 from ..models import Agent
-from ..schemas import AgentCard
+from ..cards import CARD_COLUMNS, card_cache
+from ..http_cache import cached_json
+from ..search import apply_search
+from ..pagination import SORTS, TOTAL_MODES, fetch_page, fetch_offset_page, count_total
 
 router = APIRouter(prefix="/store", tags=["store"])
 
-def to_card(a: Agent) -> AgentCard:
-    return AgentCard(
-        id=a.id,
-        name=a.name or "",
-        description=a.description or "",
-        category=a.category or "",
-        published=bool(a.published),
-        tone_profile=a.tone_profile or "",
-        safety_rating=a.safety_rating or "",
-        safety_score=float(a.safety_score) if a.safety_score is not None else None,
-        lineage_display=a.lineage_display or "",
-        last_safety_check=a.last_safety_check.isoformat() if a.last_safety_check else None,
-        usage_cost=float(a.usage_cost) if a.usage_cost is not None else None,
-    )
-
-def apply_sort(query, sort: str):
+def sort_mode(sort: str) -> str:
     s = (sort or "created_desc").lower()
-    if s == "created_asc":
-        return query.order_by(Agent.created_at.asc())
-    if s == "name_asc":
-        return query.order_by(Agent.name.asc())
-    if s == "name_desc":
-        return query.order_by(Agent.name.desc())
-    # default
-    return query.order_by(Agent.created_at.desc())
+    return s if s in SORTS else "created_desc"
 
 @router.get("/search", operation_id="store_search_cards")
-def store_search(
+async def store_search(
+    request: Request,
     q: str = Query("", description="optional search"),
     page: int = Query(1, ge=1),
     size: int = Query(5, ge=1, le=50),
-    sort: str = Query("created_desc"),
-    db: Session = Depends(get_db),
+    sort: str = Query("", description="relevance (default when q is set) | created_desc | created_asc | name_asc | name_desc"),
+    cursor: str = Query("", description="next_cursor from the previous page (replaces page)"),
+    total: str = Query("exact", description="exact | estimate | none"),
+    db: AsyncSession = Depends(get_async_db),
     user = Depends(get_current_user_optional),
 ):
-    base = db.query(Agent)
+    # Anonymous pages are identical for everyone: serve the cached bytes (or a 304) without touching the DB
+    page_key = None if user else ("store", q, page, size, sort, cursor, total)
+    if page_key:
+        body = card_cache.get_page(page_key)
+        if body is not None:
+            return cached_json(request, body)
+    version = card_cache.version
+
+    base = select(*CARD_COLUMNS)
     if user and "id" in user:
-        base = base.filter(or_(Agent.owner_id==user["id"], Agent.published==True))
+        base = base.where(or_(Agent.owner_id==user["id"], Agent.published==True))
     else:
-        base = base.filter(Agent.published==True)
+        base = base.where(Agent.published==True)
 
+    score = None
     if q:
-        like = f"%{q}%"
-        base = base.filter(or_(Agent.name.ilike(like), Agent.description.ilike(like)))
-
-    total = base.count()
-    base = apply_sort(base, sort)
+        base, score = apply_search(base, q, db.bind.dialect.name)
+    sort = (sort or ("relevance" if q else "created_desc")).lower()
 
-    rows = base.offset((page-1)*size).limit(size).all()
-    items = [to_card(r).dict() for r in rows]
+    n, exact = await count_total(db, base, total if total in TOTAL_MODES else "exact")
+    if sort == "relevance" and score is not None:
+        base = base.order_by(score.desc(), Agent.id.desc())
+        rows, nxt = await fetch_offset_page(db, base, sort, size, cursor, page, scalars=False)
+    else:
+        sort = sort_mode(sort)
+        rows, nxt = await fetch_page(db, base, sort, size, cursor, page, scalars=False)
 
-    return {"items": items, "page": page, "size": size, "total": int(total), "sort": sort}
+    body = card_cache.render(rows, page=page, size=size, total=n, total_exact=exact, sort=sort, next_cursor=nxt)
+    if page_key:
+        card_cache.put_page(page_key, body, version)
+    return cached_json(request, body)
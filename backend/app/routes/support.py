@@ -1,14 +1,29 @@
-﻿from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, ConfigDict
-from sqlalchemy.orm import Session
+﻿import json
+import math
+import asyncio
+from typing import List
+from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import select
 import httpx
 
-from ..db import SessionLocal
+from ..db import AsyncSessionLocal
 from ..models import Agent, InteractionLog
-from ..llm_adapter import invoke_openai
+from ..llm_adapter import stream, fan_out
+from ..rate_limit import RateLimited
+from ..escalation import run_ladder, ladder_from_spec, agent_task_is_hard
+from .. import checker
+from ..llm_cache import completion_cache, cache_key, cache_enabled_for
+from ..semantic_cache import semantic_cache, semantic_enabled_for
 
 router = APIRouter()
 
+SYSTEM_PROMPT = "Be brief and helpful. If you don't know, say so in one short sentence."
+MAX_TOKENS = 120
+TEMPERATURE = 0.3
+BATCH_MAX_ITEMS = 500
+
 class AskInput(BaseModel):
     agent_id: int
     question: str
@@ -18,52 +33,222 @@ class AskOutput(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
     answer: str
     model_name: str
+    cached: bool = False
 
-@router.post("/support/ask", response_model=AskOutput)
-async def ask(payload: AskInput):
-    db: Session = SessionLocal()
-    try:
-        agent = db.query(Agent).filter(Agent.id == payload.agent_id).first()
-        if not agent:
-            raise HTTPException(status_code=404, detail="Agent not found")
+class AskBatchInput(BaseModel):
+    items: List[AskInput] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    concurrency: int = Field(8, ge=1, le=64)
 
-        # Safe default: your stack has used gpt-4o-mini successfully
-        model = ((agent.spec or {}).get("primary_model")) or "gpt-4o-mini"
+# --- DB helpers (async engine; nothing here blocks the event loop) ---
+async def _load_agents(agent_ids: List[int]) -> dict:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Agent.id, Agent.name, Agent.description, Agent.category, Agent.spec)
+            .where(Agent.id.in_(set(agent_ids)))
+        )).all()
+        return {r.id: {"id": r.id, "name": r.name, "description": r.description,
+                       "category": r.category, "spec": r.spec or {}} for r in rows}
 
-        system_prompt = "Be brief and helpful. If you don't know, say so in one short sentence."
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": payload.question},
-        ]
+async def _load_agent(agent_id: int):
+    return (await _load_agents([agent_id])).get(agent_id)
 
+async def _log_interactions(rows: List[tuple]) -> None:
+    async with AsyncSessionLocal() as db:
         try:
-            reply = await invoke_openai(
-                model=model,
-                messages=messages,
-                max_tokens=120,
-                temperature=0.3,
-            )
-        except httpx.HTTPStatusError as e:
-            # Bubble up the real API error text so we can see what's wrong
-            raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
-        except Exception as e:
-            raise HTTPException(status_code=502, detail=f"LLM call failed: {e}")
-
-        # Best-effort log
-        try:
-            log = InteractionLog(
-                agent_id=agent.id,
-                prompt=payload.question,
+            db.add_all([InteractionLog(
+                agent_id=agent_id,
+                prompt=prompt,
                 response=reply,
                 user_sentiment_before="neutral",
                 user_sentiment_after="neutral",
                 usefulness_score=0.0,
-            )
-            db.add(log)
-            db.commit()
+            ) for agent_id, prompt, reply in rows])
+            await db.commit()
         except Exception:
-            db.rollback()  # don’t break the endpoint if logging fails
+            await db.rollback()  # don’t break the endpoint if logging fails
+
+async def _log_interaction(agent_id: int, prompt: str, reply: str) -> None:
+    await _log_interactions([(agent_id, prompt, reply)])
+
+def _messages(agent: dict, question: str):
+    # Primary tier of the brain.py routing ladder (defaults to gpt-4o-mini)
+    model = ladder_from_spec(agent["spec"])[0]
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": question},
+    ]
+    return model, messages
+
+async def _prepare(payload: AskInput):
+    agent = await _load_agent(payload.agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    model, messages = _messages(agent, payload.question)
+    return agent, model, messages
+
+def _cache_key(agent: dict, model: str, messages: list):
+    if not cache_enabled_for(agent["spec"]):
+        return None
+    return cache_key(agent["id"], agent["spec"], model, messages, TEMPERATURE, MAX_TOKENS)
+
+# Cache calls run via asyncio.to_thread: the disk tier is SQLite and the semantic cache embeds
+# and takes a lock, neither of which belongs on the event loop.
+# Entries are keyed by the primary tier but store [answer, model that answered], so a hit reports
+# the escalated tier when that is where the reply came from. Plain strings are older entries.
+def _encode(reply: str, answered_by: str) -> str:
+    return json.dumps([reply, answered_by], ensure_ascii=False)
+
+def _decode(value: str, model: str):
+    try:
+        v = json.loads(value)
+    except ValueError:
+        v = None
+    if isinstance(v, list) and len(v) == 2 and all(isinstance(x, str) for x in v):
+        return v[0], v[1]
+    return value, model
+
+def _cached_answer(agent: dict, model: str, key, question: str):
+    # Exact match first, then near-duplicate questions to the same agent/spec/model; (answer, model) or None
+    if key:
+        hit = completion_cache.get(key)
+        if hit is not None:
+            return _decode(hit, model)
+    if semantic_enabled_for(agent["spec"]):
+        hit = semantic_cache.lookup(agent["id"], agent["spec"], model, question)
+        if hit is not None:
+            return _decode(hit[0], model)
+    return None
+
+def _remember(agent: dict, model: str, key, question: str, reply: str, answered_by: str) -> None:
+    if not reply:
+        return
+    value = _encode(reply, answered_by)
+    if key:
+        completion_cache.set(key, value)
+    if semantic_enabled_for(agent["spec"]):
+        semantic_cache.add(agent["id"], agent["spec"], model, question, value)
+
+async def _answer(agent: dict, question: str) -> AskOutput:
+    model, messages = _messages(agent, question)
+    key = _cache_key(agent, model, messages)
+    cached = await asyncio.to_thread(_cached_answer, agent, model, key, question)
+    if cached is not None:
+        return AskOutput(answer=cached[0], model_name=cached[1], cached=True)
+
+    result = await run_ladder(
+        agent["spec"],
+        messages,
+        task_is_hard=agent_task_is_hard(agent, question),
+        max_tokens=MAX_TOKENS,
+        temperature=TEMPERATURE,
+    )
+    # A fallback (every tier asked to escalate) is returned but not cached for the whole TTL
+    if result.accepted:
+        await asyncio.to_thread(_remember, agent, model, key, question, result.answer, result.model)
+    return AskOutput(answer=result.answer, model_name=result.model)
+
+@router.post("/support/ask", response_model=AskOutput)
+async def ask(payload: AskInput, background: BackgroundTasks):
+    agent = await _load_agent(payload.agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    try:
+        out = await _answer(agent, payload.question)
+    except httpx.HTTPStatusError as e:
+        # Bubble up the real API error text so we can see what's wrong
+        raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+    except RateLimited as e:
+        # Upstream saturated past the queue deadline: tell the client when to come back
+        raise HTTPException(status_code=503, detail=f"LLM busy: {e}",
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"LLM call failed: {e}")
+
+    # Best-effort log, after the response is sent
+    background.add_task(_log_interaction, agent["id"], payload.question, out.answer)
+
+    return out
+
+@router.post("/support/ask/batch")
+async def ask_batch(payload: AskBatchInput):
+    """
+    Bulk /support/ask for safety sweeps and evals. Items run with bounded concurrency; identical
+    in-flight prompts share one upstream call and per-model caps apply (see llm_adapter).
+    Streams NDJSON, one line per item in completion order:
+    {"index", "agent_id", "answer", "model_name", "cached"} or {"index", "agent_id", "error", "status"}.
+    """
+    items = payload.items
+    agents = await _load_agents([it.agent_id for it in items])
+
+    def job(it: AskInput):
+        async def run():
+            agent = agents.get(it.agent_id)
+            if agent is None:
+                raise HTTPException(status_code=404, detail="Agent not found")
+            return await _answer(agent, it.question)
+        return run
+
+    async def lines():
+        logs = []
+        try:
+            async for i, out, err in fan_out([job(it) for it in items], payload.concurrency):
+                it = items[i]
+                if err is None:
+                    logs.append((it.agent_id, it.question, out.answer))
+                    row = {"index": i, "agent_id": it.agent_id, **out.model_dump()}
+                elif isinstance(err, HTTPException):
+                    row = {"index": i, "agent_id": it.agent_id, "error": err.detail, "status": err.status_code}
+                elif isinstance(err, RateLimited):
+                    row = {"index": i, "agent_id": it.agent_id, "error": f"LLM busy: {err}", "status": 503,
+                           "retry_after": err.retry_after}
+                else:
+                    row = {"index": i, "agent_id": it.agent_id, "error": f"LLM call failed: {err}", "status": 502}
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+        finally:
+            if logs:
+                await _log_interactions(logs)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _sse(data: dict, event: str | None = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/support/ask/stream")
+async def ask_stream(payload: AskInput):
+    """
+    Same as /support/ask but streams tokens as Server-Sent Events:
+    'data: {"delta": ...}' per chunk, then 'event: done' with the model name (or 'event: error').
+    Streams from the primary tier only; escalation needs the full reply to score it.
+    """
+    agent, model, messages = await _prepare(payload)
+    key = _cache_key(agent, model, messages)
+    cached = await asyncio.to_thread(_cached_answer, agent, model, key, payload.question)
+
+    async def events():
+        if cached is not None:
+            yield _sse({"delta": cached[0]})
+            yield _sse({"model_name": cached[1], "cached": True}, event="done")
+            await _log_interaction(agent["id"], payload.question, cached[0])
+            return
+        parts = []
+        try:
+            async for delta in stream(model=model, messages=messages, max_tokens=MAX_TOKENS, temperature=TEMPERATURE):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except Exception as e:
+            yield _sse({"detail": f"LLM call failed: {e}"}, event="error")
+            return
+        reply = "".join(parts)
+        # Same key /support/ask reads: only cache what the ladder would have accepted from this tier
+        if not checker.quick_escalation_signal(reply, agent_task_is_hard(agent, payload.question))["needs_escalation"]:
+            await asyncio.to_thread(_remember, agent, model, key, payload.question, reply, model)
+        yield _sse({"model_name": model, "cached": False}, event="done")
+        await _log_interaction(agent["id"], payload.question, reply)
 
-        return AskOutput(answer=reply, model_name=model)
-    finally:
-        db.close()
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,104 @@
+﻿import re
+import logging
+from typing import Optional, Tuple
+
+from sqlalchemy import or_, func, text, literal_column, column, Integer, Float
+from sqlalchemy.engine import Engine
+
+from .models import Agent
+
+# ---- Store full-text search -------------------------------------------------------
+# Postgres: GIN index on a tsvector expression (prefix matching via 'term:*') plus a pg_trgm
+#           index on name for typo tolerance; ranked by ts_rank_cd + trigram similarity.
+#           Indexes are created by step26_store_search.sql.
+# SQLite:   FTS5 external-content table kept in sync by triggers (ensure_sqlite_fts), ranked by bm25.
+# Others:   the old ILIKE filter, unranked.
+
+log = logging.getLogger("app.search")
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+MAX_TERMS = 8
+
+# Must match the index expression in step26_store_search.sql exactly (literals, not bind params).
+PG_DOCUMENT = func.to_tsvector(
+    literal_column("'simple'::regconfig"),
+    func.coalesce(Agent.name, literal_column("''")).op("||")(literal_column("' '")).op("||")(
+        func.coalesce(Agent.description, literal_column("''"))
+    ),
+)
+
+
+def terms(q: str):
+    return [t.lower() for t in _TERM.findall(q or "")][:MAX_TERMS]
+
+
+def _pg_search(stmt, q: str, ts: list):
+    tsq = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(f"{t}:*" for t in ts))
+    matched = PG_DOCUMENT.op("@@")(tsq)
+    fuzzy = Agent.name.op("%")(q)   # pg_trgm similarity above pg_trgm.similarity_threshold
+    score = func.ts_rank_cd(PG_DOCUMENT, tsq) + func.similarity(Agent.name, q)
+    return stmt.where(or_(matched, fuzzy)), score
+
+
+def _sqlite_search(stmt, ts: list):
+    match = " ".join('"' + t.replace('"', '') + '"*' for t in ts)
+    fts = (
+        text("SELECT rowid AS rid, bm25(agents_fts) AS rank FROM agents_fts WHERE agents_fts MATCH :m")
+        .bindparams(m=match)
+        .columns(column("rid", Integer), column("rank", Float))
+        .subquery("fts")
+    )
+    # bm25 is lower-is-better; negate so every backend sorts score DESC
+    return stmt.join(fts, fts.c.rid == Agent.id), -fts.c.rank
+
+
+def apply_search(stmt, q: str, dialect: str) -> Tuple[object, Optional[object]]:
+    """Filter `stmt` (a select over Agent) by the store query. Returns (stmt, score or None)."""
+    ts = terms(q)
+    if not ts:
+        return stmt, None
+    if dialect == "postgresql":
+        return _pg_search(stmt, q, ts)
+    if dialect == "sqlite" and sqlite_fts_ready:
+        return _sqlite_search(stmt, ts)
+    like = f"%{q}%"
+    return stmt.where(or_(Agent.name.ilike(like), Agent.description.ilike(like))), None
+
+
+# ---- SQLite FTS5 setup (local runs) -------------------------------------------------
+sqlite_fts_ready = False
+
+_SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS agents_fts USING fts5(
+         name, description, content='agents', content_rowid='id',
+         tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS agents_fts_ai AFTER INSERT ON agents BEGIN
+         INSERT INTO agents_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS agents_fts_ad AFTER DELETE ON agents BEGIN
+         INSERT INTO agents_fts(agents_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS agents_fts_au AFTER UPDATE OF name, description ON agents BEGIN
+         INSERT INTO agents_fts(agents_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+         INSERT INTO agents_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+       END""",
+]
+
+
+def ensure_sqlite_fts(engine: Engine) -> bool:
+    """Create the FTS5 index + sync triggers if missing (rebuilding from agents on first creation)."""
+    global sqlite_fts_ready
+    if engine.dialect.name != "sqlite":
+        return False
+    try:
+        with engine.begin() as conn:
+            existed = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name='agents_fts'")).first() is not None
+            for ddl in _SQLITE_FTS_DDL:
+                conn.execute(text(ddl))
+            if not existed:
+                conn.execute(text("INSERT INTO agents_fts(agents_fts) VALUES ('rebuild')"))
+        sqlite_fts_ready = True
+    except Exception as e:
+        log.warning("SQLite FTS5 unavailable, store search falls back to LIKE: %s", e)
+        sqlite_fts_ready = False
+    return sqlite_fts_ready
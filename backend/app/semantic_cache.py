@@ -0,0 +1,293 @@
+﻿import os
+import re
+import time
+import zlib
+import threading
+from typing import Optional, Dict, List, Tuple
+
+from .lazy_import import has_module, lazy
+
+# numpy is imported on first use (the cache is off by default); see lazy_import.
+np = lazy("numpy")
+HAS_NUMPY = has_module("numpy")
+
+# Optional local embedding model (CPU); the hashed n-gram vectorizer is used otherwise.
+HAS_ST = has_module("sentence_transformers")
+
+from .llm_cache import LLM_CACHE_TTL, cache_enabled_for, normalize_text, spec_hash
+
+# ---- Config (env) -----------------------------------------------------------
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))   # cosine similarity
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "1024"))
+SEMANTIC_CACHE_MAX_PER_AGENT = int(os.getenv("SEMANTIC_CACHE_MAX_PER_AGENT", "20000"))
+SEMANTIC_CACHE_IVF_MIN = int(os.getenv("SEMANTIC_CACHE_IVF_MIN", "4000"))          # brute force below this
+SEMANTIC_CACHE_NPROBE = int(os.getenv("SEMANTIC_CACHE_NPROBE", "8"))
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "").strip()              # e.g. all-MiniLM-L6-v2
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+# ---- Embedders --------------------------------------------------------------
+class HashingVectorizer:
+    """Char 3-5 grams + word uni/bigrams hashed into a fixed dim (crc32, stable across processes), L2-normalized."""
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        t = normalize_text(text)
+        words = _TOKEN.findall(t)
+        feats = ["w:" + w for w in words]
+        feats += ["b:" + a + " " + b for a, b in zip(words, words[1:])]
+        padded = " " + " ".join(words) + " "
+        for n in (3, 4, 5):
+            feats += ["c:" + padded[i:i + n] for i in range(len(padded) - n + 1)]
+        return feats
+
+    def embed(self, text: str) -> "np.ndarray":
+        v = np.zeros(self.dim, dtype=np.float32)
+        for f in self._features(text):
+            h = zlib.crc32(f.encode("utf-8"))
+            v[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        n = float(np.linalg.norm(v))
+        return v / n if n > 0 else v
+
+
+class ModelEmbedder:
+    def __init__(self, name: str):
+        from sentence_transformers import SentenceTransformer  # type: ignore  # pulls in torch: only when configured
+        self._model = SentenceTransformer(name, device="cpu")
+        self.dim = int(self._model.get_sentence_embedding_dimension())
+
+    def embed(self, text: str) -> "np.ndarray":
+        return self._model.encode(normalize_text(text), normalize_embeddings=True).astype(np.float32)
+
+
+def build_embedder():
+    if SEMANTIC_CACHE_MODEL and HAS_ST:
+        try:
+            return ModelEmbedder(SEMANTIC_CACHE_MODEL)
+        except Exception:
+            pass
+    return HashingVectorizer()
+
+
+# ---- Per-agent index -----------------------------------------------------------
+class AgentIndex:
+    """
+    Ring buffer of unit vectors + answers for one (agent, spec, model).
+    Brute-force dot product while small; above SEMANTIC_CACHE_IVF_MIN rows a spherical k-means
+    IVF is trained and only the nprobe closest lists are scanned. Rows added since the last
+    training sit in a 'fresh' tail that is always scanned; add() reports when that tail grows
+    past 10% of the index, and SemanticCache retrains on a snapshot in a background thread
+    (snapshot() + train_ivf() + install()), so k-means never runs under the cache lock.
+    """
+
+    def __init__(self, dim: int, capacity: int = SEMANTIC_CACHE_MAX_PER_AGENT):
+        self.dim = dim
+        self.capacity = max(1, capacity)
+        self.vecs = np.zeros((min(256, self.capacity), dim), dtype=np.float32)
+        self.expires = np.zeros(len(self.vecs), dtype=np.float64)
+        self.assign = np.full(len(self.vecs), -1, dtype=np.int32)
+        self.answers: List[Optional[str]] = [None] * len(self.vecs)
+        self.questions: List[Optional[str]] = [None] * len(self.vecs)
+        self.n = 0
+        self.next = 0
+        self.centroids: Optional["np.ndarray"] = None
+        self.order: Optional["np.ndarray"] = None
+        self.offsets: Optional["np.ndarray"] = None
+        self.fresh: List[int] = []
+        self.training = False
+
+    def _grow(self) -> None:
+        size = min(self.capacity, len(self.vecs) * 2)
+        extra = size - len(self.vecs)
+        self.vecs = np.vstack([self.vecs, np.zeros((extra, self.dim), dtype=np.float32)])
+        self.expires = np.concatenate([self.expires, np.zeros(extra)])
+        self.assign = np.concatenate([self.assign, np.full(extra, -1, dtype=np.int32)])
+        self.answers.extend([None] * extra)
+        self.questions.extend([None] * extra)
+
+    def add(self, vec: "np.ndarray", question: str, answer: str, ttl: float) -> bool:
+        """Store one row; True when the IVF is due for (re)training."""
+        if self.n < self.capacity:
+            if self.n >= len(self.vecs):
+                self._grow()
+            row = self.n
+            self.n += 1
+        else:
+            row = self.next
+            self.next = (self.next + 1) % self.capacity
+        self.vecs[row] = vec
+        self.expires[row] = time.time() + ttl
+        self.answers[row] = answer
+        self.questions[row] = question
+        self.assign[row] = -1
+        self.fresh.append(row)
+        return self.n >= SEMANTIC_CACHE_IVF_MIN and len(self.fresh) > max(64, self.n // 10)
+
+    def snapshot(self) -> Tuple[int, "np.ndarray"]:
+        """(fresh rows so far, copy of the live vectors) to train on outside the lock."""
+        return len(self.fresh), self.vecs[:self.n].copy()
+
+    def install(self, snap: Tuple[int, "np.ndarray"], trained) -> None:
+        """Swap in an IVF trained on snap; rows written since the snapshot stay in the fresh tail."""
+        seen, data = snap
+        if trained is not None:
+            cents, assign, order, offsets = trained
+            self.centroids, self.order, self.offsets = cents, order, offsets
+            self.assign[:len(data)] = assign
+            later = list(dict.fromkeys(self.fresh[seen:]))
+            self.assign[later] = -1   # new or overwritten since the snapshot: not in the lists yet
+            self.fresh = later
+        self.training = False
+
+    def train(self, iters: int = 8) -> None:
+        # Synchronous retrain (tests/benches); SemanticCache does this off-thread
+        snap = self.snapshot()
+        self.install(snap, train_ivf(snap[1], iters))
+
+    def _candidates(self, q: "np.ndarray") -> "np.ndarray":
+        if self.centroids is None:
+            return np.arange(self.n)
+        nprobe = min(SEMANTIC_CACHE_NPROBE, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        parts = [self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes]
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        rows = rows[self.assign[rows] >= 0]   # drop rows overwritten since training
+        if self.fresh:
+            rows = np.concatenate([rows, np.asarray(self.fresh, dtype=np.int64)])
+        return rows
+
+    def search(self, q: "np.ndarray") -> Optional[Tuple[float, int]]:
+        if self.n == 0:
+            return None
+        rows = self._candidates(q)
+        if not len(rows):
+            return None
+        sims = self.vecs[rows] @ q
+        sims[self.expires[rows] < time.time()] = -1.0
+        i = int(np.argmax(sims))
+        return float(sims[i]), int(rows[i])
+
+
+def train_ivf(data: "np.ndarray", iters: int = 8):
+    """Spherical k-means over data rows: (centroids, assign, order, offsets), or None if too few rows."""
+    n = len(data)
+    nlist = int(min(1024, max(8, np.sqrt(n))))
+    if n < nlist * 4:
+        return None
+    rng = np.random.default_rng(0)
+    sample = data[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+    cents = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        lab = np.argmax(sample @ cents.T, axis=1)
+        for c in range(nlist):
+            members = sample[lab == c]
+            if len(members):
+                m = members.sum(axis=0)
+                norm = np.linalg.norm(m)
+                if norm > 0:
+                    cents[c] = m / norm
+    assign = np.argmax(data @ cents.T, axis=1).astype(np.int32)
+    order = np.argsort(assign, kind="stable").astype(np.int64)
+    offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+    return cents, assign, order, offsets
+
+
+# ---- Facade ---------------------------------------------------------------------
+class SemanticCache:
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = LLM_CACHE_TTL):
+        self.threshold = threshold
+        self.ttl = ttl
+        self._embedder = None
+        self._indexes: Dict[Tuple[int, str, str], AgentIndex] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.adds = 0
+        self.trainings = 0
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = build_embedder()
+        return self._embedder
+
+    def _index(self, agent_id: int, spec: Optional[dict], model: str, create: bool) -> Optional[AgentIndex]:
+        k = (agent_id, spec_hash(spec), model)
+        idx = self._indexes.get(k)
+        if idx is None and create:
+            idx = self._indexes[k] = AgentIndex(self.embedder.dim)
+        return idx
+
+    def lookup(self, agent_id: int, spec: Optional[dict], model: str, question: str,
+               threshold: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        vec = self.embedder.embed(question)   # outside the lock: embedding is the slow part
+        with self._lock:
+            idx = self._index(agent_id, spec, model, create=False)
+            if idx is None:
+                self.misses += 1
+                return None
+            best = idx.search(vec)
+            if best is None or best[0] < (self.threshold if threshold is None else threshold):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return idx.answers[best[1]], best[0]
+
+    def add(self, agent_id: int, spec: Optional[dict], model: str, question: str, answer: str) -> None:
+        if not answer:
+            return
+        vec = self.embedder.embed(question)
+        snap = None
+        with self._lock:
+            idx = self._index(agent_id, spec, model, create=True)
+            if idx.add(vec, question, answer, self.ttl) and not idx.training:
+                idx.training = True
+                snap = idx.snapshot()
+            self.adds += 1
+        if snap is not None:
+            threading.Thread(target=self._train, args=(idx, snap), name="semantic-ivf-train", daemon=True).start()
+
+    def _train(self, idx: AgentIndex, snap) -> None:
+        trained = None
+        try:
+            trained = train_ivf(snap[1])
+        finally:
+            with self._lock:
+                idx.install(snap, trained)
+                self.trainings += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": SEMANTIC_CACHE_ENABLED and HAS_NUMPY,
+            "embedder": type(self._embedder).__name__ if self._embedder else None,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "adds": self.adds,
+            "trainings": self.trainings,
+            "indexes": len(self._indexes),
+            "rows": sum(i.n for i in self._indexes.values()),
+            "ivf_indexes": sum(1 for i in self._indexes.values() if i.centroids is not None),
+        }
+
+
+def semantic_enabled_for(spec: Optional[dict]) -> bool:
+    """Global SEMANTIC_CACHE_ENABLED, overridable per agent via spec {"cache": {"semantic": true|false}}."""
+    if not HAS_NUMPY or not cache_enabled_for(spec):
+        return False
+    c = (spec or {}).get("cache")
+    if isinstance(c, dict) and "semantic" in c:
+        return bool(c["semantic"])
+    return SEMANTIC_CACHE_ENABLED
+
+semantic_cache = SemanticCache()
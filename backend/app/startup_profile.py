@@ -0,0 +1,138 @@
+﻿import os
+import sys
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+# ---- Startup profiling (STARTUP_PROFILE=1) ------------------------------------------------
+# install() runs first thing in app.main. With the flag on, it puts a finder at the front of
+# sys.meta_path that times each module's exec_module (cumulative and self, per thread), so
+# every import made while app.main loads is recorded, like `python -X importtime`, but kept
+# in-process. finish() runs once the lifespan startup hooks are done. It stops recording,
+# adds the router registry timings and the startup hook time, logs a one-line summary and
+# appends a JSON line to STARTUP_PROFILE_PATH (if set) so boots can be compared over time.
+# The record is served at /debug/startup. With the flag off, only the cheap totals are kept.
+
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0").lower() in ("1", "true", "yes")
+STARTUP_PROFILE_PATH = os.getenv("STARTUP_PROFILE_PATH", "").strip()   # JSONL, one record per worker boot
+
+log = logging.getLogger("app.startup")
+
+_t_install: Optional[float] = None
+_modules: Dict[str, List[float]] = {}          # name -> [cumulative_ms, self_ms]
+_marks: Dict[str, float] = {}                  # label -> ms since install()
+_record: Dict[str, Any] = {}
+_local = threading.local()
+
+
+class _TimingFinder:
+    """Meta-path finder that defers to the real finders and times the loader they return."""
+
+    def find_spec(self, name, path=None, target=None):
+        if getattr(_local, "finding", False):
+            return None
+        _local.finding = True
+        try:
+            spec = None
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+        finally:
+            _local.finding = False
+        loader = getattr(spec, "loader", None)
+        # builtin/frozen importers are classes shared by every module: leave them alone
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+            _wrap(loader, name)
+        return spec
+
+
+def _wrap(loader, name: str) -> None:
+    exec_module = loader.exec_module
+
+    def timed_exec_module(module):
+        stack = _local.__dict__.setdefault("stack", [])
+        frame = [0.0]                             # children's cumulative ms
+        stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            total = 1000 * (time.perf_counter() - t0)
+            stack.pop()
+            if stack:
+                stack[-1][0] += total
+            _modules[name] = [round(total, 3), round(total - frame[0], 3)]
+            try:
+                del loader.exec_module            # back to the class method
+            except AttributeError:
+                pass
+
+    loader.exec_module = timed_exec_module
+
+
+_finder = _TimingFinder()
+
+
+def install() -> None:
+    global _t_install
+    if _t_install is not None:
+        return
+    _t_install = time.perf_counter()
+    if STARTUP_PROFILE:
+        sys.meta_path.insert(0, _finder)
+
+
+def _since_install() -> float:
+    return round(1000 * (time.perf_counter() - (_t_install or time.perf_counter())), 2)
+
+
+def mark(label: str) -> None:
+    _marks[label] = _since_install()
+
+
+def finish(routers: List[Dict[str, Any]], lazy: Optional[Dict[str, float]] = None) -> None:
+    if _finder in sys.meta_path:
+        sys.meta_path.remove(_finder)
+    mark("startup_complete")
+    if _record:
+        return   # a second lifespan in the same process (tests): keep the boot record
+    _record.update({
+        "ts": time.time(),
+        "pid": os.getpid(),
+        "profiled": STARTUP_PROFILE,
+        "marks_ms": dict(_marks),
+        "routers": routers,
+        "module_count": len(_modules),
+    })
+    slow = sorted((r for r in routers if r.get("loaded")), key=lambda r: -r["import_ms"])[:3]
+    log.info("startup: main imported in %.0fms, ready in %.0fms; slowest routers: %s",
+             _marks.get("main_imported", 0.0), _marks["startup_complete"],
+             ", ".join(f"{r['router']} {r['import_ms']:.0f}ms" for r in slow))
+    if STARTUP_PROFILE and STARTUP_PROFILE_PATH:
+        try:
+            with open(STARTUP_PROFILE_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps({**_record, "lazy_ms": lazy or {},
+                                    "top_modules": top_modules(30, "cumulative")}) + "\n")
+        except OSError as e:
+            log.warning("could not write startup profile to %s: %s", STARTUP_PROFILE_PATH, e)
+
+
+def top_modules(n: int = 30, sort: str = "cumulative", prefix: str = "") -> List[Dict[str, Any]]:
+    key = 1 if sort == "self" else 0
+    rows = [(name, v) for name, v in _modules.items() if name.startswith(prefix)]
+    rows.sort(key=lambda kv: -kv[1][key])
+    return [{"module": name, "cumulative_ms": v[0], "self_ms": v[1]} for name, v in rows[:n]]
+
+
+def report(n: int = 30, sort: str = "cumulative", prefix: str = "") -> Dict[str, Any]:
+    out = dict(_record) if _record else {"profiled": STARTUP_PROFILE, "marks_ms": dict(_marks)}
+    if STARTUP_PROFILE:
+        out["modules"] = top_modules(n, sort, prefix)
+    else:
+        out["note"] = "set STARTUP_PROFILE=1 to record per-module import times"
+    return out
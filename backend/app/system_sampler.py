@@ -0,0 +1,221 @@
+﻿import os
+import gc
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import db as app_db
+from .lazy_import import has_module, lazy
+
+# ---- Process/runtime sampler --------------------------------------------------------------
+# One asyncio task takes a sample every SAMPLER_INTERVAL_S and appends it to a ring buffer of
+# SAMPLER_HISTORY samples, so /monitor/stats and /monitor/series return at once and never
+# sample (or block) inside a request. Each sample has:
+#   cpu/mem        psutil when installed (cpu_percent(interval=None) is the delta since the
+#                  previous sample); otherwise process CPU from os.times() and RSS from /proc
+#   loop_lag_ms    how late the sampler's own sleep woke up (time the loop was busy)
+#   gc             collections and pause ms per interval, from gc.callbacks
+#   threadpool     anyio limiter (sync endpoints): busy/total threads and tasks waiting
+#   db_pool        per engine: size, checked out, overflow, plus checkouts and peak in the interval
+
+SAMPLER_INTERVAL_S = float(os.getenv("SAMPLER_INTERVAL_S", "1"))
+SAMPLER_HISTORY = int(os.getenv("SAMPLER_HISTORY", "300"))          # samples kept (5 min at 1s)
+
+psutil = lazy("psutil")
+HAS_PSUTIL = has_module("psutil")
+
+log = logging.getLogger("app.sampler")
+
+
+# ---- GC pauses (gc.callbacks run in whichever thread triggered the collection) ----
+class _GCStats:
+    def __init__(self):
+        self._local = threading.local()
+        self.collections = [0, 0, 0]
+        self.pause_ms = 0.0
+        self.max_pause_ms = 0.0
+
+    def callback(self, phase: str, info: Dict[str, int]) -> None:
+        if phase == "start":
+            self._local.t0 = time.perf_counter()
+            return
+        t0 = getattr(self._local, "t0", None)
+        if t0 is None:
+            return
+        ms = 1000 * (time.perf_counter() - t0)
+        self.collections[info.get("generation", 2)] += 1
+        self.pause_ms += ms
+        self.max_pause_ms = max(self.max_pause_ms, ms)
+
+    def take(self) -> Dict[str, Any]:
+        out = {"collections": list(self.collections), "pause_ms": round(self.pause_ms, 3),
+               "max_pause_ms": round(self.max_pause_ms, 3)}
+        self.collections = [0, 0, 0]
+        self.pause_ms = self.max_pause_ms = 0.0
+        return out
+
+
+# ---- DB pool checkouts (pool events registered per engine; they survive pool recreation) ----
+class _PoolStats:
+    __slots__ = ("checked_out", "peak", "checkouts")
+
+    def __init__(self):
+        self.checked_out = 0
+        self.peak = 0
+        self.checkouts = 0
+
+    def on_checkout(self, dbapi_conn, record, proxy):
+        self.checked_out += 1
+        self.checkouts += 1
+        self.peak = max(self.peak, self.checked_out)
+
+    def on_checkin(self, dbapi_conn, record):
+        self.checked_out = max(0, self.checked_out - 1)
+
+
+_pools: "weakref.WeakKeyDictionary[Engine, _PoolStats]" = weakref.WeakKeyDictionary()
+
+
+def _watch(engine: Engine) -> _PoolStats:
+    st = _pools.get(engine)
+    if st is None:
+        st = _pools[engine] = _PoolStats()
+        event.listen(engine, "checkout", st.on_checkout)
+        event.listen(engine, "checkin", st.on_checkin)
+    return st
+
+
+def _pool_sample(engine: Engine) -> Dict[str, Any]:
+    out = app_db.pool_status(engine)
+    st = _watch(engine)
+    out["checkouts"], out["peak_checked_out"] = st.checkouts, st.peak
+    st.checkouts, st.peak = 0, st.checked_out
+    return out
+
+
+def _db_pools() -> Dict[str, Any]:
+    out = {"sync": _pool_sample(app_db.engine)}
+    if app_db._async_engine is not None:
+        out["async"] = _pool_sample(app_db._async_engine.sync_engine)
+    return out
+
+
+# ---- CPU / memory ----
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _CPU:
+    """Process CPU % since the previous call, from os.times() (used without psutil)."""
+
+    def __init__(self):
+        self._last = (time.monotonic(), self._cpu())
+
+    @staticmethod
+    def _cpu() -> float:
+        t = os.times()
+        return t.user + t.system
+
+    def percent(self) -> float:
+        now, cpu = time.monotonic(), self._cpu()
+        (t0, c0), self._last = self._last, (now, cpu)
+        return round(100 * (cpu - c0) / (now - t0), 1) if now > t0 else 0.0
+
+
+def _threadpool() -> Dict[str, Any]:
+    # Must run on the event loop thread (anyio limiter state is per loop)
+    try:
+        from anyio.to_thread import current_default_thread_limiter
+        lim = current_default_thread_limiter()
+        return {"busy": lim.borrowed_tokens, "total": lim.total_tokens, "waiting": lim.statistics().tasks_waiting}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+class SystemSampler:
+    def __init__(self, interval_s: float = SAMPLER_INTERVAL_S, history: int = SAMPLER_HISTORY):
+        self.interval_s = interval_s
+        self.samples: deque = deque(maxlen=max(1, history))
+        self._gc = _GCStats()
+        self._cpu = _CPU()
+        self._proc = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is not None or self.interval_s <= 0:
+            return
+        gc.callbacks.append(self._gc.callback)
+        _watch(app_db.engine)
+        if HAS_PSUTIL:
+            self._proc = psutil.Process()
+            self._proc.cpu_percent(None)
+            psutil.cpu_percent(interval=None)   # first call only primes the delta
+        self._task = asyncio.create_task(self._run(), name="system-sampler")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._gc.callback in gc.callbacks:
+            gc.callbacks.remove(self._gc.callback)
+
+    async def _run(self) -> None:
+        lag_ms = 0.0
+        while True:
+            try:
+                self.samples.append(self.sample(lag_ms))
+            except Exception:
+                log.exception("system sample failed")
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            lag_ms = max(0.0, 1000 * (time.perf_counter() - t0 - self.interval_s))
+
+    def sample(self, loop_lag_ms: Optional[float] = None) -> Dict[str, Any]:
+        s: Dict[str, Any] = {"ts": round(time.time(), 3), "loop_lag_ms": None if loop_lag_ms is None else round(loop_lag_ms, 3)}
+        if HAS_PSUTIL and self._proc is not None:
+            s["cpu"] = psutil.cpu_percent(interval=None)
+            s["mem"] = psutil.virtual_memory()._asdict()
+            s["process"] = {"cpu": self._proc.cpu_percent(None), "rss": self._proc.memory_info().rss,
+                            "threads": self._proc.num_threads()}
+        else:
+            s["cpu"] = None
+            s["mem"] = None
+            s["process"] = {"cpu": self._cpu.percent(), "rss": _rss_bytes(), "threads": threading.active_count()}
+        if hasattr(os, "getloadavg"):
+            s["load"] = [round(x, 2) for x in os.getloadavg()]
+        s["gc"] = self._gc.take()
+        s["threadpool"] = _threadpool()
+        s["db_pool"] = _db_pools()
+        return s
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        return self.samples[-1] if self.samples else None
+
+    def series(self, seconds: float) -> List[Dict[str, Any]]:
+        since = time.time() - seconds
+        return [s for s in self.samples if s["ts"] >= since]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"interval_s": self.interval_s, "history": self.samples.maxlen, "samples": len(self.samples),
+                "running": self._task is not None, "psutil": HAS_PSUTIL}
+
+
+sampler = SystemSampler()
@@ -4,6 +4,8 @@ import httpx
 import base64
 import mimetypes
 
+from .llm_transport import transport
+
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 
 def _headers():
@@ -24,10 +26,9 @@ async def _ensure_data_url(image_ref: str) -> str:
     mime, _ = mimetypes.guess_type(image_ref)
     if not mime:
         mime = "image/jpeg"
-    async with httpx.AsyncClient(timeout=60, follow_redirects=True) as client:
-        r = await client.get(image_ref)
-        r.raise_for_status()
-        return _to_data_url(r.content, mime)
+    r = await transport.get(image_ref, timeout=60, follow_redirects=True)
+    r.raise_for_status()
+    return _to_data_url(r.content, mime)
 
 def _extract_json(text: str):
     # Try direct JSON
@@ -88,25 +89,24 @@ async def _chat_vision(data_url: str, model: str):
         "max_tokens": 400,
     }
 
-    async with httpx.AsyncClient(timeout=90) as client:
-        r = await client.post("https://api.openai.com/v1/chat/completions", headers=_headers(), json=body)
-        # If the model can’t do vision or we shaped it wrong, raise for caller to try fallback
-        r.raise_for_status()
-        data = r.json()
-        txt = data["choices"][0]["message"]["content"]
-        parsed = _extract_json(txt) or {}
-        # Normalize shape
-        damaged = parsed.get("damaged_parts", [])
-        low = parsed.get("cost_low", 0)
-        high = parsed.get("cost_high", 0)
-        notes = parsed.get("notes", "")
-        return {
-            "damaged_parts": damaged,
-            "cost_low": low,
-            "cost_high": high,
-            "notes": notes,
-            "raw": txt,
-        }
+    r = await transport.post("https://api.openai.com/v1/chat/completions", headers=_headers(), json=body, timeout=90)
+    # If the model can’t do vision or we shaped it wrong, raise for caller to try fallback
+    r.raise_for_status()
+    data = r.json()
+    txt = data["choices"][0]["message"]["content"]
+    parsed = _extract_json(txt) or {}
+    # Normalize shape
+    damaged = parsed.get("damaged_parts", [])
+    low = parsed.get("cost_low", 0)
+    high = parsed.get("cost_high", 0)
+    notes = parsed.get("notes", "")
+    return {
+        "damaged_parts": damaged,
+        "cost_low": low,
+        "cost_high": high,
+        "notes": notes,
+        "raw": txt,
+    }
 
 async def detect_damage(image_ref: str, model: str = "gpt-4o-mini"):
     """
@@ -0,0 +1,81 @@
+"""
+admin.summary / metrics.stats totals: the old COUNT(*) + COUNT(DISTINCT owner_id) scans on
+agents versus the agent_counters read (uncached) and the TTL-cached read, at a given table size.
+
+Runs against DATABASE_URL, or a temporary SQLite file by default:
+
+    cd backend && python -m bench.agent_counters_bench --agents 200000 --repeat 50
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from sqlalchemy import func, insert, select
+
+from app.db import Base, engine, SessionLocal
+from app.models import Agent
+from app import agent_counters
+
+
+def seed(n: int) -> None:
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        have = db.execute(select(func.count(Agent.id))).scalar()
+        rows = [{"name": f"a{i}", "category": "bench", "owner_id": None, "published": i % 3 == 0}
+                for i in range(have, n)]
+        for i in range(0, len(rows), 10000):
+            db.execute(insert(Agent), rows[i:i + 10000])
+        agent_counters.reconcile(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+def old_summary(db):
+    return (db.query(func.count(Agent.id)).scalar(),
+            db.query(func.count(Agent.id)).filter(Agent.published == True).scalar(),
+            db.query(func.count(func.distinct(Agent.owner_id))).scalar())
+
+
+def timed(fn, repeat: int) -> list:
+    lat = []
+    db = SessionLocal()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(db)
+            lat.append(1000 * (time.perf_counter() - t0))
+    finally:
+        db.close()
+    return lat
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--agents", type=int, default=200000)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+    seed(args.agents)
+    print(f"db={engine.url.render_as_string(hide_password=True)} agents={args.agents}")
+    for label, fn in (("COUNT scans (old)", old_summary),
+                      ("agent_counters read", agent_counters.read),
+                      ("TTL-cached read", agent_counters.counter_cache.get)):
+        lat = timed(fn, args.repeat)
+        print(f"  {label:20s}: p50={pct(lat, 50):8.3f}ms p95={pct(lat, 95):8.3f}ms")
+    with SessionLocal() as db:
+        print(f"  counters={agent_counters.read(db)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
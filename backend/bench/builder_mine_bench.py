@@ -0,0 +1,119 @@
+"""
+/builder/mine latency for one owner with thousands of bots: the old per-bot meta.json reads
+(os.makedirs + open + json.load per agent) versus the bot_reviews table (one batch query).
+
+Runs in-process over ASGI against DATABASE_URL, or a temporary SQLite file by default:
+
+    cd backend && python -m bench.builder_mine_bench --bots 5000 --repeat 20
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import select, func
+
+from app.db import Base, engine, SessionLocal, get_current_user_optional
+from app.models import Agent, BotReview
+from app.routes import builder
+
+OWNER_ID = 424242
+
+
+def seed(n: int, data_dir: str) -> None:
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        have = db.query(func.count(Agent.id)).filter(Agent.owner_id == OWNER_ID).scalar() or 0
+        agents = [Agent(name=f"mine-{i}", category="bench", description="builder bench", tone_profile="friendly",
+                        published=False, owner_id=OWNER_ID, spec={}) for i in range(have, n)]
+        db.add_all(agents)
+        db.flush()
+        db.add_all([BotReview(agent_id=a.id, review_status="submitted", safety_score=90, safety_rating="pass",
+                              safety_text="ok") for a in agents])
+        db.commit()
+        ids = db.execute(select(Agent.id).where(Agent.owner_id == OWNER_ID)).scalars().all()
+    finally:
+        db.close()
+    for bot_id in ids:
+        d = os.path.join(data_dir, "bots", str(bot_id))
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"review_status": "submitted", "admin_name": None, "safety_score": 90, "safety_rating": "pass"}, f, indent=2)
+
+
+def legacy_mine(data_dir: str) -> dict:
+    # The pre-bot_reviews handler body, kept here only for comparison
+    db = SessionLocal()
+    try:
+        items = []
+        for a in db.query(Agent).filter(Agent.owner_id == OWNER_ID).all():
+            p = os.path.join(data_dir, "bots", str(a.id)); os.makedirs(p, exist_ok=True)
+            try:
+                with open(os.path.join(p, "meta.json"), "r", encoding="utf-8") as f:
+                    m = json.load(f)
+            except Exception:
+                m = {}
+            items.append({"id": a.id, "creator_name": a.name or "", "review_status": m.get("review_status", "draft"),
+                          "safety_score": m.get("safety_score"), "safety_rating": m.get("safety_rating")})
+        return {"items": items}
+    finally:
+        db.close()
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bots", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    data_dir = tempfile.mkdtemp()
+    seed(args.bots, data_dir)
+    app = FastAPI()
+    app.include_router(builder.router)
+    app.dependency_overrides[get_current_user_optional] = lambda: {"id": OWNER_ID, "name": "bench", "email": ""}
+    print(f"db={engine.url.render_as_string(hide_password=True)} bots={args.bots} repeat={args.repeat}")
+
+    lat = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        n = len(legacy_mine(data_dir)["items"])
+        lat.append(1000 * (time.perf_counter() - t0))
+    print(f"    files: p50={pct(lat, 50):8.1f}ms p95={pct(lat, 95):8.1f}ms  items={n}  (handler body only)")
+
+    lat = []
+    user = {"id": OWNER_ID, "name": "bench", "email": ""}
+    for _ in range(args.repeat):
+        db = SessionLocal()
+        try:
+            t0 = time.perf_counter()
+            n = len(json.loads(builder.my_bots(db=db, user=user).body)["items"])
+            lat.append(1000 * (time.perf_counter() - t0))
+        finally:
+            db.close()
+    print(f"    table: p50={pct(lat, 50):8.1f}ms p95={pct(lat, 95):8.1f}ms  items={n}  (handler body only)")
+
+    lat = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            r = await client.get("/builder/mine")
+            lat.append(1000 * (time.perf_counter() - t0))
+    print(f"    table: p50={pct(lat, 50):8.1f}ms p95={pct(lat, 95):8.1f}ms  items={len(r.json()['items'])}  (full request over ASGI)")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,147 @@
+"""
+Calendar read paths for one calendar with tens of thousands of bookings: the old in-memory
+scan (every slot checked against every booking, ISO strings re-parsed per slot) versus the
+calendar_bookings table + per-worker IntervalIndex (bisect conflict check, one grid walk per day).
+
+Runs against DATABASE_URL, or a temporary SQLite file by default:
+
+    cd backend && python -m bench.calendar_bench --bookings 20000 --repeat 50
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.db import Base, engine, SessionLocal
+from app.models import Calendar, CalendarBooking
+from app.calendar_store import calendar_store, get_tz, to_minutes, from_minutes, day_slots, availability, work_window
+
+CAL_ID = "benchcal"
+FIRST_DAY = date(2026, 1, 1)
+
+
+def seed(n: int) -> list:
+    """n bookings on distinct 15-minute work slots from FIRST_DAY on; returns them as legacy dicts."""
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        cal = db.get(Calendar, CAL_ID)
+        if cal is None:
+            cal = Calendar(id=CAL_ID, owner_name="bench", owner_email="bench@example.com",
+                           timezone="America/Los_Angeles", slot_minutes=15, work_start_hour=9, work_end_hour=17)
+            db.add(cal)
+            db.flush()
+        db.query(CalendarBooking).filter(CalendarBooking.calendar_id == CAL_ID).delete()
+        per_day = (cal.work_end_hour - cal.work_start_hour) * 60 // cal.slot_minutes
+        rnd = random.Random(7)
+        starts = []
+        for k in range(-(-n * 2 // per_day)):              # ~half of every day booked
+            first, _ = work_window(cal, FIRST_DAY + timedelta(days=k))
+            starts.extend(first + i * cal.slot_minutes for i in range(per_day) if rnd.random() < 0.5)
+        starts = sorted(rnd.sample(starts, min(n, len(starts))))
+        db.add_all([CalendarBooking(calendar_id=CAL_ID, name="b", email="b@example.com",
+                                    start_min=s, end_min=s + cal.slot_minutes) for s in starts])
+        db.commit()
+        tz = get_tz(cal.timezone)
+        return [{"start": from_minutes(s, tz), "end": from_minutes(s + cal.slot_minutes, tz)} for s in starts]
+    finally:
+        db.close()
+
+
+def legacy_slots(cfg: dict, booked: list, d: date) -> list:
+    # The pre-calendar_bookings handler body, kept here only for comparison
+    tz = get_tz(cfg["timezone"])
+    start_dt = datetime(d.year, d.month, d.day, cfg["work_start_hour"], 0, tzinfo=tz)
+    end_dt = datetime(d.year, d.month, d.day, cfg["work_end_hour"], 0, tzinfo=tz)
+    step = timedelta(minutes=cfg["slot_minutes"])
+    slots = []
+    cur = start_dt
+    while cur + step <= end_dt:
+        slots.append({"start": cur.isoformat(), "end": (cur + step).isoformat()})
+        cur += step
+    available = []
+    for s in slots:
+        s_start = datetime.fromisoformat(s["start"])
+        s_end = datetime.fromisoformat(s["end"])
+        if not any(s_start < b["end"] and b["start"] < s_end for b in booked):
+            available.append(s)
+    return available
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+def timed(fn, repeat: int):
+    lat, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        lat.append(1000 * (time.perf_counter() - t0))
+    return lat, out
+
+
+def report(label: str, lat: list, extra: str) -> None:
+    print(f"  {label:<24} p50={pct(lat, 50):9.3f}ms p95={pct(lat, 95):9.3f}ms  {extra}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bookings", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    booked = seed(args.bookings)
+    print(f"db={engine.url.render_as_string(hide_password=True)} bookings={len(booked)} repeat={args.repeat}")
+
+    db = SessionLocal()
+    try:
+        cal = db.get(Calendar, CAL_ID)
+        cfg = {"timezone": cal.timezone, "slot_minutes": cal.slot_minutes,
+               "work_start_hour": cal.work_start_hour, "work_end_hour": cal.work_end_hour}
+        rnd = random.Random(11)
+        span = (booked[-1]["start"].date() - FIRST_DAY).days
+        days = [FIRST_DAY + timedelta(days=rnd.randrange(span)) for _ in range(args.repeat)]
+
+        t0 = time.perf_counter()
+        calendar_store.read(db, CAL_ID, lambda idx: None)
+        print(f"  first sync (cold index)  {1000 * (time.perf_counter() - t0):9.1f}ms")
+
+        it = iter(days * 2)
+        lat, out = timed(lambda: legacy_slots(cfg, booked, next(it)), args.repeat)
+        report("legacy slots/day", lat, f"free={len(out)}")
+        it = iter(days * 2)
+        lat, out = timed(lambda: calendar_store.read(db, CAL_ID, lambda idx: day_slots(idx, cal, next(it))), args.repeat)
+        report("index slots/day", lat, f"free={len(out)}  (incl. sync query)")
+
+        it = iter(days * 2)
+        lat, out = timed(lambda: [legacy_slots(cfg, booked, d + timedelta(days=k))
+                                  for d in [next(it)] for k in range(7)], max(1, args.repeat // 5))
+        report("legacy 7-day", lat, f"days={len(out)}")
+        it = iter(days * 2)
+        lat, out = timed(lambda: calendar_store.read(db, CAL_ID, lambda idx: availability(idx, cal, next(it), 7)),
+                         args.repeat)
+        report("index 7-day", lat, f"days={len(out)}")
+
+        probes = [(b["start"], b["end"]) for b in rnd.sample(booked, min(args.repeat, len(booked)))]
+        it = iter(probes * 2)
+        lat, hit = timed(lambda: any(s < b["end"] and b["start"] < e for s, e in [next(it)] for b in booked),
+                         len(probes))
+        report("legacy conflict check", lat, f"conflict={hit}")
+        it = iter(probes * 2)
+        lat, hit = timed(lambda: calendar_store.read(db, CAL_ID, lambda idx: idx.conflicts(*map(to_minutes, next(it)))),
+                         len(probes))
+        report("index conflict check", lat, f"conflict={hit}  (incl. sync query)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Double-booking stress: several worker processes (each with its own app instance and interval
+index, like uvicorn --workers) fire concurrent POST /calendar/{id}/book requests at one slot.
+
+  round 1  every client books the same slot with its own Idempotency-Key -> exactly one 200, rest 409
+  round 2  every client retries one request with a shared Idempotency-Key -> all 200 with the same
+           body, exactly one row written
+
+Runs against DATABASE_URL, or a temporary SQLite file by default; exits non-zero on a violation:
+
+    cd backend && python -m bench.calendar_booking_stress --procs 4 --clients 32 --rounds 20
+"""
+import os
+import sys
+import time
+import uuid
+import queue
+import asyncio
+import argparse
+import tempfile
+import multiprocessing as mp
+from collections import Counter
+from datetime import date, timedelta
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from sqlalchemy import select, func
+
+from app.db import Base, engine, SessionLocal
+from app.models import Calendar, CalendarBooking
+from app.calendar_store import ensure_sqlite_booking_guard, work_window, from_minutes, get_tz
+
+CAL_ID = "stresscal"
+FIRST_DAY = date(2026, 3, 2)
+
+
+def setup() -> None:
+    Base.metadata.create_all(engine)
+    ensure_sqlite_booking_guard(engine)
+    db = SessionLocal()
+    try:
+        db.query(CalendarBooking).filter(CalendarBooking.calendar_id == CAL_ID).delete()
+        if db.get(Calendar, CAL_ID) is None:
+            db.add(Calendar(id=CAL_ID, owner_name="stress", owner_email="stress@example.com", timezone="UTC",
+                            slot_minutes=30, work_start_hour=0, work_end_hour=23))
+        db.commit()
+    finally:
+        db.close()
+
+
+def slot(i: int) -> dict:
+    first, _ = work_window(Calendar(timezone="UTC", work_start_hour=0, work_end_hour=23), FIRST_DAY)
+    s = first + 30 * i
+    tz = get_tz("UTC")
+    return {"start": from_minutes(s, tz).isoformat(), "end": from_minutes(s + 30, tz).isoformat()}
+
+
+async def fire(client, n: int, body: dict, shared_key: str = "") -> list:
+    async def one(k: int):
+        key = shared_key or uuid.uuid4().hex
+        r = await client.post(f"/calendar/{CAL_ID}/book", json=body, headers={"Idempotency-Key": key})
+        return r.status_code, r.text if r.status_code == 200 else ""
+    return await asyncio.gather(*(one(k) for k in range(n)))
+
+
+def worker(rounds: int, clients: int, barrier, out) -> None:
+    import httpx
+    from fastapi import FastAPI
+    from app.routes import calendar
+
+    app = FastAPI()
+    app.include_router(calendar.router)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stress",
+                                     timeout=60) as client:
+            for r in range(rounds):
+                body = {"name": "racer", "email": "racer@example.com", **slot(2 * r)}
+                barrier.wait()
+                out.put(("distinct", r, await fire(client, clients, body)))
+                body = {"name": "retry", "email": "retry@example.com", **slot(2 * r + 1)}
+                barrier.wait()
+                out.put(("shared", r, await fire(client, clients, body, shared_key=f"retry-{r}")))
+
+    asyncio.run(run())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--procs", type=int, default=4)
+    ap.add_argument("--clients", type=int, default=32, help="concurrent requests per process per round")
+    ap.add_argument("--rounds", type=int, default=20, help="max 23 (two slots per round on one day)")
+    args = ap.parse_args()
+
+    setup()
+    print(f"db={engine.url.render_as_string(hide_password=True)} procs={args.procs} "
+          f"clients/proc={args.clients} rounds={args.rounds}")
+    ctx = mp.get_context("spawn")
+    barrier, out = ctx.Barrier(args.procs), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(args.rounds, args.clients, barrier, out)) for _ in range(args.procs)]
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+    results = {}
+    for _ in range(args.procs * args.rounds * 2):
+        while True:
+            try:
+                kind, r, res = out.get(timeout=1)
+                break
+            except queue.Empty:
+                if any(p.exitcode not in (None, 0) for p in procs):
+                    for p in procs:
+                        p.terminate()
+                    print("  a worker process failed")
+                    return 2
+        results.setdefault((kind, r), []).extend(res)
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - t0
+
+    db = SessionLocal()
+    try:
+        rows = dict(db.execute(select(CalendarBooking.start_min, func.count())
+                               .where(CalendarBooking.calendar_id == CAL_ID)
+                               .group_by(CalendarBooking.start_min)).all())
+    finally:
+        db.close()
+
+    failures = 0
+    totals = Counter()
+    for (kind, r), res in sorted(results.items()):
+        codes = Counter(code for code, _ in res)
+        totals.update({f"{kind}:{c}": n for c, n in codes.items()})
+        if kind == "distinct":
+            ok = codes[200] == 1 and codes[409] == len(res) - 1
+        else:
+            ok = codes[200] == len(res) and len({body for _, body in res}) == 1
+        if not ok:
+            failures += 1
+            print(f"  VIOLATION round={r} {kind}: {dict(codes)}")
+    written = sum(rows.values())
+    if written != 2 * args.rounds or any(n != 1 for n in rows.values()):
+        failures += 1
+        print(f"  VIOLATION rows: expected {2 * args.rounds} distinct slots, got {written} rows over {len(rows)} slots")
+
+    print(f"  requests={sum(totals.values())} in {elapsed:.1f}s  {dict(sorted(totals.items()))}")
+    print(f"  rows written={written}  {'OK: exactly one winner per slot' if not failures else f'{failures} violations'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
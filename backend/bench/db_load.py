@@ -0,0 +1,110 @@
+"""
+Requests/sec for the same lookup served three ways, to compare the DB layers:
+
+  blocking   async def + sync Session (the old /support/ask: stalls the event loop)
+  threadpool def + sync Session via get_db (the old store/owner routes)
+  async      async def + AsyncSession via get_async_db (migrated routes)
+
+Runs in-process over ASGI against DATABASE_URL, or a temporary SQLite file by default:
+
+    cd backend && python -m bench.db_load --agents 5000 --concurrency 64 --seconds 5
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import httpx
+from fastapi import FastAPI, Depends
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import Base, engine, SessionLocal, get_db, get_async_db, dispose_async_engine
+from app.models import Agent
+
+
+def seed(n: int) -> None:
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        have = db.query(func.count(Agent.id)).scalar() or 0
+        db.add_all([Agent(name=f"bench-{i}", category="bench", description="load test agent",
+                          published=bool(i % 2), spec={}) for i in range(have, n)])
+        db.commit()
+    finally:
+        db.close()
+
+
+def build_app(n: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/blocking/{agent_id}")
+    async def blocking(agent_id: int):
+        db = SessionLocal()
+        try:
+            a = db.query(Agent.id, Agent.name).filter(Agent.id == agent_id).first()
+            c = db.query(func.count(Agent.id)).filter(Agent.published == True).scalar()
+            return {"id": a and a.id, "published": c}
+        finally:
+            db.close()
+
+    @app.get("/threadpool/{agent_id}")
+    def threadpool(agent_id: int, db: Session = Depends(get_db)):
+        a = db.query(Agent.id, Agent.name).filter(Agent.id == agent_id).first()
+        c = db.query(func.count(Agent.id)).filter(Agent.published == True).scalar()
+        return {"id": a and a.id, "published": c}
+
+    @app.get("/async/{agent_id}")
+    async def async_(agent_id: int, db: AsyncSession = Depends(get_async_db)):
+        a = (await db.execute(select(Agent.id, Agent.name).where(Agent.id == agent_id))).first()
+        c = (await db.execute(select(func.count(Agent.id)).where(Agent.published == True))).scalar()
+        return {"id": a and a.id, "published": c}
+
+    return app
+
+
+async def run(app: FastAPI, path: str, n: int, concurrency: int, seconds: float) -> dict:
+    done = 0
+    errors = 0
+    stop = time.perf_counter() + seconds
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            nonlocal done, errors
+            while time.perf_counter() < stop:
+                r = await client.get(f"/{path}/{random.randint(1, n)}")
+                if r.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+        t0 = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - t0
+    return {"mode": path, "requests": done, "errors": errors, "rps": done / elapsed}
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--agents", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--modes", nargs="+", default=["blocking", "threadpool", "async"])
+    args = ap.parse_args()
+
+    seed(args.agents)
+    app = build_app(args.agents)
+    print(f"db={engine.url.render_as_string(hide_password=True)} agents={args.agents} concurrency={args.concurrency}")
+    for mode in args.modes:
+        r = await run(app, mode, args.agents, args.concurrency, args.seconds)
+        print(f"{r['mode']:>10}: {r['rps']:8.1f} req/s  ({r['requests']} ok, {r['errors']} errors)")
+    await dispose_async_engine()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,126 @@
+"""
+"First free 30-minute slot across N calendars this week": N x 7 GET /calendar/{id}/slots calls
+intersected client-side (what scheduling bots do today) versus one POST /calendar/freebusy.
+
+Runs in-process over ASGI against DATABASE_URL, or a temporary SQLite file by default:
+
+    cd backend && python -m bench.freebusy_bench --calendars 50 --per-day 1 --repeat 10
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import httpx
+from fastapi import FastAPI
+
+from app.db import Base, engine, SessionLocal
+from app.models import Calendar, CalendarBooking
+from app.calendar_store import work_window, ensure_sqlite_booking_guard
+from app.routes import calendar
+from app import freebusy
+
+FIRST_DAY = date(2026, 3, 2)
+TIMEZONES = ("America/New_York", "Europe/London")   # overlapping working hours, so "all" has answers
+
+
+def seed(n: int, per_day: int) -> list:
+    Base.metadata.create_all(engine)
+    ensure_sqlite_booking_guard(engine)
+    rnd = random.Random(5)
+    db = SessionLocal()
+    try:
+        ids = [f"fb{i:04d}" for i in range(n)]
+        db.query(CalendarBooking).filter(CalendarBooking.calendar_id.in_(ids)).delete()
+        db.query(Calendar).filter(Calendar.id.in_(ids)).delete()
+        cals = [Calendar(id=i, owner_name="bench", owner_email="bench@example.com", timezone=TIMEZONES[k % len(TIMEZONES)],
+                         slot_minutes=30, work_start_hour=8, work_end_hour=18) for k, i in enumerate(ids)]
+        db.add_all(cals)
+        db.flush()
+        for cal in cals:
+            for d in range(7):
+                first, last = work_window(cal, FIRST_DAY + timedelta(days=d))
+                grid = list(range(first, last, 30))
+                db.add_all([CalendarBooking(calendar_id=cal.id, name="b", email="b@example.com", start_min=s, end_min=s + 30)
+                            for s in rnd.sample(grid, min(per_day, len(grid)))])
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+async def per_calendar(client, ids: list) -> set:
+    common = None
+    for cal_id in ids:
+        starts = set()
+        for d in range(7):
+            r = await client.get(f"/calendar/{cal_id}/slots", params={"date_str": (FIRST_DAY + timedelta(days=d)).isoformat()})
+            starts.update(s["start"] for s in r.json()["slots"])
+        # normalise to UTC instants so calendars in different timezones compare
+        starts = {_utc(s) for s in starts}
+        common = starts if common is None else common & starts
+    return common
+
+
+def _utc(iso: str) -> str:
+    return datetime.fromisoformat(iso).astimezone(timezone.utc).isoformat()
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calendars", type=int, default=50)
+    ap.add_argument("--per-day", type=int, default=1, help="bookings per calendar per day (of 20 slots)")
+    ap.add_argument("--repeat", type=int, default=10)
+    args = ap.parse_args()
+
+    ids = seed(args.calendars, args.per_day)
+    app = FastAPI()
+    app.include_router(calendar.router)
+    print(f"db={engine.url.render_as_string(hide_password=True)} calendars={len(ids)} per_day={args.per_day} "
+          f"numpy={freebusy.HAS_NUMPY}")
+    body = {"calendar_ids": ids, "start": FIRST_DAY.isoformat(), "days": 7, "duration_minutes": 30,
+            "timezone": "UTC", "limit": 1000}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        lat = []
+        for _ in range(max(1, args.repeat // 5)):
+            t0 = time.perf_counter()
+            common = await per_calendar(client, ids)
+            lat.append(1000 * (time.perf_counter() - t0))
+        print(f"  {len(ids)}x7 /slots calls : p50={pct(lat, 50):9.1f}ms p95={pct(lat, 95):9.1f}ms  common={len(common)}")
+
+        lat = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            r = await client.post("/calendar/freebusy", json=body)
+            lat.append(1000 * (time.perf_counter() - t0))
+        got = {s["start"] for s in r.json()["slots"]}
+        print(f"  one /freebusy call  : p50={pct(lat, 50):9.1f}ms p95={pct(lat, 95):9.1f}ms  slots={len(got)}  "
+              f"same={got == common}")
+
+        if freebusy.HAS_NUMPY:
+            freebusy.HAS_NUMPY = False
+            lat = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                r = await client.post("/calendar/freebusy", json=body)
+                lat.append(1000 * (time.perf_counter() - t0))
+            freebusy.HAS_NUMPY = True
+            print(f"  /freebusy int bitset: p50={pct(lat, 50):9.1f}ms p95={pct(lat, 95):9.1f}ms  "
+                  f"slots={len(r.json()['slots'])}  (fallback without numpy)")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
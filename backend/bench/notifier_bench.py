@@ -0,0 +1,98 @@
+"""
+Email delivery cost: the old notifier.send_email (new SMTP connection + STARTTLS + login per
+message, inside the request) versus one pooled SMTPSession, and what a request pays now
+(an email_outbox insert). Talks to the in-process DebugSMTPServer with a per-reply delay
+standing in for network round trips (no TLS, so the old path is if anything flattered).
+
+    cd backend && python -m bench.notifier_bench --messages 200 --rtt-ms 5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import smtplib
+import tempfile
+import threading
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.db import Base, engine, SessionLocal
+from app import notifier
+from app.notifier import DebugSMTPServer, SMTPSession, build_message
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+def legacy_send(to_email: str, subject: str, body: str) -> None:
+    # The pre-outbox send_email body (minus STARTTLS, which the debug server doesn't offer)
+    with smtplib.SMTP(notifier.SMTP_HOST, notifier.SMTP_PORT) as s:
+        s.send_message(build_message(to_email, subject, body))
+
+
+def report(label: str, lat: list, total_s: float) -> None:
+    print(f"  {label:<26} p50={pct(lat, 50):8.2f}ms p95={pct(lat, 95):8.2f}ms  total={total_s:6.2f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=200)
+    ap.add_argument("--rtt-ms", type=float, default=5.0, help="delay before every SMTP reply")
+    args = ap.parse_args()
+
+    srv = DebugSMTPServer(port=0, echo=False, latency_s=args.rtt_ms / 1000)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(srv.start(), loop).result()
+    notifier.SMTP_HOST, notifier.SMTP_PORT, notifier.SMTP_STARTTLS = "127.0.0.1", srv.port, False
+    Base.metadata.create_all(engine)
+    print(f"db={engine.url.render_as_string(hide_password=True)} messages={args.messages} rtt={args.rtt_ms}ms")
+
+    msgs = [(f"user{i}@example.com", f"Booking {i}", "Your booking is confirmed.\n") for i in range(args.messages)]
+
+    lat, t0, c0 = [], time.perf_counter(), srv.connections
+    for m in msgs:
+        t = time.perf_counter()
+        legacy_send(*m)
+        lat.append(1000 * (time.perf_counter() - t))
+    report("connect per message", lat, time.perf_counter() - t0)
+    print(f"  {'':<26} connections={srv.connections - c0}")
+
+    session, lat, t0, c0 = SMTPSession(), [], time.perf_counter(), srv.connections
+    for m in msgs:
+        t = time.perf_counter()
+        session.send(build_message(*m))
+        lat.append(1000 * (time.perf_counter() - t))
+    session.close()
+    report("pooled session", lat, time.perf_counter() - t0)
+    print(f"  {'':<26} connections={srv.connections - c0}")
+
+    lat, t0 = [], time.perf_counter()
+    for m in msgs:
+        db = SessionLocal()
+        try:
+            t = time.perf_counter()
+            notifier.enqueue(db, *m)
+            db.commit()
+            lat.append(1000 * (time.perf_counter() - t))
+        finally:
+            db.close()
+    report("request path (enqueue)", lat, time.perf_counter() - t0)
+
+    worker, t0, c0, n = notifier.OutboxWorker(), time.perf_counter(), srv.connections, 0
+    while True:
+        k = worker.run_once()
+        n += k
+        if k < notifier.NOTIFIER_BATCH:
+            break
+    worker.smtp.close()
+    print(f"  {'outbox drain':<26} {n} messages in {time.perf_counter() - t0:.2f}s  "
+          f"batches of {notifier.NOTIFIER_BATCH}, connections={srv.connections - c0}  {worker.counts}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
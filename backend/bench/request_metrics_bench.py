@@ -0,0 +1,79 @@
+"""
+Overhead of RequestMetricsMiddleware: the same app served with and without it, for a no-op
+route and a route that runs DB queries (cursor events on every statement).
+
+Runs in-process over ASGI against DATABASE_URL, or a temporary SQLite file by default:
+
+    cd backend && python -m bench.request_metrics_bench --requests 2000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import engine, get_db
+from app.request_metrics import RequestMetricsMiddleware, request_metrics
+
+
+def build(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/noop")
+    async def noop():
+        return {"ok": True}
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int, db: Session = Depends(get_db)):
+        for _ in range(5):
+            db.execute(text("SELECT :i"), {"i": item_id}).scalar()
+        return {"id": item_id}
+
+    if instrumented:
+        app.add_middleware(RequestMetricsMiddleware)
+    return app
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+async def run(app: FastAPI, path: str, n: int) -> list:
+    lat = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for i in range(50):
+            await client.get(path.format(i=i))
+        for i in range(n):
+            t0 = time.perf_counter()
+            await client.get(path.format(i=i))
+            lat.append(1e6 * (time.perf_counter() - t0))
+    return lat
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2000)
+    args = ap.parse_args()
+    print(f"db={engine.url.render_as_string(hide_password=True)} requests={args.requests}")
+    for path in ("/noop", "/items/{i}"):
+        for instrumented in (False, True):
+            lat = await run(build(instrumented), path, args.requests)
+            print(f"  {path:12s} {'with' if instrumented else 'without':7s} middleware: "
+                  f"p50={pct(lat, 50):7.0f}us p99={pct(lat, 99):7.0f}us mean={sum(lat) / len(lat):7.0f}us")
+    for s in request_metrics.snapshot()["series"]:
+        print(f"  {s['method']} {s['route']} {s['status']}: n={s['count']} p50={s['latency_ms']['p50']}ms "
+              f"db p50={s['db_ms']['p50']}ms queries={s['db_queries']}")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
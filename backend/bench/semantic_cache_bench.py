@@ -0,0 +1,72 @@
+"""
+Offline benchmark for the semantic prompt cache.
+
+Replays InteractionLog history in created_at order: each prompt is first looked up
+(per agent), then inserted with its logged response. For every threshold it reports the
+hit rate and an accuracy proxy: a hit counts as correct when the cached answer is close to
+the answer the model actually gave (cosine >= --answer-sim on the same vectorizer).
+
+    cd backend && python -m bench.semantic_cache_bench --thresholds 0.75 0.8 0.85 0.9
+"""
+import argparse
+import time
+
+from app.db import SessionLocal
+from app.models import InteractionLog
+from app.semantic_cache import SemanticCache
+
+
+def load_history(limit: int):
+    db = SessionLocal()
+    try:
+        q = (db.query(InteractionLog.agent_id, InteractionLog.prompt, InteractionLog.response)
+               .order_by(InteractionLog.created_at.asc(), InteractionLog.id.asc()))
+        if limit:
+            q = q.limit(limit)
+        return [(r[0], r[1] or "", r[2] or "") for r in q.all()]
+    finally:
+        db.close()
+
+
+def replay(rows, threshold: float, answer_sim: float):
+    cache = SemanticCache(threshold=threshold, ttl=10 ** 9)
+    emb = cache.embedder
+    hits = correct = 0
+    lookup_s = 0.0
+    for agent_id, prompt, response in rows:
+        t0 = time.perf_counter()
+        hit = cache.lookup(agent_id, None, "bench", prompt)
+        lookup_s += time.perf_counter() - t0
+        if hit is not None:
+            hits += 1
+            if float(emb.embed(hit[0]) @ emb.embed(response)) >= answer_sim:
+                correct += 1
+        cache.add(agent_id, None, "bench", prompt, response)
+    n = max(1, len(rows))
+    return {
+        "threshold": threshold,
+        "rows": len(rows),
+        "hit_rate": hits / n,
+        "accuracy": (correct / hits) if hits else None,
+        "avg_lookup_us": 1e6 * lookup_s / n,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--limit", type=int, default=0)
+    ap.add_argument("--thresholds", type=float, nargs="+", default=[0.75, 0.8, 0.85, 0.9])
+    ap.add_argument("--answer-sim", type=float, default=0.8)
+    args = ap.parse_args()
+
+    rows = load_history(args.limit)
+    print(f"{len(rows)} interactions")
+    print(f"{'threshold':>9} {'hit_rate':>9} {'accuracy':>9} {'lookup_us':>10}")
+    for t in args.thresholds:
+        r = replay(rows, t, args.answer_sim)
+        acc = f"{r['accuracy']:.3f}" if r["accuracy"] is not None else "-"
+        print(f"{t:>9.2f} {r['hit_rate']:>9.3f} {acc:>9} {r['avg_lookup_us']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Worker cold start: fresh interpreters importing app.main, reporting import wall time (the
+framework packages first, timed on their own, then app.main itself), the number of routes on
+the app and how many of them are duplicates of an earlier (path, methods) entry.
+
+    cd backend && python -m bench.startup_bench --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+PROBE = r"""
+import json, time, collections
+t0 = time.perf_counter()
+import fastapi, pydantic, sqlalchemy, sqlalchemy.ext.asyncio, httpx
+t1 = time.perf_counter()
+import app.main as m
+t2 = time.perf_counter()
+keys = [(getattr(r, "path", None), tuple(sorted(getattr(r, "methods", None) or ()))) for r in m.app.routes]
+dupes = sum(n - 1 for n in collections.Counter(keys).values())
+print(json.dumps({"framework_ms": 1000 * (t1 - t0), "import_ms": 1000 * (t2 - t1), "routes": len(keys), "duplicates": dupes}))
+"""
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    env.setdefault("OPENAI_API_KEY", "bench")
+    env["PYTHONDONTWRITEBYTECODE"] = "0"
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    results = []
+    for i in range(args.runs + 1):   # first run warms the bytecode / OS file cache and is dropped
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=here, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            print(out.stderr[-2000:])
+            return 1
+        if i:
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    fw = [r["framework_ms"] for r in results]
+    lat = [r["import_ms"] for r in results]
+    print(f"runs={args.runs}  frameworks: p50={pct(fw, 50):7.1f}ms")
+    print(f"  import app.main: p50={pct(lat, 50):7.1f}ms  min={min(lat):7.1f}ms  max={max(lat):7.1f}ms  (after frameworks)")
+    print(f"routes={results[-1]['routes']}  duplicate routes={results[-1]['duplicates']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
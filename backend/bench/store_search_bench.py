@@ -0,0 +1,106 @@
+"""
+Latency of the /store/search filter over a synthetic catalogue: the old ILIKE '%q%' scan
+versus the full-text path in app.search (FTS5 on SQLite, tsvector/pg_trgm on Postgres).
+
+Seeds DATABASE_URL (or a temporary SQLite file) once; re-runs reuse the rows:
+
+    cd backend && python -m bench.store_search_bench --agents 1000000 --queries 200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from sqlalchemy import select, func, or_, insert
+
+from app.db import Base, engine, SessionLocal
+from app.models import Agent
+from app.search import apply_search, ensure_sqlite_fts
+
+WORDS = ("support billing travel recipe fitness coding tutor legal finance garden music movie "
+         "weather crypto resume interview language translate sales marketing email writer poetry "
+         "history science math chess health nutrition parenting pets career therapy startup").split()
+
+
+def seed(n: int, batch: int = 20000) -> None:
+    Base.metadata.create_all(engine)
+    ensure_sqlite_fts(engine)
+    rnd = random.Random(7)
+    with engine.begin() as conn:
+        have = conn.execute(select(func.count(Agent.id))).scalar() or 0
+        for start in range(have, n, batch):
+            rows = []
+            for i in range(start, min(n, start + batch)):
+                w = rnd.sample(WORDS, 6)
+                rows.append({"name": f"{w[0].title()} {w[1].title()} Bot {i}", "category": w[2],
+                             "description": " ".join(w[2:]) + " assistant", "published": i % 3 != 0, "spec": {}})
+            conn.execute(insert(Agent), rows)
+            print(f"  seeded {min(n, start + batch)}/{n}", end="\r", flush=True)
+    print()
+
+
+def queries(k: int):
+    rnd = random.Random(11)
+    out = []
+    for _ in range(k):
+        w = rnd.choice(WORDS)
+        kind = rnd.random()
+        if kind < 0.4:
+            out.append(w)                                   # whole word
+        elif kind < 0.7:
+            out.append(w[:max(2, len(w) // 2)])             # as-you-type prefix
+        else:
+            out.append(f"{w} {rnd.choice(WORDS)}")          # two terms
+    return out
+
+
+def page(db, q: str, mode: str, size: int = 20):
+    base = select(Agent.id).where(Agent.published == True)
+    if mode == "ilike":
+        like = f"%{q}%"
+        base = base.where(or_(Agent.name.ilike(like), Agent.description.ilike(like))).order_by(Agent.created_at.desc())
+    else:
+        base, score = apply_search(base, q, engine.dialect.name)
+        base = base.order_by(score.desc(), Agent.id.desc()) if score is not None else base
+    total = db.execute(select(func.count()).select_from(base.subquery())).scalar()
+    ids = db.execute(base.limit(size)).scalars().all()
+    return total, ids
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--agents", type=int, default=100000)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--modes", nargs="+", default=["ilike", "fulltext"])
+    args = ap.parse_args()
+
+    seed(args.agents)
+    qs = queries(args.queries)
+    print(f"db={engine.url.render_as_string(hide_password=True)} agents={args.agents} queries={len(qs)}")
+    db = SessionLocal()
+    try:
+        for mode in args.modes:
+            lat, hits = [], 0
+            for q in qs:
+                t0 = time.perf_counter()
+                total, _ = page(db, q, mode)
+                lat.append(1000 * (time.perf_counter() - t0))
+                hits += total or 0
+            print(f"{mode:>9}: p50={pct(lat, 50):8.2f}ms p95={pct(lat, 95):8.2f}ms "
+                  f"max={max(lat):8.2f}ms  avg_matches={hits / len(qs):.0f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+﻿-- Materialized adoption counts for /publisher/summary (maintained by POST /adopt/{bot_id})
+ALTER TABLE public.agents ADD COLUMN IF NOT EXISTS adoption_count integer NOT NULL DEFAULT 0;
+
+-- Backfill from existing lineage (re-runnable)
+-- Every row is set from a LEFT JOIN, so parents whose children are gone drop back to 0
+UPDATE public.agents a
+   SET adoption_count = c.n
+  FROM (SELECT p.id, count(k.id)::integer AS n
+          FROM public.agents p
+          LEFT JOIN public.agents k ON k.parent_id = p.id
+         GROUP BY p.id) c
+ WHERE c.id = a.id
+   AND a.adoption_count <> c.n;
+
+-- Published catalogue walked in id order by the paginated summary
+CREATE INDEX IF NOT EXISTS idx_agents_published_id ON public.agents(published, id);
@@ -0,0 +1,9 @@
+﻿-- Full-text + typo-tolerant search for /store/search (see backend/app/search.py)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Expression must match search.PG_DOCUMENT exactly for the planner to use it
+CREATE INDEX IF NOT EXISTS idx_agents_search_tsv ON public.agents
+  USING gin (to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(description, '')));
+
+-- name % :q (similarity) for misspelled queries
+CREATE INDEX IF NOT EXISTS idx_agents_name_trgm ON public.agents USING gin (name gin_trgm_ops);
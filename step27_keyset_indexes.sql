@@ -0,0 +1,9 @@
+﻿-- Composite indexes backing keyset pagination (backend/app/pagination.py SORTS)
+-- /store/search: published catalogue in each sort order
+CREATE INDEX IF NOT EXISTS idx_agents_pub_created_id ON public.agents(published, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_agents_pub_name_id ON public.agents(published, name, id);
+
+-- /owner/my-bots: owner's agents newest first
+CREATE INDEX IF NOT EXISTS idx_agents_owner_id_id ON public.agents(owner_id, id);
+
+-- /admin/bots walks the primary key (id DESC); no extra index needed
@@ -0,0 +1,2 @@
+﻿-- max(updated_at) is the Last-Modified validator for /publisher/summary and /metrics/stats (app/http_cache.py)
+CREATE INDEX IF NOT EXISTS idx_agents_updated_at ON public.agents(updated_at);
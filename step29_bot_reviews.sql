@@ -0,0 +1,14 @@
+﻿-- Builder review metadata (was /data/bots/<id>/meta.json + safety.txt); import: python -m app.bot_reviews /data
+CREATE TABLE IF NOT EXISTS public.bot_reviews (
+  agent_id        integer PRIMARY KEY REFERENCES public.agents(id) ON DELETE CASCADE,
+  review_status   varchar(16) NOT NULL DEFAULT 'draft',
+  admin_name      varchar(120),
+  auto_name_admin varchar(120),
+  submitted_at    integer,
+  reviewed_at     integer,
+  review_notes    text,
+  safety_score    integer,
+  safety_rating   varchar(16),
+  safety_text     text NOT NULL DEFAULT '',
+  updated_at      timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,18 @@
+﻿-- Admin review queue (backend/app/routes/admin.py): WHERE review_status = ? ORDER BY submitted_at, agent_id
+CREATE INDEX IF NOT EXISTS idx_bot_reviews_queue ON public.bot_reviews(review_status, submitted_at, agent_id);
+
+-- Per-status totals for admin.summary, maintained in the same transaction as each status change
+CREATE TABLE IF NOT EXISTS public.review_counts (
+  status varchar(16) PRIMARY KEY,
+  n      integer NOT NULL DEFAULT 0
+);
+
+-- Backfill / reconcile (re-runnable)
+UPDATE public.review_counts c SET n = 0
+ WHERE NOT EXISTS (SELECT 1 FROM public.bot_reviews r WHERE r.review_status = c.status);
+INSERT INTO public.review_counts(status, n)
+SELECT review_status, count(*) FROM public.bot_reviews GROUP BY review_status
+ON CONFLICT (status) DO UPDATE SET n = EXCLUDED.n;
+INSERT INTO public.review_counts(status, n)
+VALUES ('draft', 0), ('submitted', 0), ('approved', 0), ('rejected', 0)
+ON CONFLICT (status) DO NOTHING;
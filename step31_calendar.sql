@@ -0,0 +1,24 @@
+﻿-- Persistent calendars (backend/app/routes/calendar.py; previously an in-memory dict per worker)
+CREATE TABLE IF NOT EXISTS public.calendars (
+  id              varchar(16) PRIMARY KEY,
+  owner_name      varchar(120),
+  owner_email     varchar(320),
+  timezone        varchar(64) DEFAULT 'America/Los_Angeles',
+  slot_minutes    integer DEFAULT 30,
+  work_start_hour integer DEFAULT 9,
+  work_end_hour   integer DEFAULT 17,
+  created_at      timestamptz NOT NULL DEFAULT now()
+);
+
+-- start_min / end_min: minutes since the Unix epoch (UTC)
+CREATE TABLE IF NOT EXISTS public.calendar_bookings (
+  id          serial PRIMARY KEY,
+  calendar_id varchar(16) NOT NULL REFERENCES public.calendars(id) ON DELETE CASCADE,
+  name        varchar(120),
+  email       varchar(320),
+  start_min   integer NOT NULL,
+  end_min     integer NOT NULL,
+  created_at  timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_calendar_bookings_cal_start ON public.calendar_bookings(calendar_id, start_min);
+CREATE INDEX IF NOT EXISTS idx_calendar_bookings_cal_id ON public.calendar_bookings(calendar_id, id);
@@ -0,0 +1,21 @@
+﻿-- Atomic calendar booking (backend/app/routes/calendar.py): the database rejects double bookings
+-- even when two workers pass the in-process conflict check at the same time.
+
+-- Retries carrying the same Idempotency-Key replay the original booking
+ALTER TABLE public.calendar_bookings ADD COLUMN IF NOT EXISTS idempotency_key varchar(64);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_calendar_bookings_idem ON public.calendar_bookings(calendar_id, idempotency_key);
+
+-- One booking per slot start (replaces the plain range-scan index)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_calendar_bookings_slot ON public.calendar_bookings(calendar_id, start_min);
+DROP INDEX IF EXISTS public.idx_calendar_bookings_cal_start;
+
+-- Any overlap, not just equal starts
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'calendar_bookings_no_overlap') THEN
+    ALTER TABLE public.calendar_bookings
+      ADD CONSTRAINT calendar_bookings_no_overlap
+      EXCLUDE USING gist (calendar_id WITH =, int4range(start_min, end_min) WITH &&);
+  END IF;
+END $$;
@@ -0,0 +1,17 @@
+﻿-- Notification outbox (backend/app/notifier.py): requests queue mail here, the background worker delivers it
+CREATE TABLE IF NOT EXISTS public.email_outbox (
+  id              serial PRIMARY KEY,
+  to_email        varchar(320) NOT NULL,
+  subject         varchar(300) NOT NULL,
+  body            text NOT NULL,
+  status          varchar(16) NOT NULL DEFAULT 'pending',   -- pending | sending | sent | failed
+  attempts        integer NOT NULL DEFAULT 0,
+  next_attempt_at integer NOT NULL,                         -- unix seconds
+  locked_until    integer,
+  claimed_by      varchar(40),
+  last_error      text,
+  sent_at         integer,
+  created_at      timestamptz NOT NULL DEFAULT now()
+);
+-- Worker claim scan: WHERE status = 'pending' AND next_attempt_at <= now ORDER BY id ... FOR UPDATE SKIP LOCKED
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON public.email_outbox(status, next_attempt_at, id);
@@ -0,0 +1,18 @@
+﻿-- Agent totals for metrics.stats / admin.summary (backend/app/agent_counters.py), maintained in
+-- the same transaction as create/publish/adopt and reconciled against agents periodically
+CREATE TABLE IF NOT EXISTS public.agent_counters (
+  name       varchar(32) PRIMARY KEY,
+  n          integer NOT NULL DEFAULT 0,
+  updated_at integer NOT NULL DEFAULT 0
+);
+
+-- Backfill / reconcile (re-runnable)
+INSERT INTO public.agent_counters(name, n, updated_at)
+SELECT v.name, v.n, extract(epoch FROM now())::integer
+  FROM (SELECT 'agents_total' AS name, count(*)::integer AS n FROM public.agents
+        UNION ALL
+        SELECT 'agents_published', count(*) FILTER (WHERE published)::integer FROM public.agents
+        UNION ALL
+        SELECT 'owners', count(DISTINCT owner_id)::integer FROM public.agents) v
+ON CONFLICT (name) DO UPDATE SET n = EXCLUDED.n, updated_at = EXCLUDED.updated_at
+ WHERE public.agent_counters.n <> EXCLUDED.n;
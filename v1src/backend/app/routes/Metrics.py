@@ -3,11 +3,15 @@ import psutil
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 
+# cpu_percent(interval=None) returns usage since the previous call instead of sleeping in the
+# request thread; this first call starts the measurement window.
+psutil.cpu_percent(interval=None)
+
 
 @router.get("/system")
 def system_metrics():
     """Returns basic CPU and memory usage stats."""
     return {
-        "cpu_percent": psutil.cpu_percent(interval=0.5),
+        "cpu_percent": psutil.cpu_percent(interval=None),
         "memory": psutil.virtual_memory()._asdict(),
     }
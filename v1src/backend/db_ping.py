@@ -9,6 +9,22 @@ Fallback if unset: postgresql+psycopg2://postgres:postgres@db:5432/postgres
 
 from __future__ import annotations
 import os
+import threading
+
+# One engine (and pool) per URL for the life of the process, created on first ping
+_engines: dict = {}
+_engines_lock = threading.Lock()
+
+
+def _engine_for(url: str):
+    eng = _engines.get(url)
+    if eng is None:
+        import sqlalchemy
+        with _engines_lock:
+            eng = _engines.get(url)
+            if eng is None:
+                eng = _engines[url] = sqlalchemy.create_engine(url, pool_pre_ping=True, pool_recycle=300)
+    return eng
 
 
 def ping_db():
@@ -18,11 +34,10 @@ def ping_db():
     )
     try:
         # Import lazily so missing deps don't kill app
-        import sqlalchemy
         from sqlalchemy import text
 
         try:
-            engine = sqlalchemy.create_engine(url, pool_pre_ping=True, pool_recycle=300)
+            engine = _engine_for(url)
         except Exception as e:
             return {
                 "db": "error",